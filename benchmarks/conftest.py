@@ -0,0 +1,155 @@
+"""Fixtures of the throughput benchmarks.
+
+The benchmarks run against synthetic DataFrames with points or polygons, text,
+numbers and dates. CARTO's SQL and COPY APIs are replaced by in-process fakes,
+so they measure the time spent by cartoframes encoding and decoding rows, not
+the network. The end-to-end benchmarks of `test_http.py` go through the local
+HTTP APIs of :py:class:`MockCartoServer <cartoframes.mock_server.MockCartoServer>`.
+
+The sizes of the frames are set with the ``CARTOFRAMES_BENCHMARK_ROWS``
+environment variable, a comma-separated list of row counts that defaults to
+``10000``. For example, to also run the benchmarks with 1M rows:
+
+    .. code::
+
+        CARTOFRAMES_BENCHMARK_ROWS=10000,1000000 make benchmark
+
+``make benchmark-baseline`` saves the results as the baseline, and ``make
+benchmark`` fails if a benchmark gets slower than the last saved baseline by
+more than ``BENCHMARK_THRESHOLD`` (``min:50%`` by default).
+"""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cartoframes.columns import Schema
+from cartoframes.context import CartoContext
+from cartoframes.instrumentation import Instrumentation
+
+DEFAULT_ROWS = '10000'
+GEOM_KINDS = ('points', 'polygons', )
+
+
+def get_row_counts():
+    """Row counts of the synthetic frames"""
+    rows = os.environ.get('CARTOFRAMES_BENCHMARK_ROWS', DEFAULT_ROWS)
+    return [int(count) for count in rows.split(',') if count.strip()]
+
+
+def make_geoms(count, kind, seed=0):
+    """`count` random points or small polygons around the world"""
+    from shapely.geometry import Point
+
+    random = np.random.RandomState(seed)
+    points = [Point(lng, lat) for lng, lat in zip(random.uniform(-180, 180, count),
+                                                  random.uniform(-85, 85, count))]
+    if kind == 'points':
+        return points
+    return [point.buffer(0.01, 2) for point in points]
+
+
+def make_frame(count, kind, seed=0):
+    """Synthetic DataFrame with `count` rows of every supported type"""
+    random = np.random.RandomState(seed)
+    return pd.DataFrame({
+        'name': ['place {}'.format(i) for i in range(count)],
+        'category': np.array(['park', 'shop', 'school', None], dtype=object)[random.randint(0, 4, count)],
+        'value': random.normal(size=count),
+        'visits': random.randint(0, 10000, count),
+        'visited': random.rand(count) > 0.5,
+        'visited_at': pd.Timestamp('2019-01-01') + pd.to_timedelta(random.randint(0, 10 ** 8, count), unit='s'),
+        'the_geom': make_geoms(count, kind, seed),
+    })
+
+
+def make_csv(df):
+    """The CSV the COPY API would return for `df`: booleans as ``t`` or
+    ``f`` and geometries as hex EWKB"""
+    from shapely import wkb
+
+    csv = df.copy()
+    csv.index.name = 'cartodb_id'
+    csv['visited'] = np.where(csv['visited'], 't', 'f')
+    csv['the_geom'] = [wkb.dumps(geom, hex=True, srid=4326) for geom in df['the_geom']]
+    return csv.to_csv().encode()
+
+
+SQL_API_FIELDS = {
+    'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+    'name': {'type': 'string', 'pgtype': 'text'},
+    'category': {'type': 'string', 'pgtype': 'text'},
+    'value': {'type': 'number', 'pgtype': 'float8'},
+    'visits': {'type': 'number', 'pgtype': 'int4'},
+    'visited': {'type': 'boolean', 'pgtype': 'bool'},
+    'visited_at': {'type': 'date', 'pgtype': 'timestamptz'},
+    'the_geom': {'type': 'geometry', 'pgtype': 'geometry'},
+}
+
+
+class FakeSQLClient(object):
+    """SQL API answering the column queries of reads"""
+    def send(self, query, **kwargs):
+        return {'fields': SQL_API_FIELDS, 'rows': []}
+
+
+class FakeCopyClient(object):
+    """COPY API that drains uploads and serves `data` to downloads"""
+    def __init__(self, data=b''):
+        self.data = data
+        self.bytes_copied = 0
+
+    def copyfrom(self, query, iterable):
+        for chunk in iterable:
+            self.bytes_copied += len(chunk)
+
+    def copyto_stream(self, query):
+        return io.BytesIO(self.data)
+
+
+class FakeBatchSQLClient(object):
+    def create_and_wait_for_completion(self, query):
+        return {'status': 'done'}
+
+
+def make_context(data=b''):
+    """CartoContext talking to the fake APIs"""
+    cc = CartoContext.__new__(CartoContext)
+    cc.instrumentation = Instrumentation()
+    cc.sql_client = FakeSQLClient()
+    cc.copy_client = FakeCopyClient(data)
+    cc.batch_sql_client = FakeBatchSQLClient()
+    cc.is_org = False
+    cc._bulk_load = None
+    cc._verbose = 0
+    return cc
+
+
+def run(benchmark, function, rows, *args, **kwargs):
+    """Benchmark `function` and record its throughput in rows per second"""
+    result = benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=3, iterations=1, warmup_rounds=0)
+    benchmark.extra_info['rows'] = rows
+    benchmark.extra_info['rows_per_second'] = rows / benchmark.stats.stats.mean
+    return result
+
+
+@pytest.fixture(params=get_row_counts(), ids=lambda count: '{}rows'.format(count))
+def rows(request):
+    return request.param
+
+
+@pytest.fixture(params=GEOM_KINDS)
+def geom_kind(request):
+    return request.param
+
+
+@pytest.fixture
+def frame(rows, geom_kind):
+    return make_frame(rows, geom_kind)
+
+
+@pytest.fixture
+def schema():
+    return Schema.from_sql_api_fields(SQL_API_FIELDS)
@@ -0,0 +1,25 @@
+"""Throughput of writes and reads through the HTTP APIs of the mock CARTO
+server, including the SQL, Batch and COPY requests"""
+import pytest
+
+from cartoframes.mock_server import MockCartoServer
+
+from conftest import run
+
+
+@pytest.fixture
+def server():
+    with MockCartoServer() as server:
+        yield server
+
+
+def test_write(benchmark, server, frame, rows):
+    cc = server.context()
+    run(benchmark, cc.write, rows, frame, 'benchmark', overwrite=True)
+
+
+def test_read(benchmark, server, frame, rows):
+    cc = server.context()
+    cc.write(frame, 'benchmark', overwrite=True)
+    df = run(benchmark, cc.read, rows, 'benchmark', decode_geom=True)
+    assert len(df) == rows
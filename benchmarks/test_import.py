@@ -0,0 +1,26 @@
+"""Time to import cartoframes, in a new interpreter each round"""
+import subprocess
+import sys
+
+import pytest
+
+# Statements timed, from the lightest to the heaviest
+IMPORTS = (
+    'import cartoframes',
+    'from cartoframes import CartoContext',
+    'from cartoframes.contrib import vector',
+)
+
+
+def import_in_subprocess(statement):
+    subprocess.check_call([sys.executable, '-c', statement])
+
+
+@pytest.mark.parametrize('statement', IMPORTS)
+def test_import(benchmark, statement):
+    # the startup of the interpreter is measured separately by `test_python`
+    benchmark.pedantic(import_in_subprocess, args=(statement, ), rounds=5, iterations=1, warmup_rounds=1)
+
+
+def test_python(benchmark):
+    benchmark.pedantic(import_in_subprocess, args=('pass', ), rounds=5, iterations=1, warmup_rounds=1)
@@ -0,0 +1,29 @@
+"""Throughput of the parsing of COPY results into DataFrames"""
+from shapely import wkb
+
+from cartoframes.context import CartoContext
+from cartoframes.datasets import _decode_geom, _decode_geom_column
+
+from conftest import make_context, make_csv, run
+
+
+def test_fetch(benchmark, frame, rows, schema):
+    cc = make_context(make_csv(frame))
+    df = run(benchmark, CartoContext._fetch, rows, cc, 'SELECT * FROM benchmark', schema=schema)
+    assert len(df) == rows
+
+
+def test_fetch_decode_geom(benchmark, frame, rows, schema):
+    cc = make_context(make_csv(frame))
+    df = run(benchmark, CartoContext._fetch, rows, cc, 'SELECT * FROM benchmark', decode_geom=True, schema=schema)
+    assert df['geometry'].iloc[0].geom_type == frame['the_geom'].iloc[0].geom_type
+
+
+def test_decode_geom(benchmark, frame, rows):
+    ewkb = [wkb.dumps(geom, hex=True) for geom in frame['the_geom']]
+    run(benchmark, lambda: [_decode_geom(geom) for geom in ewkb], rows)
+
+
+def test_decode_geom_column(benchmark, frame, rows):
+    ewkb = frame['the_geom'].map(lambda geom: wkb.dumps(geom, hex=True))
+    run(benchmark, _decode_geom_column, rows, ewkb)
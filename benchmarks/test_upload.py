@@ -0,0 +1,26 @@
+"""Throughput of the encoding of DataFrames into COPY rows"""
+from cartoframes.columns import normalize_names
+from cartoframes.datasets import Dataset
+
+from conftest import make_context, run
+
+
+def consume(iterable):
+    for _ in iterable:
+        pass
+
+
+def test_rows(benchmark, frame, rows):
+    dataset = Dataset(make_context(), 'benchmark', df=frame)
+    cols = [col for col in dataset.df.columns if col != 'cartodb_id']
+    run(benchmark, lambda: consume(dataset._rows(dataset.df, cols, None, 'the_geom')), rows)
+
+
+def test_copyfrom(benchmark, frame, rows):
+    dataset = Dataset(make_context(), 'benchmark', df=frame)
+    run(benchmark, dataset._copyfrom, rows)
+
+
+def test_normalize_names(benchmark, rows):
+    names = ['Column {}: {}'.format(i % 100, ('select', 'Área', '2 items')[i % 3]) for i in range(rows)]
+    run(benchmark, normalize_names, rows, names)
@@ -1,6 +1,40 @@
-from .context import CartoContext
-from .credentials import Credentials
-from .layer import BaseMap, QueryLayer, Layer
-from .styling import BinMethod
-from .datasets import Dataset
+import sys
+
 from .__version__ import __version__
+
+# Public names, imported from their modules the first time they are used so
+# that `import cartoframes` (or any of its modules) doesn't pull in pandas,
+# the CARTO SDK and their dependencies until needed
+_LAZY_NAMES = {
+    'CartoContext': 'context',
+    'Credentials': 'credentials',
+    'BaseMap': 'layer',
+    'QueryLayer': 'layer',
+    'Layer': 'layer',
+    'BinMethod': 'styling',
+    'Dataset': 'datasets',
+}
+
+__all__ = sorted(_LAZY_NAMES) + ['__version__']
+
+
+def __getattr__(name):
+    if name not in _LAZY_NAMES:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    from importlib import import_module
+    value = getattr(import_module('.' + _LAZY_NAMES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ (PEP 562) is not supported
+    from .context import CartoContext
+    from .credentials import Credentials
+    from .layer import BaseMap, QueryLayer, Layer
+    from .styling import BinMethod
+    from .datasets import Dataset
@@ -0,0 +1,538 @@
+"""Read query results from CARTO into `pyarrow <https://arrow.apache.org/>`__
+tables. The COPY stream is parsed by Arrow's CSV reader with the column types
+taken from the query schema, and geometries are downloaded as WKB into binary
+columns tagged with the `GeoArrow <https://geoarrow.org/>`__ `geoarrow.wkb`
+extension, so no pandas DataFrame or per-row Python objects are created.
+
+Files (Parquet, Feather, CSV) and Arrow tables are uploaded the other way
+around with :obj:`ArrowSource`, one record batch at a time.
+"""
+from __future__ import absolute_import
+import io
+import json
+import os
+
+import numpy as np
+
+from .columns import Column, Schema
+
+#: Read query results into a pandas DataFrame
+OUTPUT_PANDAS = 'pandas'
+#: Read query results into a pyarrow Table
+OUTPUT_ARROW = 'arrow'
+OUTPUTS = (OUTPUT_PANDAS, OUTPUT_ARROW, )
+
+#: Spill downloads to Parquet files
+SPILL_PARQUET = 'parquet'
+#: Spill downloads to Feather (Arrow IPC) files
+SPILL_FEATHER = 'feather'
+SPILL_EXTENSIONS = {
+    SPILL_PARQUET: ('.parquet', '.pq', ),
+    SPILL_FEATHER: ('.feather', '.arrow', ),
+}
+# bytes of CSV parsed (and written) at a time when spilling to disk
+SPILL_BLOCK_SIZE = 32 * 1024 * 1024
+
+GEOARROW_WKB = 'geoarrow.wkb'
+GEOM_CRS = {
+    'the_geom': 'EPSG:4326',
+    'the_geom_webmercator': 'EPSG:3857',
+}
+
+# PostgreSQL types (as reported in the SQL API `pgtype` field) to pyarrow
+# type factories and their arguments
+PG2ARROW = {
+    'int2': ('int16', ),
+    'int4': ('int32', ),
+    'int8': ('int64', ),
+    'float4': ('float32', ),
+    'float8': ('float64', ),
+    'numeric': ('float64', ),
+    'bool': ('bool_', ),
+    'date': ('date32', ),
+    'timestamp': ('timestamp', 'us'),
+    'timestamptz': ('timestamp', 'us', 'UTC'),
+}
+
+# SQL API types to pyarrow types, for the columns without a known `pgtype`
+SQLAPI2ARROW = {
+    'number': ('float64', ),
+    'boolean': ('bool_', ),
+    'date': ('timestamp', 'us'),
+    'geometry': ('binary', ),
+}
+
+CSV_EXTENSIONS = ('.csv', )
+# rows read at a time from sources to upload
+SOURCE_BATCH_SIZE = 64 * 1024
+# prefix of the geometries uploaded, PostGIS parses it followed by WKT or hex WKB
+SRID_PREFIX = b'SRID=4326;'
+
+# ASCII code of each hexadecimal digit
+HEX_CHARS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+# value of each hexadecimal digit by its ASCII code
+HEX_DIGITS = np.zeros(256, dtype=np.uint8)
+for _digit, _chars in enumerate(zip('0123456789abcdef', '0123456789ABCDEF')):
+    for _char in _chars:
+        HEX_DIGITS[ord(_char)] = _digit
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        raise ImportError('Arrow output requires pyarrow. Install it with '
+                          '`pip install pyarrow`')
+    return pyarrow
+
+
+def is_geometry(column):
+    """Whether `column` of a query schema is a geometry"""
+    return 'geometry' in (column.pgtype, str(column.dbtype))
+
+
+def get_arrow_query(query, schema):
+    """Wrap `query` to select its geometry columns as WKB"""
+    if not any(is_geometry(column) for column in schema):
+        return query
+    columns = ', '.join(
+        'ST_AsBinary("{name}") AS "{name}"'.format(name=column.name) if is_geometry(column)
+        else '"{}"'.format(column.name)
+        for column in schema)
+    return 'SELECT {columns} FROM ({query}) _q'.format(columns=columns, query=query)
+
+
+def get_arrow_schema(schema):
+    """pyarrow schema of the query results with :py:class:`Schema
+    <cartoframes.columns.Schema>` `schema`"""
+    pa = _import_pyarrow()
+    fields = []
+    for column in schema:
+        args = PG2ARROW.get(str(column.dbtype)) or SQLAPI2ARROW.get(column.pgtype, ('string', ))
+        metadata = None
+        if is_geometry(column):
+            crs = GEOM_CRS.get(column.name)
+            metadata = {
+                'ARROW:extension:name': GEOARROW_WKB,
+                'ARROW:extension:metadata': json.dumps({'crs': crs} if crs else {}),
+            }
+            args = ('binary', )
+        fields.append(pa.field(column.name, getattr(pa, args[0])(*args[1:]), metadata=metadata))
+    return pa.schema(fields)
+
+
+def hex_to_binary(array):
+    """Decode an Arrow string array of PostgreSQL `bytea` hex values (with
+    a leading `\\\\x`) into a binary array, operating on the array buffers"""
+    pa = _import_pyarrow()
+    length = len(array)
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int32)[array.offset:array.offset + length + 1]
+    data_buffer = array.buffers()[2]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, np.uint8)
+
+    starts = offsets[:-1].astype(np.int64)
+    sizes = offsets[1:] - starts
+    has_prefix = np.zeros(length, dtype=bool)
+    if len(data):
+        has_prefix = (sizes >= 2) & (data[np.minimum(starts, len(data) - 1)] == ord('\\'))
+    starts = starts + 2 * has_prefix
+    sizes = (sizes - 2 * has_prefix) // 2 * 2
+
+    new_offsets = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(sizes, out=new_offsets[1:])
+    # position in `data` of every hex digit to decode
+    positions = np.arange(new_offsets[-1]) + np.repeat(starts - new_offsets[:-1], sizes)
+    digits = HEX_DIGITS[data[positions]]
+    values = (digits[0::2] << 4) | digits[1::2]
+
+    validity = array.is_valid().buffers()[1] if array.null_count else None
+    return pa.Array.from_buffers(pa.binary(), length,
+                                 [validity,
+                                  pa.py_buffer((new_offsets // 2).astype(np.int32)),
+                                  pa.py_buffer(values.astype(np.uint8))],
+                                 null_count=array.null_count)
+
+
+def binary_to_hex(array, prefix=b''):
+    """Encode an Arrow binary array into a string array of hex values, each
+    one preceded by `prefix`, operating on the array buffers"""
+    pa = _import_pyarrow()
+    if pa.types.is_large_binary(array.type):
+        array = array.cast(pa.binary())
+    length = len(array)
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int32)[array.offset:array.offset + length + 1]
+    data_buffer = array.buffers()[2]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, np.uint8)
+    valid = np.asarray(array.is_valid())
+    prefix = np.frombuffer(prefix, dtype=np.uint8)
+
+    sizes = (offsets[1:] - offsets[:-1]).astype(np.int64)
+    new_sizes = np.where(valid, len(prefix) + 2 * sizes, 0)
+    new_offsets = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(new_sizes, out=new_offsets[1:])
+    chars = np.empty(new_offsets[-1], dtype=np.uint8)
+
+    starts = new_offsets[:-1][valid]
+    chars[(starts[:, None] + np.arange(len(prefix))).ravel()] = np.tile(prefix, len(starts))
+
+    # position in `data` of every byte to encode, and of its first hex digit
+    rows = np.repeat(np.arange(length), sizes)
+    positions = np.arange(offsets[0], offsets[-1])
+    hex_positions = new_offsets[:-1][rows] + len(prefix) + 2 * (positions - offsets[:-1][rows])
+    values = data[positions]
+    chars[hex_positions] = HEX_CHARS[values >> 4]
+    chars[hex_positions + 1] = HEX_CHARS[values & 0x0f]
+
+    validity = array.is_valid().buffers()[1] if array.null_count else None
+    return pa.Array.from_buffers(pa.string(), length,
+                                 [validity,
+                                  pa.py_buffer(new_offsets.astype(np.int32)),
+                                  pa.py_buffer(chars)],
+                                 null_count=array.null_count)
+
+
+def _convert_options(arrow_schema):
+    """CSV conversion options to parse a COPY output into `arrow_schema`"""
+    pa = _import_pyarrow()
+    # geometries are read as hex strings and decoded afterwards
+    column_types = {field.name: pa.string() if pa.types.is_binary(field.type) else field.type
+                    for field in arrow_schema}
+    return pa.csv.ConvertOptions(column_types=column_types,
+                                 true_values=['t'],
+                                 false_values=['f'],
+                                 strings_can_be_null=True)
+
+
+def _decode_batch(batch, arrow_schema):
+    """Record batch with the hex geometries of `batch` decoded"""
+    pa = _import_pyarrow()
+    columns = [hex_to_binary(column) if pa.types.is_binary(field.type) else column
+               for field, column in zip(arrow_schema, batch.columns)]
+    return pa.RecordBatch.from_arrays(columns, schema=arrow_schema)
+
+
+def read_arrow(stream, schema):
+    """Read a CSV COPY `stream` into a pyarrow Table
+
+    Args:
+        stream (file): CSV output of a `COPY ... TO stdout` of a query built
+          with :obj:`get_arrow_query`.
+        schema (:py:class:`Schema <cartoframes.columns.Schema>`): Schema of
+          the query.
+
+    Returns:
+        pyarrow.Table
+    """
+    pa = _import_pyarrow()
+    arrow_schema = get_arrow_schema(schema)
+    table = pa.csv.read_csv(stream, convert_options=_convert_options(arrow_schema))
+    batches = [_decode_batch(batch, arrow_schema) for batch in table.to_batches()]
+    return pa.Table.from_batches(batches, schema=arrow_schema)
+
+
+def get_spill_format(path):
+    """On-disk format of `path` from its extension: :obj:`SPILL_PARQUET` or
+    :obj:`SPILL_FEATHER`"""
+    extension = os.path.splitext(path)[1].lower()
+    for spill_format, extensions in SPILL_EXTENSIONS.items():
+        if extension in extensions:
+            return spill_format
+    raise ValueError('`spill_to` must be a path ending in one of {}'.format(
+        ', '.join(sorted(ext for extensions in SPILL_EXTENSIONS.values() for ext in extensions))))
+
+
+def spill_arrow(stream, schema, path, block_size=SPILL_BLOCK_SIZE):
+    """Stream a CSV COPY `stream` to a Parquet or Feather file, one block of
+    `block_size` bytes of CSV at a time, so the memory used doesn't depend on
+    the size of the results
+
+    Args:
+        stream (file): CSV output of a `COPY ... TO stdout` of a query built
+          with :obj:`get_arrow_query`.
+        schema (:py:class:`Schema <cartoframes.columns.Schema>`): Schema of
+          the query.
+        path (str): File to write, see :obj:`get_spill_format`.
+        block_size (int, optional): Bytes of CSV parsed at a time. Each block
+          is written as a Parquet row group or a Feather record batch.
+
+    Returns:
+        The spilled data, as returned by :obj:`open_spill`.
+    """
+    pa = _import_pyarrow()
+    spill_format = get_spill_format(path)
+    arrow_schema = get_arrow_schema(schema)
+    reader = pa.csv.open_csv(stream,
+                             read_options=pa.csv.ReadOptions(block_size=block_size),
+                             convert_options=_convert_options(arrow_schema))
+
+    if spill_format == SPILL_PARQUET:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, arrow_schema)
+    else:
+        writer = pa.ipc.new_file(path, arrow_schema)
+    try:
+        for batch in reader:
+            batch = _decode_batch(batch, arrow_schema)
+            if spill_format == SPILL_PARQUET:
+                writer.write_table(pa.Table.from_batches([batch], schema=arrow_schema))
+            else:
+                writer.write_batch(batch)
+    finally:
+        writer.close()
+
+    return open_spill(path)
+
+
+def open_spill(path):
+    """Open data spilled to disk by :obj:`spill_arrow` without reading it
+    into memory
+
+    Args:
+        path (str): Parquet or Feather file.
+
+    Returns:
+        A ``pyarrow.Table`` memory-mapped from a Feather file, or a
+        ``pyarrow.dataset.Dataset`` over a Parquet file, that can be scanned
+        in batches, filtered or loaded with ``to_table()``.
+    """
+    pa = _import_pyarrow()
+    if get_spill_format(path) == SPILL_PARQUET:
+        import pyarrow.dataset as ds
+        return ds.dataset(path, format='parquet')
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def arrow2pg(arrow_type):
+    """Returns equivalent PostgreSQL type for the pyarrow type `arrow_type`"""
+    pa = _import_pyarrow()
+    types = pa.types
+    if types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+
+    if types.is_boolean(arrow_type):
+        return 'boolean'
+    if types.is_int8(arrow_type) or types.is_int16(arrow_type) or types.is_uint8(arrow_type):
+        return 'smallint'
+    if types.is_int32(arrow_type) or types.is_uint16(arrow_type):
+        return 'integer'
+    if types.is_int64(arrow_type) or types.is_uint32(arrow_type):
+        return 'bigint'
+    if types.is_integer(arrow_type) or types.is_floating(arrow_type) or types.is_decimal(arrow_type):
+        return 'numeric'
+    if types.is_date(arrow_type):
+        return 'date'
+    if types.is_timestamp(arrow_type):
+        return 'timestamptz' if arrow_type.tz else 'timestamp'
+    return 'text'
+
+
+def _cast_csv_column(column, arrow_type):
+    """Cast the string `column` of a CSV file to `arrow_type`, with empty
+    strings as nulls unless it is a string type"""
+    pa = _import_pyarrow()
+    if pa.types.is_string(arrow_type):
+        return column
+    import pyarrow.compute as pc
+    column = pc.if_else(pc.equal(column, ''), pa.scalar(None, pa.string()), column)
+    if pa.types.is_null(arrow_type):
+        if column.null_count != len(column):
+            raise pa.ArrowInvalid('Values found in a column of nulls')
+        return pa.nulls(len(column))
+    return column.cast(arrow_type)
+
+
+def _fit_csv_type(column, arrow_type):
+    """`arrow_type`, or the narrowest wider type the values of the string
+    `column` of a CSV file can be cast to"""
+    pa = _import_pyarrow()
+    if pa.types.is_null(arrow_type):
+        candidates = [arrow_type, pa.int64(), pa.float64(), pa.date32(), pa.timestamp('s'), pa.bool_()]
+    elif pa.types.is_integer(arrow_type):
+        candidates = [arrow_type, pa.float64()]
+    else:
+        candidates = [arrow_type]
+    for candidate in candidates:
+        try:
+            _cast_csv_column(column, candidate)
+            return candidate
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    return pa.string()
+
+
+class ArrowSource(object):
+    """Data to upload to CARTO read in record batches from a Parquet,
+    Feather or CSV file, or from an Arrow table or dataset, so it never needs
+    to fit in memory.
+
+    The geometry column is `geom_col` if given, or the primary column of
+    `GeoParquet <https://geoparquet.org/>`__ metadata, a column with a GeoArrow
+    extension type, or a column with one of the usual geometry column names.
+    It can hold WKB (binary) or WKT / hex WKB (strings) in EPSG:4326.
+
+    Args:
+        source (str or pyarrow.Table or pyarrow.dataset.Dataset): Path of a
+          ``.parquet``, ``.feather``, ``.arrow`` or ``.csv`` file, or Arrow
+          data.
+        geom_col (str, optional): Name of the geometry column.
+        batch_size (int, optional): Maximum rows read at a time.
+    """
+    def __init__(self, source, geom_col=None, batch_size=SOURCE_BATCH_SIZE):
+        self.source = source
+        self.batch_size = batch_size
+        self.format = self._get_format()
+        self.schema = self._read_schema()
+        self.geom_col = self._get_geom_col(geom_col)
+        self.geom_type = self._get_geom_type()
+        self.column_names = [name for name in self.schema.names
+                             if name != self.geom_col and name not in Column.RESERVED_COLUMN_NAMES]
+
+    def _get_format(self):
+        if hasattr(self.source, 'schema'):
+            # Arrow table or dataset
+            return None
+        self.source = str(self.source)
+        if os.path.splitext(self.source)[1].lower() in CSV_EXTENSIONS:
+            return 'csv'
+        try:
+            return get_spill_format(self.source)
+        except ValueError:
+            raise ValueError('Files to upload must be Parquet, Feather or CSV files')
+
+    def _read_schema(self):
+        """Schema of the source, reading only the file metadata. The types of
+        CSV files are inferred from all their rows, see
+        :obj:`_infer_csv_schema`."""
+        pa = _import_pyarrow()
+        if self.format == SPILL_PARQUET:
+            import pyarrow.parquet as pq
+            return pq.read_schema(self.source)
+        if self.format == SPILL_FEATHER:
+            return pa.ipc.open_file(pa.memory_map(self.source, 'r')).schema
+        if self.format == 'csv':
+            return self._infer_csv_schema()
+        return self.source.schema
+
+    def _open_csv(self):
+        """Reader of the CSV source with all the columns as strings"""
+        pa = _import_pyarrow()
+        names = pa.csv.open_csv(self.source).schema.names
+        return pa.csv.open_csv(self.source, convert_options=pa.csv.ConvertOptions(
+            column_types={name: pa.string() for name in names}))
+
+    def _infer_csv_schema(self):
+        """Schema of the CSV source. The types inferred from its first block
+        are widened (null to any type, integer to float, anything to string)
+        while reading the rest of the file, so the table is created with types
+        that fit all the rows before any of them is uploaded, at the cost of
+        reading the file one more time."""
+        pa = _import_pyarrow()
+        schema = pa.csv.open_csv(self.source).schema
+        types = [field.type for field in schema]
+        for batch in self._open_csv():
+            for i, column in enumerate(batch.columns):
+                types[i] = _fit_csv_type(column, types[i])
+        return pa.schema([pa.field(name, arrow_type) for name, arrow_type in zip(schema.names, types)])
+
+    def _get_geo_metadata(self):
+        """GeoParquet `geo` metadata of the source, if any"""
+        metadata = self.schema.metadata or {}
+        return json.loads(metadata[b'geo'].decode('utf-8')) if b'geo' in metadata else {}
+
+    def _get_geom_col(self, geom_col):
+        names = self.schema.names
+        if geom_col is not None:
+            if geom_col not in names:
+                raise ValueError('Column `{}` not found in the data to upload'.format(geom_col))
+            return geom_col
+
+        primary_column = self._get_geo_metadata().get('primary_column')
+        if primary_column in names:
+            return primary_column
+        for field in self.schema:
+            if (field.metadata or {}).get(b'ARROW:extension:name', b'').startswith(b'geoarrow'):
+                return field.name
+        return next((name for name in names if name.lower() in Column.SUPPORTED_GEOM_COL_NAMES), None)
+
+    def _get_geom_type(self):
+        """Geometry type of the table from the GeoParquet metadata, or the
+        generic `Geometry`"""
+        if self.geom_col is None:
+            return None
+        column = self._get_geo_metadata().get('columns', {}).get(self.geom_col, {})
+        geom_types = column.get('geometry_types', [])
+        if len(geom_types) == 1 and ' ' not in geom_types[0]:
+            return geom_types[0]
+        return 'Geometry'
+
+    def get_table_schema(self, normalized_column_names):
+        """:py:class:`Schema <cartoframes.columns.Schema>` of the table to
+        create, without the geometry
+
+        Args:
+            normalized_column_names (list of tuple): ``(normalized, original)``
+              names of :obj:`column_names`.
+        """
+        return Schema(Column(norm, normalize=False, pgtype=arrow2pg(self.schema.field(orig).type))
+                      for norm, orig in normalized_column_names)
+
+    def get_num_rows(self):
+        """Number of rows of the source, if known without reading it"""
+        pa = _import_pyarrow()
+        if self.format == SPILL_PARQUET:
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(self.source).metadata.num_rows
+        if isinstance(self.source, pa.Table):
+            return self.source.num_rows
+        return None
+
+    def iter_batches(self):
+        """Record batches of the source"""
+        pa = _import_pyarrow()
+        if self.format == SPILL_PARQUET:
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(self.source).iter_batches(batch_size=self.batch_size)
+        if self.format == SPILL_FEATHER:
+            reader = pa.ipc.open_file(pa.memory_map(self.source, 'r'))
+            return (reader.get_batch(i) for i in range(reader.num_record_batches))
+        if self.format == 'csv':
+            return (pa.RecordBatch.from_arrays([_cast_csv_column(column, field.type)
+                                                for column, field in zip(batch.columns, self.schema)],
+                                               schema=self.schema)
+                    for batch in self._open_csv())
+        if isinstance(self.source, pa.Table):
+            return iter(self.source.to_batches(max_chunksize=self.batch_size))
+        return self.source.to_batches(batch_size=self.batch_size)
+
+    def _encode_geoms(self, array):
+        """Geometries as PostGIS text input: hex EWKB or EWKT"""
+        pa = _import_pyarrow()
+        import pyarrow.compute as pc
+        if pa.types.is_binary(array.type) or pa.types.is_large_binary(array.type):
+            return binary_to_hex(array, SRID_PREFIX)
+        array = array.cast(pa.string())
+        # empty strings are null geometries in CSV files
+        array = pc.if_else(pc.equal(array, ''), pa.scalar(None, pa.string()), array)
+        return pc.binary_join_element_wise(SRID_PREFIX.decode(), array, '')
+
+    def iter_csv(self, column_names):
+        """CSV chunks, one per record batch, with `column_names` and the
+        geometry column last (if any), to COPY into the table"""
+        pa = _import_pyarrow()
+        write_options = pa.csv.WriteOptions(include_header=False)
+        for batch in self.iter_batches():
+            columns = []
+            for name in column_names:
+                column = batch.column(batch.schema.get_field_index(name))
+                if arrow2pg(column.type) == 'text' and not pa.types.is_string(column.type):
+                    column = column.cast(pa.string())
+                columns.append(column)
+            names = list(column_names)
+            if self.geom_col is not None:
+                columns.append(self._encode_geoms(batch.column(batch.schema.get_field_index(self.geom_col))))
+                names.append(self.geom_col)
+
+            sink = io.BytesIO()
+            pa.csv.write_csv(pa.RecordBatch.from_arrays(columns, names=names), sink, write_options=write_options)
+            yield sink.getvalue()
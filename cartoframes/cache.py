@@ -0,0 +1,162 @@
+"""Local on-disk cache for static map images requested from the CARTO Static
+Maps API. See :py:meth:`CartoContext.map
+<cartoframes.context.CartoContext.map>`'s `cache` keyword argument.
+"""
+import hashlib
+import json
+import os
+import time
+
+from appdirs import user_cache_dir
+
+# Default location of the static map images
+STATIC_MAPS_CACHE_DIR = os.path.join(user_cache_dir('cartoframes'),
+                                     'static_maps')
+
+
+class StaticMapCache(object):
+    """Cache of static map images, keyed by a hash of the named map, its
+    configuration, the map view and the image size.
+
+    Entries expire after `ttl` seconds, and the least recently used images are
+    evicted when the cache grows over `max_size` bytes. If `check_freshness`
+    is set, each image is also stored along with a fingerprint of the last
+    update of the tables the map layers read from, so images are only reused
+    while the underlying data hasn't changed.
+
+    Example:
+
+        .. code:: python
+
+            from cartoframes import CartoContext, Layer
+            from cartoframes.cache import StaticMapCache
+            cc = CartoContext(BASEURL, APIKEY)
+            cache = StaticMapCache(ttl=24 * 3600)
+            # only the first call requests an image to the Static Maps API
+            cc.map(Layer('acadia_biodiversity'), interactive=False,
+                   cache=cache)
+            cc.map(Layer('acadia_biodiversity'), interactive=False,
+                   cache=cache)
+
+    Args:
+        directory (str, optional): Directory where images are stored. Defaults
+          to a `static_maps` directory in the cartoframes user cache directory.
+        ttl (int, optional): Seconds an image is valid for. Defaults to one
+          hour. If ``None``, images do not expire.
+        max_size (int, optional): Maximum size in bytes of all the images in
+          the cache. Defaults to 50 MB.
+        check_freshness (bool, optional): Whether to invalidate images when
+          the tables used by the map are updated. Defaults to ``True``.
+    """
+    def __init__(self, directory=None, ttl=3600, max_size=50 * 1024 * 1024,
+                 check_freshness=True):
+        self.directory = directory or STATIC_MAPS_CACHE_DIR
+        self.ttl = ttl
+        self.max_size = max_size
+        self.check_freshness = check_freshness
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def get_key(map_name, config, view, size):
+        """Key of a static map in the cache
+
+        Args:
+            map_name (str): Name of the named map.
+            config (str): JSON configuration of the map.
+            view (dict): Either `zoom`, `lat` and `lon`, or `bbox`.
+            size (tuple): ``(width, height)`` of the image.
+
+        Returns:
+            str: Hash of the arguments.
+        """
+        key = json.dumps([map_name, config, view, list(size)],
+                         sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        """Paths of the image and metadata files of `key`"""
+        path = os.path.join(self.directory, key)
+        return path + '.png', path + '.json'
+
+    def get(self, key, fingerprint=None):
+        """Get a cached image
+
+        Args:
+            key (str): Key from :obj:`get_key`.
+            fingerprint (str, optional): Current fingerprint of the map data.
+              If it doesn't match the stored one, the image is discarded.
+
+        Returns:
+            bytes: The PNG image, or ``None`` if it is not in the cache, has
+            expired or is stale.
+        """
+        image_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+            with open(image_path, 'rb') as image_file:
+                data = image_file.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        expired = (self.ttl is not None and
+                   time.time() - meta['created'] > self.ttl)
+        stale = (fingerprint is not None and
+                 meta.get('fingerprint') != fingerprint)
+        if expired or stale:
+            self.delete(key)
+            return None
+
+        # mark as recently used for the eviction
+        os.utime(image_path, None)
+        return data
+
+    def set(self, key, data, fingerprint=None):
+        """Store an image in the cache
+
+        Args:
+            key (str): Key from :obj:`get_key`.
+            data (bytes): PNG image.
+            fingerprint (str, optional): Fingerprint of the map data.
+        """
+        image_path, meta_path = self._paths(key)
+        with open(image_path, 'wb') as image_file:
+            image_file.write(data)
+        with open(meta_path, 'w') as meta_file:
+            json.dump({'created': time.time(),
+                       'fingerprint': fingerprint}, meta_file)
+        self._evict()
+
+    def delete(self, key):
+        """Remove an image from the cache"""
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove all the images from the cache"""
+        for key in self._keys():
+            self.delete(key)
+
+    def _keys(self):
+        """Keys of the images in the cache"""
+        return [filename[:-len('.png')]
+                for filename in os.listdir(self.directory)
+                if filename.endswith('.png')]
+
+    def _evict(self):
+        """Remove the least recently used images until the cache fits in
+        `max_size`"""
+        entries = []
+        for key in self._keys():
+            stat = os.stat(self._paths(key)[0])
+            entries.append((stat.st_mtime, stat.st_size, key))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.delete(key)
+            total_size -= size
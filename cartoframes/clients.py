@@ -0,0 +1,139 @@
+"""Clients of the CARTO APIs recording their requests, queries, jobs and
+COPY uploads as :py:mod:`instrumentation <cartoframes.instrumentation>`
+spans. Kept apart from the spans and hooks so these can be used without
+importing the CARTO SDK."""
+import time
+
+from carto.auth import APIKeyAuthClient
+from carto.exceptions import CartoRateLimitException
+from carto.sql import BatchSQLClient, CopySQLClient, SQLClient
+
+from .instrumentation import SPAN_BATCH_JOB, SPAN_COPYFROM, SPAN_HTTP, SPAN_SQL
+
+# APIs of the HTTP spans, by path prefix. The first matching one is used.
+API_PATHS = (
+    ('api/v2/sql/copyfrom', 'copyfrom'),
+    ('api/v2/sql/copyto', 'copyto'),
+    ('api/v2/sql/job', 'batch'),
+    ('api/v2/sql', 'sql'),
+    ('api/v1/map', 'maps'),
+    ('api/v1/viz', 'datasets'),
+    ('api/v1/imports', 'import'),
+    ('api/v3/api_keys', 'auth'),
+)
+
+
+def _count_sent(iterable, span, timed=False, instrumentation=None):
+    """Yield the chunks of `iterable` adding their size to the
+    ``bytes_sent`` of `span`, and with `timed` the time spent producing them
+    to its ``encode_time``. The hooks of `instrumentation` are notified of
+    the progress."""
+    iterator = iter(iterable)
+    while True:
+        start = time.time()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            if timed:
+                span.add('encode_time', time.time() - start)
+        span.add('bytes_sent', len(chunk))
+        if instrumentation is not None:
+            instrumentation.progress(span, chunk)
+        yield chunk
+
+
+def _get_api(relative_path):
+    for prefix, api in API_PATHS:
+        if relative_path.startswith(prefix):
+            return api
+    return 'other'
+
+
+def _size(data):
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    return len(str(data))
+
+
+class InstrumentedAuthClient(APIKeyAuthClient):
+    """API key auth client recording every HTTP request as a span"""
+    def __init__(self, instrumentation, *args, **kwargs):
+        self.instrumentation = instrumentation
+        super(InstrumentedAuthClient, self).__init__(*args, **kwargs)
+
+    def send(self, relative_path, http_method, **requests_args):
+        with self.instrumentation.span(SPAN_HTTP, api=_get_api(relative_path), method=http_method.upper(),
+                                       path=relative_path) as span:
+            data = requests_args.get('data')
+            if data is not None and not isinstance(data, (bytes, str, dict)):
+                # streamed body, like COPY FROM chunks
+                requests_args['data'] = _count_sent(data, span)
+            else:
+                span.add('bytes_sent', _size(data) + _size(requests_args.get('json')) +
+                         _size(requests_args.get('params')))
+            try:
+                response = super(InstrumentedAuthClient, self).send(relative_path, http_method, **requests_args)
+            except CartoRateLimitException as err:
+                span.set('status', 429)
+                span.set('retry_after', err.retry_after)
+                raise
+            span.set('status', response.status_code)
+            if requests_args.get('stream'):
+                span.add('bytes_received', int(response.headers.get('Content-Length') or 0))
+            else:
+                span.add('bytes_received', len(response.content))
+            return response
+
+
+class InstrumentedSQLClient(SQLClient):
+    """SQL API client recording every query as a span"""
+    def __init__(self, auth_client, instrumentation, **kwargs):
+        self.instrumentation = instrumentation
+        super(InstrumentedSQLClient, self).__init__(auth_client, **kwargs)
+
+    def send(self, sql, *args, **kwargs):
+        with self.instrumentation.span(SPAN_SQL, query=sql) as span:
+            result = super(InstrumentedSQLClient, self).send(sql, *args, **kwargs)
+            if isinstance(result, dict) and 'rows' in result:
+                span.set('rows', len(result['rows']))
+            return result
+
+
+class InstrumentedBatchSQLClient(BatchSQLClient):
+    """Batch SQL API client recording every job, including the wait for its
+    completion, as a span"""
+    def __init__(self, client, instrumentation, **kwargs):
+        self.instrumentation = instrumentation
+        super(InstrumentedBatchSQLClient, self).__init__(client, **kwargs)
+
+    def create_and_wait_for_completion(self, sql_query):
+        with self.instrumentation.span(SPAN_BATCH_JOB, query=sql_query) as span:
+            job = super(InstrumentedBatchSQLClient, self).create_and_wait_for_completion(sql_query)
+            span.set('job_id', job.get('job_id'))
+            span.set('status', job.get('status'))
+            return job
+
+
+class InstrumentedCopySQLClient(CopySQLClient):
+    """COPY API client recording every upload as a span, with the bytes and
+    rows sent, the time spent encoding them (``encode_time``) and the time
+    the server took to copy them (``server_time``). The rows expected are
+    the ``total_rows`` attribute of the data, if it has one."""
+    def __init__(self, client, instrumentation, **kwargs):
+        self.instrumentation = instrumentation
+        super(InstrumentedCopySQLClient, self).__init__(client, **kwargs)
+
+    def copyfrom(self, query, iterable_data, *args, **kwargs):
+        with self.instrumentation.span(SPAN_COPYFROM, query=query, bytes_sent=0, encode_time=0,
+                                       total_rows=getattr(iterable_data, 'total_rows', None)) as span:
+            result = super(InstrumentedCopySQLClient, self).copyfrom(
+                query, _count_sent(iterable_data, span, timed=True, instrumentation=self.instrumentation),
+                *args, **kwargs)
+            if isinstance(result, dict):
+                span.set('rows', result.get('total_rows'))
+                span.set('server_time', result.get('time'))
+            return result
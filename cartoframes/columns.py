@@ -5,6 +5,21 @@ import sys
 
 from unidecode import unidecode
 
+try:
+    from functools import lru_cache
+except ImportError:
+    # Python 2: no memoization of slugified names
+    def lru_cache(maxsize=None):
+        return lambda func: func
+
+# Precompiled patterns used to slugify column names
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+HTML_ENTITY_RE = re.compile(r'&.+?;')
+UNSUPPORTED_CHARS_RE = re.compile(r'[^a-z0-9 _-]')
+WHITESPACE_RE = re.compile(r'\s+')
+DASHES_RE = re.compile(r'-+')
+SUPPORTED_NAME_RE = re.compile(r'^[a-z_]+[a-z_0-9]*$')
+
 
 class Column(object):
     DATETIME_DTYPES = ['datetime64[D]', 'datetime64[ns]', 'datetime64[ns, UTC]']
@@ -26,18 +41,29 @@ class Column(object):
 
     @staticmethod
     def from_sql_api_fields(sql_api_fields):
-        return [Column(column, normalize=False, pgtype=sql_api_fields[column]['type']) for column in sql_api_fields]
+        return [Column(column, normalize=False, pgtype=sql_api_fields[column]['type'],
+                       dbtype=sql_api_fields[column].get('pgtype'))
+                for column in sql_api_fields]
 
-    def __init__(self, name, normalize=True, pgtype=None):
+    def __init__(self, name, normalize=True, pgtype=None, dbtype=None):
+        """`pgtype` is a PostgreSQL or SQL API type (like `number`), `dbtype` the
+        PostgreSQL type behind a SQL API type (like `int4`) when it is known"""
         if not name:
             raise ValueError('Column name cannot be null or empty')
 
         self.name = str(name)
         self.pgtype = pgtype
+        self.dbtype = dbtype or pgtype
         self.dtype = pg2dtypes(pgtype)
+        self.compact_dtype = COMPACT_PG2DTYPES.get(str(self.dbtype),
+                                                   COMPACT_PG2DTYPES.get(str(pgtype), self.dtype))
         if normalize:
             self.normalize()
 
+    @property
+    def is_text(self):
+        return str(self.dbtype) in TEXT_PGTYPES
+
     def normalize(self, forbidden_column_names=None):
         self._sanitize()
         self.name = self._truncate()
@@ -51,37 +77,65 @@ class Column(object):
         return self
 
     def _sanitize(self):
-        self.name = self._slugify(self.name)
-
-        if self._is_reserved() or self._is_unsupported():
-            self.name = '_{}'.format(self.name)
+        self.name = _sanitize(self.name)
 
     def _is_reserved(self):
-        return self.name.upper() in Column.RESERVED_WORDS
+        return _is_reserved(self.name)
 
     def _is_unsupported(self):
-        return not re.match(r'^[a-z_]+[a-z_0-9]*$', self.name)
+        return _is_unsupported(self.name)
 
     def _truncate(self, length=MAX_LENGTH):
         return self.name[:length]
 
     def _slugify(self, value):
-        value = str(value).lower()
+        return _slugify(str(value))
+
+
+RESERVED_WORDS = frozenset(Column.RESERVED_WORDS)
+
+
+@lru_cache(maxsize=8192)
+def _slugify(value):
+    value = value.lower()
+
+    if sys.version_info[0] < 3:
+        value = unidecode(value.decode('utf-8'))
+    else:
+        value = unidecode(value)
+
+    value = HTML_TAG_RE.sub('', value)
+    value = HTML_ENTITY_RE.sub('-', value)
+    value = UNSUPPORTED_CHARS_RE.sub('-', value).strip().lower()
+    value = WHITESPACE_RE.sub('-', value)
+    value = value.replace(' ', '-')
+    value = DASHES_RE.sub('-', value)
+    value = value.replace('-', '_')
+
+    return value
+
+
+def _is_reserved(name):
+    return name.upper() in RESERVED_WORDS
 
-        if sys.version_info[0] < 3:
-            value = unidecode(value.decode('utf-8'))
-        else:
-            value = unidecode(value)
 
-        value = re.sub(r'<[^>]+>', '', value)
-        value = re.sub(r'&.+?;', '-', value)
-        value = re.sub(r'[^a-z0-9 _-]', '-', value).strip().lower()
-        value = re.sub(r'\s+', '-', value)
-        value = re.sub(r' ', '-', value)
-        value = re.sub(r'-+', '-', value)
-        value = re.sub(r'-', '_', value)
+def _is_unsupported(name):
+    return not SUPPORTED_NAME_RE.match(name)
 
-        return value
+
+def _sanitize(name):
+    name = _slugify(name)
+
+    if _is_reserved(name) or _is_unsupported(name):
+        name = '_{}'.format(name)
+
+    return name
+
+
+@lru_cache(maxsize=8192)
+def _normalize(name):
+    """Sanitized and truncated column name, as in `Column(name).normalize()`"""
+    return _sanitize(name)[:Column.MAX_LENGTH]
 
 
 def normalize_names(column_names):
@@ -114,9 +168,27 @@ def normalize_names(column_names):
             list: List of SQL-normalized column names
     """
     result = []
+    taken = set()
+    # last collision suffix tried for each name, so repeated names don't
+    # rescan the `_1`, `_2`, ... candidates already taken
+    collisions = {}
     for column_name in column_names:
-        column = Column(column_name).normalize(forbidden_column_names=result)
-        result.append(column.name)
+        if not column_name:
+            raise ValueError('Column name cannot be null or empty')
+
+        # `Column(name)` normalizes the name once, and `.normalize()` again
+        name = _normalize(_normalize(str(column_name)))
+
+        if name in taken:
+            i, candidate = collisions.get(name, (0, name))
+            while candidate in taken:
+                i += 1
+                candidate = '{}_{}'.format(candidate[:Column.MAX_COLLISION_LENGTH], i)
+            collisions[name] = (i, candidate)
+            name = candidate
+
+        taken.add(name)
+        result.append(name)
 
     return result
 
@@ -126,34 +198,192 @@ def normalize_name(column_name):
 
 
 def dtypes(columns, exclude_dates=False, exclude_the_geom=False):
-    return {x.name: x.dtype if not x.name == 'cartodb_id' else 'int64'
-            for x in columns if not (exclude_dates is True and x.dtype in Column.DATETIME_DTYPES)
-            and not(exclude_the_geom is True and x.name in Column.SUPPORTED_GEOM_COL_NAMES)}
+    return Schema.from_columns(columns).get_dtypes(exclude_dates=exclude_dates,
+                                                   exclude_the_geom=exclude_the_geom)
 
 
 def date_columns_names(columns):
-    return [x.name for x in columns if x.dtype in Column.DATETIME_DTYPES]
+    return list(Schema.from_columns(columns).date_columns)
+
+
+# PostgreSQL (and SQL API) types to pandas dtypes
+PG2DTYPES = {
+    'bigint': 'float64',
+    'boolean': 'bool',
+    'date': 'datetime64[D]',
+    'double precision': 'float64',
+    'geometry': 'object',
+    'int': 'int64',
+    'integer': 'float64',
+    'number': 'float64',
+    'numeric': 'float64',
+    'real': 'float64',
+    'smallint': 'float64',
+    'string': 'object',
+    'timestamp': 'datetime64[ns]',
+    'timestampz': 'datetime64[ns]',
+    'timestamp with time zone': 'datetime64[ns]',
+    'timestamp without time zone': 'datetime64[ns]',
+    'USER-DEFINED': 'object',
+}
+
+# PostgreSQL (and SQL API) types with a smaller pandas dtype than the default
+# one, used with the `compact` dtype backend. Integers and booleans use pandas
+# nullable dtypes since columns can have nulls.
+COMPACT_PG2DTYPES = {
+    'smallint': 'Int16',
+    'int2': 'Int16',
+    'integer': 'Int32',
+    'int4': 'Int32',
+    'bigint': 'Int64',
+    'int8': 'Int64',
+    'real': 'float32',
+    'float4': 'float32',
+    'boolean': 'boolean',
+    'bool': 'boolean',
+}
+
+TEXT_PGTYPES = ('string', 'text', 'character varying', 'varchar', 'character', 'char', 'bpchar', )
+
+#: Default dtypes: integers are read as floats, text as objects
+DTYPE_BACKEND_NUMPY = 'numpy'
+#: Memory efficient dtypes: nullable integers and booleans, `float32` for
+#: `real` columns, and `category` for text columns with few distinct values
+DTYPE_BACKEND_COMPACT = 'compact'
+DTYPE_BACKENDS = (DTYPE_BACKEND_NUMPY, DTYPE_BACKEND_COMPACT, )
+
+# pandas dtypes to PostgreSQL types
+DTYPES2PG = {
+    'float64': 'numeric',
+    'float32': 'numeric',
+    'int64': 'bigint',
+    'int32': 'integer',
+    'int16': 'smallint',
+    'int8': 'smallint',
+    'object': 'text',
+    'bool': 'boolean',
+    'datetime64[ns]': 'timestamp',
+    'datetime64[ns, UTC]': 'timestamp',
+}
 
 
 def pg2dtypes(pgtype):
     """Returns equivalent dtype for input `pgtype`."""
-    mapping = {
-        'bigint': 'float64',
-        'boolean': 'bool',
-        'date': 'datetime64[D]',
-        'double precision': 'float64',
-        'geometry': 'object',
-        'int': 'int64',
-        'integer': 'float64',
-        'number': 'float64',
-        'numeric': 'float64',
-        'real': 'float64',
-        'smallint': 'float64',
-        'string': 'object',
-        'timestamp': 'datetime64[ns]',
-        'timestampz': 'datetime64[ns]',
-        'timestamp with time zone': 'datetime64[ns]',
-        'timestamp without time zone': 'datetime64[ns]',
-        'USER-DEFINED': 'object',
-    }
-    return mapping.get(str(pgtype), 'object')
+    return PG2DTYPES.get(str(pgtype), 'object')
+
+
+def dtypes2pg(dtype):
+    """Returns equivalent PostgreSQL type for input `dtype`"""
+    return DTYPES2PG.get(str(dtype), 'text')
+
+
+class Schema(object):
+    """Immutable, ordered set of the columns of a query, table or dataframe,
+    with the lookups needed to read or write them computed once.
+
+    Args:
+        columns (list of :obj:`Column`): Columns in order.
+    """
+    __slots__ = ('columns', 'names', '_by_name', '_by_pgtype', '_dtypes', '_compact_dtypes',
+                 'date_columns', 'geom_columns', 'text_columns', )
+
+    def __init__(self, columns):
+        columns = tuple(columns)
+        by_pgtype = {}
+        for column in columns:
+            by_pgtype.setdefault(column.pgtype, []).append(column.name)
+
+        def init(attr, value):
+            object.__setattr__(self, attr, value)
+
+        init('columns', columns)
+        init('names', tuple(column.name for column in columns))
+        init('_by_name', {column.name: column for column in columns})
+        init('_by_pgtype', {pgtype: tuple(names) for pgtype, names in by_pgtype.items()})
+        init('_dtypes', tuple((column.name, column.dtype if column.name != 'cartodb_id' else 'int64')
+                              for column in columns))
+        init('_compact_dtypes', tuple((column.name, column.compact_dtype if column.name != 'cartodb_id' else 'int64')
+                                      for column in columns))
+        init('date_columns', tuple(column.name for column in columns if column.dtype in Column.DATETIME_DTYPES))
+        init('geom_columns', tuple(column.name for column in columns
+                                   if column.name in Column.SUPPORTED_GEOM_COL_NAMES))
+        init('text_columns', tuple(column.name for column in columns
+                                   if column.is_text and column.name not in Column.SUPPORTED_GEOM_COL_NAMES))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('Schema objects are immutable')
+
+    @staticmethod
+    def from_columns(columns):
+        """Schema from a list of columns, or the same schema if `columns` is already one"""
+        return columns if isinstance(columns, Schema) else Schema(columns)
+
+    @staticmethod
+    def from_sql_api_fields(sql_api_fields):
+        """Schema from the `fields` of a SQL API response"""
+        return Schema(Column.from_sql_api_fields(sql_api_fields))
+
+    @staticmethod
+    def from_dataframe(df, normalized_column_names):
+        """Schema of the CARTO table for a dataframe
+
+        Args:
+            df (pandas.DataFrame): Dataframe to upload.
+            normalized_column_names (list of tuple): ``(normalized, original)`` column names.
+        """
+        return Schema(Column(norm, normalize=False, pgtype=dtypes2pg(df.dtypes[orig]))
+                      for norm, orig in normalized_column_names)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def __repr__(self):
+        return 'Schema({})'.format(', '.join('{} {}'.format(column.name, column.pgtype)
+                                             for column in self.columns))
+
+    @property
+    def pgtypes(self):
+        return tuple(column.pgtype for column in self.columns)
+
+    def select(self, names):
+        """New schema with the columns in `names`, in that order"""
+        return Schema(self._by_name[name] for name in names)
+
+    def names_by_pgtype(self, pgtype):
+        """Names of the columns of PostgreSQL type `pgtype`"""
+        return self._by_pgtype.get(pgtype, ())
+
+    def get_dtypes(self, exclude_dates=False, exclude_the_geom=False,
+                   dtype_backend=DTYPE_BACKEND_NUMPY, category_columns=()):
+        """pandas dtypes by column name, `cartodb_id` is always an integer
+
+        Args:
+            exclude_dates (bool, optional): Leave out date columns.
+            exclude_the_geom (bool, optional): Leave out geometry columns.
+            dtype_backend (str, optional): One of :obj:`DTYPE_BACKENDS`.
+            category_columns (list, optional): Columns read as `category` with
+              the `compact` backend.
+        """
+        if dtype_backend not in DTYPE_BACKENDS:
+            raise ValueError('dtype_backend must be one of {}'.format(', '.join(DTYPE_BACKENDS)))
+
+        compact = dtype_backend == DTYPE_BACKEND_COMPACT
+        return {name: 'category' if compact and name in category_columns else dtype
+                for name, dtype in (self._compact_dtypes if compact else self._dtypes)
+                if not (exclude_dates is True and dtype in Column.DATETIME_DTYPES) and
+                not (exclude_the_geom is True and name in Column.SUPPORTED_GEOM_COL_NAMES)}
+
+    def get_converters(self, geom_decoder=None):
+        """`pandas.read_csv` converters: `the_geom` is decoded with `geom_decoder`, or kept as is"""
+        if 'the_geom' not in self:
+            return {}
+        return {'the_geom': geom_decoder or (lambda value: value)}
@@ -6,17 +6,19 @@ import json
 import os
 import random
 import sys
-import collections
 from warnings import warn
 
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+
 import requests
-from IPython.display import HTML, Image
 import pandas as pd
 from tqdm import tqdm
 from appdirs import user_cache_dir
 
-from carto.auth import APIKeyAuthClient, AuthAPIClient
-from carto.sql import SQLClient, BatchSQLClient, CopySQLClient
+from carto.auth import AuthAPIClient
 from carto.exceptions import CartoException
 from carto.datasets import DatasetManager
 from pyrestcli.exceptions import NotFoundException
@@ -24,13 +26,21 @@ from pyrestcli.exceptions import NotFoundException
 from .credentials import Credentials
 from .dataobs import get_countrytag
 from . import utils
+from . import arrow, render
+from .profiler import Profiler
+from .progress import ProgressHook
+from .display import get_renderer
+from .clients import (InstrumentedAuthClient, InstrumentedSQLClient, InstrumentedBatchSQLClient,
+                      InstrumentedCopySQLClient)
+from .instrumentation import Instrumentation, SPAN_COPYTO, SPAN_DECODE, traced
 from .layer import BaseMap, AbstractLayer
 from .maps import (non_basemap_layers, get_map_name,
                    get_map_template, top_basemap_layer_url)
 from .analysis import Table
 from .__version__ import __version__
-from .columns import dtypes, date_columns_names
-from .datasets import Dataset, recursive_read, _decode_geom, get_columns
+from .datasets import (Dataset, BulkLoad, recursive_read, get_columns, get_category_columns, to_geodataframe,
+                       GEOM_DECODERS, GEOM_FORMAT_WKB)
+from .columns import DTYPE_BACKEND_NUMPY, DTYPE_BACKEND_COMPACT
 
 if sys.version_info >= (3, 0):
     from urllib.parse import urlparse, urlencode
@@ -38,14 +48,12 @@ else:
     from urlparse import urlparse
     from urllib import urlencode
 try:
-    import matplotlib.image as mpi
-    import matplotlib.pyplot as plt
-    # set dpi based on CARTO Static Maps API dpi
-    mpi.rcParams['figure.dpi'] = 72.0
-except (ImportError, RuntimeError):
-    mpi = None
-    plt = None
-HAS_MATPLOTLIB = plt is not None
+    from importlib.util import find_spec
+except ImportError:
+    from pkgutil import find_loader as find_spec
+
+# matplotlib is only imported to draw the first static map
+HAS_MATPLOTLIB = find_spec('matplotlib') is not None
 
 # Choose constant to avoid overview generation which are triggered at a
 # half million rows
@@ -118,6 +126,15 @@ class CartoContext(object):
             for more information.
         verbose (bool, optional): Output underlying process states (True), or
             suppress (False, default)
+        hooks (list, optional): Instrumentation hooks receiving the timing,
+            bytes and rows of every operation, see :obj:`add_hook`.
+        profile (bool, optional): Print a breakdown of where the time of
+            each operation goes when it ends, and keep them in the
+            `profiler` attribute. See :obj:`profile`.
+        progress (bool or function, optional): Show progress bars with the
+            rows, throughput and time left of COPY uploads and downloads
+            (True), or call the function with their :py:class:`Progress
+            <cartoframes.progress.Progress>` instead, at most twice a second.
 
     Returns:
         :py:class:`CartoContext <cartoframes.context.CartoContext>`: A
@@ -166,10 +183,14 @@ class CartoContext(object):
 
     """
     def __init__(self, base_url=None, api_key=None, creds=None, session=None,
-                 verbose=0):
+                 verbose=0, hooks=None, profile=False, progress=False):
 
+        self.instrumentation = Instrumentation()
+        for hook in hooks or ():
+            self.instrumentation.add_hook(hook)
         self.creds = Credentials(creds=creds, key=api_key, base_url=base_url)
-        self.auth_client = APIKeyAuthClient(
+        self.auth_client = InstrumentedAuthClient(
+            self.instrumentation,
             base_url=self.creds.base_url(),
             api_key=self.creds.key(),
             session=session,
@@ -181,16 +202,81 @@ class CartoContext(object):
             api_key=self.creds.key(),
             session=session
         )
-        self.sql_client = SQLClient(self.auth_client)
-        self.copy_client = CopySQLClient(self.auth_client)
-        self.batch_sql_client = BatchSQLClient(self.auth_client)
+        self.sql_client = InstrumentedSQLClient(self.auth_client, self.instrumentation)
+        self.copy_client = InstrumentedCopySQLClient(self.auth_client, self.instrumentation)
+        self.batch_sql_client = InstrumentedBatchSQLClient(self.auth_client, self.instrumentation)
         self.creds.username(self.auth_client.username)
         self._is_authenticated()
         self.is_org = self._is_org_user()
 
         self._map_templates = {}
         self._srcdoc = None
+        self._bulk_load = None
         self._verbose = verbose
+        self.profiler = self.add_hook(Profiler(self, verbose=True)) if profile else None
+        if progress:
+            self.add_hook(ProgressHook(callback=progress if callable(progress) else None))
+
+    def add_hook(self, hook):
+        """Register an instrumentation hook. Every operation of the context
+        is timed as a :py:class:`Span <cartoframes.instrumentation.Span>`:
+        public methods like ``read`` or ``write``, and within them SQL API
+        queries, COPY uploads and downloads, Batch SQL jobs (including the
+        wait for their completion), geometry encoding and decoding, and each
+        HTTP request. Spans record the bytes sent and received, rows, retries
+        and rate limit waits. See :py:mod:`cartoframes.instrumentation`.
+
+        Example:
+
+            .. code:: python
+
+                def log_span(span):
+                    metrics.timing('cartoframes.' + span.name, span.duration)
+
+                cc.add_hook(log_span)
+                cc.write(df, 'my_table')
+
+        Args:
+            hook (function or :py:class:`Hook <cartoframes.instrumentation.Hook>`):
+              Function called with each span when it ends, or a hook object
+              notified when spans start and end.
+
+        Returns:
+            :py:class:`Hook <cartoframes.instrumentation.Hook>`: The registered
+            hook.
+        """
+        return self.instrumentation.add_hook(hook)
+
+    def remove_hook(self, hook):
+        """Unregister an instrumentation hook added with :obj:`add_hook`"""
+        self.instrumentation.remove_hook(hook)
+
+    def profile(self, verbose=False):
+        """Context manager profiling the operations run inside it. Each one
+        is broken down into the time spent in stages like column name
+        normalization, schema inference, Batch SQL jobs, row encoding,
+        sending or receiving data, the server COPY, parsing and geometry
+        decoding, with the bytes and rows of each stage. It shows whether
+        an upload or download is bound by the network, the server or the
+        encoding of the data.
+
+        Example:
+
+            .. code:: python
+
+                with cc.profile() as profiler:
+                    cc.write(df, 'my_table', overwrite=True)
+                print(profiler.report())
+                profiler.to_dataframe()
+
+        Args:
+            verbose (bool, optional): Print the breakdown of each operation
+              when it ends. Defaults to ``False``.
+
+        Returns:
+            :py:class:`Profiler <cartoframes.profiler.Profiler>`
+        """
+        return Profiler(self, verbose=verbose)
 
     def _is_authenticated(self):
         """Checks if credentials allow for authenticated carto access"""
@@ -206,7 +292,11 @@ class CartoContext(object):
         # is an org user if first item is not `public`
         return res['rows'][0]['unnest'] != 'public'
 
-    def read(self, table_name, limit=None, decode_geom=False, shared_user=None, retry_times=3):
+    @traced('read')
+    def read(self, table_name, limit=None, decode_geom=False, shared_user=None, retry_times=3,
+             dtype_backend=DTYPE_BACKEND_NUMPY, columns=None, where=None, order_by=None, sample=None,
+             simplify_tolerance=None, precision=None, geom_format=GEOM_FORMAT_WKB, as_geodataframe=False,
+             spill_to=None):
         """Read a table from CARTO into a pandas DataFrames. Column types are inferred from database types, to
           avoid problems with integer columns with NA or null values, they are automatically retrieved as float64
 
@@ -222,10 +312,54 @@ class CartoContext(object):
               specify the user name (schema) who shared it.
             retry_times (int, optional): If the read call is rate limited,
               number of retries to be made
+            dtype_backend (str, optional): Data types of the DataFrame
+              columns. Defaults to ``'numpy'``, where integer columns are read
+              as float64 and text columns as objects. With ``'compact'``,
+              integer and boolean columns use pandas nullable dtypes
+              (``Int16``, ``Int32``, ``Int64``, ``boolean``), ``real`` columns
+              are read as float32, and text columns with few distinct values
+              (according to the table statistics) as categoricals. Requires
+              pandas>=1.0.
+            columns (list of str, optional): Columns to read. Defaults to all
+              of them. `cartodb_id` is always read, and `the_geom` too if
+              ``decode_geom`` is ``True``.
+            where (str, optional): SQL condition the rows to read must meet,
+              e.g. ``"state = 'NY' AND population > 1000"``.
+            order_by (str or list of str, optional): SQL expressions to sort
+              the rows by, e.g. ``'population DESC'``.
+            sample (float, optional): Fraction (from 0 to 1) of the rows to
+              read, chosen at random on the server.
+            simplify_tolerance (float, optional): Simplify the geometries on
+              the server with this tolerance, in degrees, preserving their
+              topology. Defaults to ``None``, no simplification.
+            precision (int, optional): Number of decimal digits of the
+              geometry coordinates. Reducing it makes the download smaller.
+              Defaults to ``None``, full precision.
+            geom_format (str, optional): Encoding of the geometries in the
+              download: ``'wkb'`` (default), ``'twkb'`` (compact, coordinates
+              rounded to ``precision`` or 6 decimal digits) or ``'geojson'``.
+              All of them are decoded into the same geometries with
+              ``decode_geom``.
+            as_geodataframe (bool, optional): Return a
+              `GeoPandas <http://geopandas.org/>`__ GeoDataFrame, with the
+              geometries decoded in a single vectorized pass into its
+              `geometry` column and CRS EPSG:4326. Defaults to ``False``.
+              Requires geopandas.
+            spill_to (str, optional): Path of a Parquet (``.parquet``) or
+              Feather (``.feather``, ``.arrow``) file to stream the table to,
+              for tables larger than memory. The download is converted and
+              written in blocks, so memory use doesn't grow with the table
+              size. Geometries are stored as WKB, and `decode_geom`,
+              `as_geodataframe` and `dtype_backend` do not apply. The file
+              can be opened again with :py:func:`cartoframes.arrow.open_spill`.
+              Requires pyarrow.
 
         Returns:
             pandas.DataFrame: DataFrame representation of `table_name` from
-            CARTO.
+            CARTO. ``geopandas.GeoDataFrame`` if `as_geodataframe` is ``True``.
+            With `spill_to`, a ``pyarrow.Table`` memory-mapped from the
+            Feather file, or a ``pyarrow.dataset.Dataset`` over the Parquet
+            file.
 
         Example:
             .. code:: python
@@ -233,14 +367,50 @@ class CartoContext(object):
                 import cartoframes
                 cc = cartoframes.CartoContext(BASEURL, APIKEY)
                 df = cc.read('acadia_biodiversity')
+
+            Only download the columns and rows needed:
+
+            .. code:: python
+
+                df = cc.read('acadia_biodiversity',
+                             columns=['simpson_index', 'species'],
+                             where='simpson_index > 0.5',
+                             order_by='simpson_index DESC')
+
+            Download lighter geometries for a country-level map:
+
+            .. code:: python
+
+                df = cc.read('countries', decode_geom=True,
+                             simplify_tolerance=0.01, precision=3,
+                             geom_format='twkb')
+
+            Read a GeoDataFrame:
+
+            .. code:: python
+
+                gdf = cc.read('acadia_biodiversity', as_geodataframe=True)
+
+            Stream a large table to disk and scan it in batches:
+
+            .. code:: python
+
+                dataset = cc.read('gps_traces', spill_to='gps_traces.parquet')
+                for batch in dataset.to_batches(columns=['speed']):
+                    ...
         """
         # choose schema (default user - org or standalone - or shared)
         schema = 'public' if not self.is_org else (
             shared_user or self.creds.username())
 
         dataset = Dataset(self, table_name, schema)
-        return dataset.download(limit, decode_geom, retry_times)
+        return dataset.download(limit, decode_geom, retry_times, dtype_backend=dtype_backend,
+                                columns=columns, where=where, order_by=order_by, sample=sample,
+                                simplify_tolerance=simplify_tolerance, precision=precision,
+                                geom_format=geom_format, as_geodataframe=as_geodataframe,
+                                spill_to=spill_to)
 
+    @traced('tables')
     @utils.temp_ignore_warnings
     def tables(self):
         """List all tables in user's CARTO account
@@ -261,8 +431,40 @@ class CartoContext(object):
             load_totals='false')
         return [Table.from_dataset(d) for d in datasets]
 
+    def bulk_load(self):
+        """Context manager to load several tables, deferring the
+        cartodbfication of all of them (adding `cartodb_id` and
+        `the_geom_webmercator`, and building their indexes) until the end,
+        in a single Batch SQL job. Tables are created with the SQL API and
+        loaded right away, instead of waiting for a Batch SQL job each.
+
+        Tables written in the session can't be used as CARTO datasets (for
+        example, mapped) until it ends. The DataFrames returned by
+        :py:meth:`query` with a `table_name` are read before their table is
+        cartodbfied, so they only have the columns of the query, and aren't
+        indexed by `cartodb_id` unless the query selects it. If an exception
+        is raised inside the session, the tables are left as plain, not
+        cartodbfied, tables.
+
+        Example:
+
+            .. code:: python
+
+                with cc.bulk_load():
+                    for name, df in dataframes.items():
+                        cc.write(df, name, overwrite=True)
+                    cc.query('SELECT * FROM trips WHERE distance > 10',
+                             table_name='long_trips')
+
+        Returns:
+            :py:class:`BulkLoad <cartoframes.datasets.BulkLoad>`
+        """
+        return BulkLoad(self)
+
+    @traced('write')
     def write(self, df, table_name, temp_dir=CACHE_DIR, overwrite=False,
-              lnglat=None, encode_geom=False, geom_col=None, **kwargs):
+              lnglat=None, encode_geom=False, geom_col=None, indexes=None,
+              cluster_on=None, analyze=False, **kwargs):
         """Write a DataFrame to a CARTO table.
 
         Examples:
@@ -272,6 +474,20 @@ class CartoContext(object):
 
                 cc.write(df, 'brooklyn_poverty', overwrite=True)
 
+            Write a CSV file larger than memory in chunks of 100,000 rows.
+
+            .. code:: python
+
+                cc.write(pd.read_csv('trips.csv', chunksize=100000), 'trips')
+
+            Index the columns that will be filtered by, and sort the table
+            spatially, once it is loaded.
+
+            .. code:: python
+
+                cc.write(df, 'stores', indexes=['store_id', ['state', 'city']],
+                         cluster_on='the_geom', analyze=True)
+
             Scrape an HTML table from Wikipedia and send to CARTO with content
             guessing to create a geometry from the country column. This uses
             a CARTO Import API param `content_guessing` parameter.
@@ -294,7 +510,13 @@ class CartoContext(object):
 
         Args:
             df (pandas.DataFrame): DataFrame to write to ``table_name`` in user
-                CARTO account
+                CARTO account. With a ``geopandas.GeoDataFrame``, its active
+                geometry column is written as `the_geom`, reprojected to
+                EPSG:4326 if needed. It can also be an iterator of DataFrames
+                with the same columns, like the chunks returned by
+                ``pandas.read_csv(..., chunksize=...)``: the table is created
+                from the first one and they are streamed one at a time, so
+                data larger than memory can be written.
             table_name (str): Table to write ``df`` to in CARTO.
             temp_dir (str, optional): Directory for temporary storage of data
                 that is sent to CARTO. Defaults are defined by `appdirs
@@ -311,6 +533,16 @@ class CartoContext(object):
                 as `the_geom`.
             geom_col (str, optional): The name of the column where geometry
                 information is stored. Used in conjunction with `encode_geom`.
+            indexes (list, optional): Columns to index once the data is
+                loaded, which is faster than indexing during the load. Each
+                item is a column name, or a list of them for a multicolumn
+                index. Geometry columns get GiST indexes, others B-tree ones.
+            cluster_on (str, optional): Column to physically sort the table
+                by with ``CLUSTER``, usually `the_geom` to keep nearby
+                features together on disk. It is indexed if needed.
+            analyze (bool, optional): Whether to ``ANALYZE`` the table after
+                loading it, so the planner has statistics for the first
+                queries. Defaults to ``False``.
             **kwargs: Keyword arguments to control write operations. Options
                 are:
 
@@ -336,13 +568,62 @@ class CartoContext(object):
             the length of the DataFrame.
         """  # noqa
         tqdm.write('Params: encode_geom, geom_col and everything in kwargs are deprecated and not being used any more')
-        dataset = Dataset(self, table_name, df=df)
+        if isinstance(df, pd.DataFrame):
+            dataset = Dataset(self, table_name, df=df)
+        else:
+            dataset = Dataset.from_chunks(self, df, table_name)
 
         if_exists = Dataset.FAIL
         if overwrite:
             if_exists = Dataset.REPLACE
 
-        dataset = dataset.upload(with_lonlat=lnglat, if_exists=if_exists)
+        dataset = dataset.upload(with_lonlat=lnglat, if_exists=if_exists, indexes=indexes,
+                                 cluster_on=cluster_on, analyze=analyze)
+
+        tqdm.write('Table successfully written to CARTO: {table_url}'.format(
+            table_url=utils.join_url(self.creds.base_url(),
+                                     'dataset',
+                                     dataset.table_name)))
+
+        return dataset
+
+    @traced('write_from_file')
+    def write_from_file(self, source, table_name, overwrite=False, geom_col=None,
+                        indexes=None, cluster_on=None, analyze=False):
+        """Write a Parquet, Feather or CSV file, or Arrow data, to a CARTO
+        table. The table columns are created from the file metadata, and the
+        data is streamed to CARTO in record batches (Parquet row groups), so
+        files larger than memory can be uploaded and they are never loaded
+        into pandas.
+
+        Example:
+
+            .. code:: python
+
+                cc.write_from_file('trips.parquet', 'trips', overwrite=True)
+
+        Args:
+            source (str or pyarrow.Table or pyarrow.dataset.Dataset): Path of
+              a ``.parquet``, ``.feather``, ``.arrow`` or ``.csv`` file, or
+              Arrow data. Requires pyarrow.
+            table_name (str): Table to write to in CARTO.
+            overwrite (bool, optional): Whether to overwrite `table_name` if it
+              exists. Defaults to ``False``.
+            geom_col (str, optional): Column with the geometries, as WKB, WKT
+              or hex WKB in EPSG:4326. By default, the primary column of
+              GeoParquet metadata, a GeoArrow column, or a column named
+              `the_geom`, `geom` or `geometry` is used.
+            indexes (list, optional): Columns to index once the data is
+              loaded, see :py:meth:`write <cartoframes.context.CartoContext.write>`.
+            cluster_on (str, optional): Column to ``CLUSTER`` the table on.
+            analyze (bool, optional): Whether to ``ANALYZE`` the table.
+
+        Returns:
+            :py:class:`Dataset <cartoframes.datasets.Dataset>`
+        """
+        dataset = Dataset.from_file(self, source, table_name, geom_col=geom_col)
+        dataset = dataset.upload(if_exists=Dataset.REPLACE if overwrite else Dataset.FAIL,
+                                 indexes=indexes, cluster_on=cluster_on, analyze=analyze)
 
         tqdm.write('Table successfully written to CARTO: {table_url}'.format(
             table_url=utils.join_url(self.creds.base_url(),
@@ -369,6 +650,7 @@ class CartoContext(object):
         dataset.privacy = privacy
         dataset.save()
 
+    @traced('delete')
     def delete(self, table_name):
         """Delete a table in user's CARTO account.
 
@@ -397,7 +679,8 @@ class CartoContext(object):
         """
         pass
 
-    def fetch(self, query, decode_geom=False):
+    @traced('fetch')
+    def fetch(self, query, decode_geom=False, dtype_backend=DTYPE_BACKEND_NUMPY, output=arrow.OUTPUT_PANDAS):
         """Pull the result from an arbitrary SELECT SQL query from a CARTO account
         into a pandas DataFrame.
 
@@ -408,12 +691,25 @@ class CartoContext(object):
               `Shapely <https://github.com/Toblerity/Shapely>`__
               object that can be used, for example, in `GeoPandas
               <http://geopandas.org/>`__.
+            dtype_backend (str, optional): Data types of the DataFrame
+              columns, ``'numpy'`` (default) or ``'compact'``. See
+              :py:meth:`CartoContext.read <cartoframes.context.CartoContext.read>`.
+              With ``'compact'``, text columns with few distinct values in a
+              sample of the query result are read as categoricals.
+            output (str, optional): ``'pandas'`` (default) or ``'arrow'``. With
+              ``'arrow'``, the result is read straight into a
+              `pyarrow <https://arrow.apache.org/docs/python/>`__ Table, with
+              Arrow types matching the PostgreSQL ones, and geometry columns
+              as WKB binary columns tagged with the GeoArrow ``geoarrow.wkb``
+              extension. `decode_geom` and `dtype_backend` do not apply to it.
+              Requires pyarrow.
 
         Returns:
             pandas.DataFrame: DataFrame representation of query supplied.
             Pandas data types are inferred from PostgreSQL data types.
             In the case of PostgreSQL date types, dates are attempted to be
             converted, but on failure a data type 'object' is used.
+            ``pyarrow.Table`` if `output` is ``'arrow'``.
 
         Examples:
             This query gets the 10 highest values from a table and
@@ -447,26 +743,80 @@ class CartoContext(object):
                     decode_geom=True
                 )
 
-        """
-        copy_query = 'COPY ({query}) TO stdout WITH (FORMAT csv, HEADER true)'.format(query=query)
-        result = recursive_read(self, copy_query)
+            This query is read into an Arrow table, that can be handed to
+            other engines like DuckDB or Polars without copies.
 
-        query_columns = get_columns(self, query)
-        df_types = dtypes(query_columns, exclude_dates=True, exclude_the_geom=True)
-        date_column_names = date_columns_names(query_columns)
+            .. code:: python
 
-        df = pd.read_csv(result, dtype=df_types,
-                         parse_dates=date_column_names,
-                         true_values=['t'],
-                         false_values=['f'],
-                         index_col='cartodb_id' if 'cartodb_id' in df_types else False,
-                         converters={'the_geom': lambda x: _decode_geom(x) if decode_geom else x})
+                table = cc.fetch('SELECT * FROM my_table', output='arrow')
 
+        """
+        if output not in arrow.OUTPUTS:
+            raise ValueError('`output` must be one of {}'.format(', '.join(arrow.OUTPUTS)))
+        if output == arrow.OUTPUT_ARROW:
+            if decode_geom:
+                raise ValueError('`decode_geom` is not supported with `output=\'arrow\'`, '
+                                 'geometries are read as WKB')
+            return self._fetch_arrow(query)
+        return self._fetch(query, decode_geom=decode_geom, dtype_backend=dtype_backend)
+
+    def _fetch_arrow(self, query, schema=None, spill_to=None):
+        """Pull the result of `query` into a pyarrow Table, or stream it to
+        the Parquet or Feather file `spill_to`"""
+        if schema is None:
+            schema = get_columns(self, query)
+        copy_query = 'COPY ({query}) TO stdout WITH (FORMAT csv, HEADER true)'.format(
+            query=arrow.get_arrow_query(query, schema))
+        with self.instrumentation.span(SPAN_COPYTO, query=copy_query) as span:
+            stream = self.instrumentation.count_stream(recursive_read(self, copy_query), span)
+            if spill_to is not None:
+                return arrow.spill_arrow(stream, schema, spill_to)
+            table = arrow.read_arrow(stream, schema)
+            span.set('rows', table.num_rows)
+        return table
+
+    def _fetch(self, query, decode_geom=False, schema=None,
+               dtype_backend=DTYPE_BACKEND_NUMPY, category_columns=None,
+               geom_format=GEOM_FORMAT_WKB, as_geodataframe=False):
+        """Pull the result of `query` into a pandas DataFrame. `schema` is the
+        :py:class:`Schema <cartoframes.columns.Schema>` of the query result,
+        and `category_columns` the text columns to read as categoricals with
+        the `compact` dtype backend. Both are retrieved from CARTO if not
+        given. `geom_format` is the encoding of `the_geom` in the result.
+        With `as_geodataframe`, a GeoDataFrame is returned."""
+        if dtype_backend == DTYPE_BACKEND_COMPACT and not hasattr(pd, 'BooleanDtype'):
+            raise ValueError('dtype_backend `compact` requires pandas>=1.0')
+
+        if schema is None:
+            schema = get_columns(self, query)
+        if dtype_backend == DTYPE_BACKEND_COMPACT and category_columns is None:
+            category_columns = get_category_columns(self, query, schema.text_columns)
+        df_types = schema.get_dtypes(exclude_dates=True, exclude_the_geom=True,
+                                     dtype_backend=dtype_backend,
+                                     category_columns=category_columns or ())
+
+        copy_query = 'COPY ({query}) TO stdout WITH (FORMAT csv, HEADER true)'.format(query=query)
+        with self.instrumentation.span(SPAN_COPYTO, query=copy_query, decode_geom=decode_geom) as span:
+            result = self.instrumentation.count_stream(recursive_read(self, copy_query), span)
+
+            df = pd.read_csv(result, dtype=df_types,
+                             parse_dates=list(schema.date_columns),
+                             true_values=['t'],
+                             false_values=['f'],
+                             index_col='cartodb_id' if 'cartodb_id' in df_types else False,
+                             converters=schema.get_converters(
+                                 GEOM_DECODERS[geom_format] if decode_geom and not as_geodataframe else None))
+            span.set('rows', len(df))
+
+        if as_geodataframe:
+            with self.instrumentation.span(SPAN_DECODE, rows=len(df), geom_format=geom_format):
+                return to_geodataframe(df, geom_format)
         if decode_geom:
             df.rename({'the_geom': 'geometry'}, axis='columns', inplace=True)
 
         return df
 
+    @traced('execute')
     def execute(self, query):
         """Runs an arbitrary query to a CARTO account.
 
@@ -518,6 +868,7 @@ class CartoContext(object):
         """
         self.batch_sql_client.create_and_wait_for_completion(query)
 
+    @traced('query')
     def query(self, query, table_name=None, decode_geom=False, is_select=None):
         """Pull the result from an arbitrary SQL SELECT query from a CARTO account
         into a pandas DataFrame. This is the default behavior, when `is_select=True`
@@ -635,10 +986,11 @@ class CartoContext(object):
 
         return dataframe
 
+    @traced('map')
     @utils.temp_ignore_warnings
     def map(self, layers=None, interactive=True,
             zoom=None, lat=None, lng=None, size=(800, 400),
-            ax=None):
+            ax=None, static_renderer=render.MAPS_API, cache=None, renderer=None):
         """Produce a CARTO map visualizing data layers.
 
         Examples:
@@ -667,6 +1019,24 @@ class CartoContext(object):
                        zoom=14,
                        lng=-68.3823549,
                        lat=44.3036906)
+
+            Render a static map locally with matplotlib instead of the CARTO
+            Static Maps API, and save it as a PNG::
+
+                ax = cc.map(layers=Layer('acadia_biodiversity',
+                                         color='simpson_index'),
+                            interactive=False,
+                            static_renderer='local')
+                ax.figure.savefig('acadia.png')
+
+            Reuse static map images while the data of the map doesn't
+            change::
+
+                from cartoframes.cache import StaticMapCache
+                cache = StaticMapCache(ttl=3600)
+                cc.map(layers=Layer('acadia_biodiversity'),
+                       interactive=False,
+                       cache=cache)
         Args:
             layers (list, optional): List of zero or more of the following:
 
@@ -699,18 +1069,40 @@ class CartoContext(object):
                 Format is ``(width, height)``. Defaults to ``(800, 400)``.
             ax: matplotlib axis on which to draw the image. Only used when
                 ``interactive`` is ``False``.
+            static_renderer (str, optional): How static maps are rendered when
+                ``interactive`` is ``False``. Defaults to ``'maps_api'``, which
+                requests the image from the CARTO Static Maps API. With
+                ``'local'``, the layer data is fetched once and drawn with
+                matplotlib, applying the same styling schemes. Basemap
+                labels are not drawn by the local renderer, and the basemap
+                is replaced by its background color. Requires matplotlib.
+            cache (:py:class:`StaticMapCache
+                <cartoframes.cache.StaticMapCache>`, optional): Cache for
+                static map images from the CARTO Static Maps API. Only used
+                when ``interactive`` is ``False``. Defaults to ``None``, which
+                requests a new image on every call. If the cache checks the
+                freshness of the images and the last update of the tables
+                can't be retrieved, the cache is skipped.
+            renderer (str or file-like, optional): What the map is returned
+                as: with ``'notebook'``, IPython objects or matplotlib Axes,
+                and with ``'raw'``, the HTML document as a string or the PNG
+                image as bytes. With a binary file-like object, the HTML or
+                PNG image is written to it. Defaults to ``'notebook'``. See
+                :py:mod:`cartoframes.display`.
 
         Returns:
-            IPython.display.HTML or matplotlib Axes: Interactive maps are
-            rendered as HTML in an `iframe`, while static maps are returned as
-            matplotlib Axes objects or IPython Image.
+            IPython.display.HTML, matplotlib Axes, str or bytes: Interactive
+            maps are rendered as HTML in an `iframe`, while static maps are
+            returned as matplotlib Axes objects, or IPython Image if
+            matplotlib is not installed, and as PNG images with the raw
+            renderer.
         """
         # TODO: add layers preprocessing method like
         #       layers = process_layers(layers)
         #       that uses up to layer limit value error
         if layers is None:
             layers = []
-        elif not isinstance(layers, collections.Iterable):
+        elif not isinstance(layers, Iterable):
             layers = [layers]
         else:
             layers = list(layers)
@@ -718,6 +1110,11 @@ class CartoContext(object):
         if len(layers) > 8:
             raise ValueError('Map can have at most 8 layers')
 
+        if static_renderer not in render.STATIC_RENDERERS:
+            raise ValueError('static_renderer must be one of {}'.format(
+                ', '.join(render.STATIC_RENDERERS)))
+        renderer = get_renderer(renderer, use_matplotlib=HAS_MATPLOTLIB)
+
         nullity = [zoom is None, lat is None, lng is None]
         if any(nullity) and not all(nullity):
             raise ValueError('Zoom, lat, and lng must all or none be provided')
@@ -765,20 +1162,22 @@ class CartoContext(object):
         # Setup layers
         for idx, layer in enumerate(layers):
             if not layer.is_basemap:
-                # get schema of style columns
-                if layer.style_cols:
-                    resp = self.sql_client.send(
-                        utils.minify_sql((
-                            'SELECT {cols}',
-                            'FROM ({query}) AS _wrap',
-                            'LIMIT 0',
-                        )).format(cols=','.join(layer.style_cols),
-                                  comma=',' if layer.style_cols else '',
-                                  query=layer.orig_query),
-                        **DEFAULT_SQL_ARGS)
-                    self._debug_print(layer_fields=resp)
-                    for stylecol, coltype in utils.dict_items(resp['fields']):
-                        layer.style_cols[stylecol] = coltype['type']
+                # get the columns of the query, and the schema of style columns
+                resp = self.sql_client.send(
+                    utils.minify_sql((
+                        'SELECT *',
+                        'FROM ({query}) AS _wrap',
+                        'LIMIT 0',
+                    )).format(query=layer.orig_query),
+                    **DEFAULT_SQL_ARGS)
+                self._debug_print(layer_fields=resp)
+                layer.query_columns = list(resp['fields'])
+                missing_cols = [col for col in layer.style_cols if col not in resp['fields']]
+                if missing_cols:
+                    raise CartoException('Style column(s) {cols} not found in layer query `{query}`'.format(
+                        cols=', '.join('`{}`'.format(col) for col in missing_cols), query=layer.orig_query))
+                for stylecol in layer.style_cols:
+                    layer.style_cols[stylecol] = resp['fields'][stylecol]['type']
                 layer.geom_type = self._geom_type(layer)
                 if not base_layers:
                     geoms.add(layer.geom_type)
@@ -824,7 +1223,13 @@ class CartoContext(object):
             bbox = '{west},{south},{east},{north}'.format(**bounds)
             params.update(dict(bbox=bbox))
 
-        map_name = self._send_map_template(layers, has_zoom=has_zoom)
+        if not interactive and static_renderer == render.LOCAL:
+            extent = render.get_extent(size, zoom=zoom, lat=lat, lng=lng,
+                                       bounds=None if has_zoom else bounds)
+            ax = render.render_static(self, layers, size, extent, ax=ax)
+            return renderer.axes(ax, size)
+
+        map_name = get_map_name(layers, has_zoom=has_zoom)
         api_url = utils.join_url(self.creds.base_url(), 'api/v1/map')
 
         static_url = ('{url}.png?{params}').format(
@@ -835,6 +1240,32 @@ class CartoContext(object):
         html = '<img src="{url}" />'.format(url=static_url)
         self._debug_print(static_url=static_url)
 
+        image_data = None
+        if not interactive and cache is not None:
+            cache_key = cache.get_key(
+                map_name, params['config'],
+                {k: v for k, v in utils.dict_items(params)
+                 if k in ('zoom', 'lat', 'lon', 'bbox', )},
+                size)
+            fingerprint = (self._get_tables_fingerprint(nb_layers)
+                           if cache.check_freshness else None)
+            if cache.check_freshness and fingerprint is None:
+                # the freshness of the image can't be checked, so neither
+                # reuse nor store it
+                cache = None
+            else:
+                image_data = cache.get(cache_key, fingerprint=fingerprint)
+            self._debug_print(static_map_cache_hit=image_data is not None)
+
+        if image_data is None:
+            self._send_map_template(layers, has_zoom=has_zoom)
+            if not interactive:
+                resp = self.auth_client.session.get(static_url)
+                resp.raise_for_status()
+                image_data = resp.content
+                if cache is not None:
+                    cache.set(cache_key, image_data, fingerprint=fingerprint)
+
         # TODO: write this as a private method
         if interactive:
             netloc = urlparse(self.creds.base_url()).netloc
@@ -916,25 +1347,9 @@ class CartoContext(object):
                      width=size[0],
                      height=size[1],
                      img_html=img_html)
-            return HTML(html)
-        elif HAS_MATPLOTLIB:
-            raw_data = mpi.imread(static_url, format='png')
-            if ax is None:
-                dpi = mpi.rcParams['figure.dpi']
-                mpl_size = (size[0] / dpi, size[1] / dpi)
-                fig = plt.figure(figsize=mpl_size, dpi=dpi, frameon=False)
-                fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
-                ax = plt.gca()
-            ax.imshow(raw_data)
-            ax.axis('off')
-            return ax
-        else:
-            return Image(url=static_url,
-                         embed=True,
-                         format='png',
-                         width=size[0],
-                         height=size[1],
-                         metadata=dict(origin_url=static_url))
+            return renderer.html(html)
+
+        return renderer.image(image_data, static_url, size, ax=ax)
 
     def _geom_type(self, source):
         """gets geometry type(s) of specified layer"""
@@ -1089,7 +1504,7 @@ class CartoContext(object):
                 regionsearch = '"geom_tags"::text ilike \'%{}%\''.format(
                     get_countrytag(region))
                 bounds = 'ST_MakeEnvelope(-180.0, -85.0, 180.0, 85.0, 4326)'
-        elif isinstance(region, collections.Iterable):
+        elif isinstance(region, Iterable):
             if len(region) != 4:
                 raise ValueError(
                     '`region` should be a list of the geographic bounds of a '
@@ -1272,7 +1687,7 @@ class CartoContext(object):
                     'SELECT ST_SetSRID(ST_Extent(the_geom), 4326) AS env, '
                     'count(*)::int AS cnt FROM {table_name}').format(
                         table_name=region)
-        elif isinstance(region, collections.Iterable):
+        elif isinstance(region, Iterable):
             if len(region) != 4:
                 raise ValueError(
                     '`region` should be a list of the geographic bounds of a '
@@ -1470,7 +1885,7 @@ class CartoContext(object):
         #                             'a geometry is present')
         if isinstance(metadata, pd.DataFrame):
             _meta = metadata.copy().reset_index()
-        elif isinstance(metadata, collections.Iterable):
+        elif isinstance(metadata, Iterable):
             query = utils.minify_sql((
                 'WITH envelope AS (',
                 '  SELECT',
@@ -1642,6 +2057,39 @@ class CartoContext(object):
                 .replace('@@LAT@@', str(options.get('lat', 0)))
                 .replace('@@LNG@@', str(options.get('lng', 0))))
 
+    def _get_tables_fingerprint(self, layers):
+        """Return a fingerprint of the last update of the tables used by data
+        layers, so cached maps can be invalidated when their data changes.
+
+        Args:
+            layers (list): List of cartoframes layers.
+
+        Returns:
+            str: Fingerprint of the tables, or ``None`` if the update times
+            could not be retrieved.
+        """
+        updated_query = ('SELECT {idx} AS layer, table_name, updated_at '
+                         'FROM CDB_QueryTables_Updated_At(\'{query}\')')
+        union_query = ' UNION ALL '.join(
+            [updated_query.format(query=layer.orig_query.replace("'", "''"),
+                                  idx=idx)
+             for idx, layer in enumerate(layers)
+             if not layer.is_basemap])
+        if not union_query:
+            return json.dumps([])
+        try:
+            resp = self.sql_client.send(
+                utils.minify_sql((
+                    'SELECT layer, table_name, updated_at',
+                    'FROM ({union_query}) AS _wrap',
+                    'ORDER BY layer, table_name',
+                )).format(union_query=union_query),
+                **DEFAULT_SQL_ARGS)
+        except CartoException as err:
+            self._debug_print(tables_fingerprint=err)
+            return None
+        return json.dumps(resp['rows'], sort_keys=True)
+
     def _get_bounds(self, layers):
         """Return the bounds of all data layers involved in a cartoframes map.
 
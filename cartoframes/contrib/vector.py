@@ -20,17 +20,15 @@ Here is an example using the example CartoContext from the :py:class:`Examples
         ],
         example_context)
 """
+import base64
+import json
+import re
 from warnings import warn
-from IPython.display import HTML
 import numpy as np
-try:
-    import geopandas
-    HAS_GEOPANDAS = True
-except ImportError:
-    HAS_GEOPANDAS = False
 
 from .. import utils
-from jinja2 import Environment, PackageLoader
+from ..datasets import _is_geopandas
+from ..display import get_renderer
 
 # CARTO VL
 _DEFAULT_CARTO_VL_PATH = 'https://libs.cartocdn.com/carto-vl/v1.2.3/carto-vl.min.js'
@@ -47,6 +45,35 @@ _DEFAULT_AIRSHIP_STYLES_PATH = 'https://libs.cartocdn.com/airship-style/v2/airsh
 _DEFAULT_AIRSHIP_ICONS_PATH = 'https://libs.cartocdn.com/airship-icons/v2/icons.css'
 
 
+# LocalLayer encodings
+LOCAL_ENCODING_GEOJSON = 'geojson'
+LOCAL_ENCODING_BINARY = 'binary'
+
+# Order matters: the index of each type is its code in the binary encoding
+_QUANTIZED_GEOM_TYPES = ('Point', 'LineString', 'Polygon', 'MultiPoint',
+                         'MultiLineString', 'MultiPolygon', )
+# Nesting depth of the GeoJSON `coordinates` array of each geometry type
+_QUANTIZED_GEOM_DEPTHS = {
+    'Point': 0,
+    'LineString': 1,
+    'MultiPoint': 1,
+    'Polygon': 2,
+    'MultiLineString': 2,
+    'MultiPolygon': 3,
+}
+
+
+# Layer aggregation defaults
+DEFAULT_AGGREGATION_THRESHOLD = 500000
+DEFAULT_AGGREGATION_RESOLUTION = 4
+# Number of features in each aggregated cell, usable in styling as $cf_count
+AGGREGATION_COUNT_COL = 'cf_count'
+
+# CARTO VL column references, e.g. `$pop_2010` in `ramp($pop_2010, sunset)`
+_STYLE_COLUMN_RE = re.compile(r'\$(\w+)')
+_GEOM_COLS = ('cartodb_id', 'the_geom', 'the_geom_webmercator', )
+
+
 class BaseMaps(object):  # pylint: disable=too-few-public-methods
     """Supported CARTO vector basemaps. Read more about the styles in the
     `CARTO Basemaps repository <https://github.com/CartoDB/basemap-styles>`__.
@@ -106,6 +133,20 @@ class QueryLayer(object):  # pylint: disable=too-few-public-methods,too-many-ins
             the popup that will be rendered in HTML.
           - list: A list of valid column names in the data used for this layer
           - str: A column name in the data used in this layer
+        aggregation (bool or dict, optional): Reduce the data sent to the
+          map. If enabled, the layer query only selects `cartodb_id`, the
+          geometry columns and the columns used in the styling and
+          interactivity expressions. Point layers with more rows than a
+          threshold are also aggregated on the server into a grid that
+          follows the zoom level: numeric columns are averaged, other
+          columns take their most common value, and the number of points in
+          each cell is available as ``$cf_count``. Defaults to ``None`` (no
+          aggregation). If a :obj:`dict`, the following keys are options:
+
+          - threshold (`int`, optional): Estimated number of rows above which
+            points are aggregated. Defaults to 500000.
+          - resolution (`int`, optional): Size in pixels of the aggregation
+            grid cells. Defaults to 4.
 
     Example:
 
@@ -135,7 +176,7 @@ class QueryLayer(object):  # pylint: disable=too-few-public-methods,too-many-ins
     """
     def __init__(self, query, color=None, size=None, time=None,
                  strokeColor=None, strokeWidth=None, interactivity=None,
-                 legend=None):  # pylint: disable=invalid-name
+                 legend=None, aggregation=None):  # pylint: disable=invalid-name
 
         def convstr(obj):
             """convert all types to strings or None"""
@@ -158,12 +199,42 @@ class QueryLayer(object):  # pylint: disable=too-few-public-methods,too-many-ins
         self.styling = ''
         self.interactivity = None
         self.header = None
+        self.aggregation = self._parse_aggregation(aggregation)
 
         self._compose_style()
 
         # interactivity options
         self._set_interactivity(interactivity)
 
+    def _parse_aggregation(self, aggregation):
+        """Parse aggregation inputs"""
+        if not aggregation:
+            return None
+
+        options = {
+            'threshold': DEFAULT_AGGREGATION_THRESHOLD,
+            'resolution': DEFAULT_AGGREGATION_RESOLUTION,
+        }
+        if isinstance(aggregation, dict):
+            unknown = set(aggregation) - set(options)
+            if unknown:
+                raise ValueError('Unknown aggregation option(s): {}'.format(
+                    ', '.join(sorted(unknown))))
+            options.update(aggregation)
+        elif aggregation is not True:
+            raise ValueError('`aggregation` must be a bool or a dict')
+
+        return options
+
+    def _get_style_columns(self):
+        """Columns referenced in the styling and interactivity expressions,
+        in order of appearance"""
+        columns = []
+        for column in _STYLE_COLUMN_RE.findall(self.styling):
+            if column not in columns:
+                columns.append(column)
+        return columns
+
     def _compose_style(self):
         """Appends `prop` with `style` to layer styling"""
         valid_styles = (
@@ -201,6 +272,73 @@ class QueryLayer(object):  # pylint: disable=too-few-public-methods,too-many-ins
         self.styling = '\n'.join([interactive_cols, self.styling])
 
 
+def _simplify_tolerance(zoom):
+    """Size in degrees of one pixel at `zoom` on a 256px-tile web map"""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def _flatten_coordinates(coordinates, depth, lengths, flat_coords):
+    """Walks a GeoJSON `coordinates` array, appending the length of every
+    nested array to `lengths` and every (x, y) pair to `flat_coords`"""
+    if depth == 0:
+        flat_coords.append(coordinates[:2])
+        return
+    lengths.append(len(coordinates))
+    for item in coordinates:
+        _flatten_coordinates(item, depth - 1, lengths, flat_coords)
+
+
+def _encode_quantized(gdf, precision):
+    """Encodes a GeoDataFrame as a JSON document with quantized, delta-encoded
+    coordinates packed as base64 little-endian 32-bit integers. The document is
+    decoded back into GeoJSON in the browser (see `vector/scripts/map.js.j2`)
+
+    Coordinates are rounded to `precision` decimal digits and stored as the
+    difference with the previous coordinate. The nesting of every geometry
+    (number of parts, rings and points) is stored in a separate array of
+    unsigned integers, in the same depth-first order as GeoJSON.
+    """
+    scale = 10 ** precision
+    types = []
+    lengths = []
+    flat_coords = []
+    for geom in gdf.geometry:
+        geom_type = geom.geom_type
+        if geom_type not in _QUANTIZED_GEOM_DEPTHS:
+            raise ValueError('Geometry type `{}` is not supported by the '
+                             '`binary` encoding'.format(geom_type))
+        types.append(_QUANTIZED_GEOM_TYPES.index(geom_type))
+        _flatten_coordinates(geom.__geo_interface__['coordinates'],
+                             _QUANTIZED_GEOM_DEPTHS[geom_type],
+                             lengths,
+                             flat_coords)
+
+    quantized = np.round(
+        np.asarray(flat_coords, dtype=np.float64).reshape(-1, 2) * scale
+    ).astype(np.int64)
+    deltas = np.diff(np.vstack((np.zeros((1, 2), np.int64), quantized)), axis=0)
+    if deltas.size and np.abs(deltas).max() > np.iinfo(np.int32).max:
+        raise ValueError('Coordinates are too large to be encoded with '
+                         '`precision={}`. Check that geometries are in '
+                         'EPSG:4326 or use a lower precision'.format(precision))
+
+    properties = json.loads(
+        gdf.drop(gdf.geometry.name, axis=1).to_json(orient='split'))
+    properties.pop('index', None)
+    return json.dumps({
+        'scale': scale,
+        'types': types,
+        'lengths': _b64_array(np.asarray(lengths, dtype='<u4')),
+        'coords': _b64_array(deltas.astype('<i4')),
+        'properties': properties,
+    })
+
+
+def _b64_array(array):
+    """base64 representation of the raw bytes of a numpy array"""
+    return base64.b64encode(array.tobytes()).decode('ascii')
+
+
 def _quote_filter(value):
     return utils.safe_quotes(value.unescape())
 
@@ -233,6 +371,8 @@ def _get_html_doc(
         _carto_vl_path=_DEFAULT_CARTO_VL_PATH,
         _airship_path=None):
 
+    from jinja2 import Environment, PackageLoader
+
     # We should move this to a class eventually, and not load it each time
     templates_env = Environment(
         loader=PackageLoader('cartoframes', 'assets/templates'),
@@ -328,7 +468,7 @@ class Layer(QueryLayer):  # pylint: disable=too-few-public-methods
     """
     def __init__(self, table_name, color=None, size=None, time=None,
                  strokeColor=None, strokeWidth=None, interactivity=None,
-                 legend=None):
+                 legend=None, aggregation=None):
         self.table_source = table_name
 
         super(Layer, self).__init__(
@@ -339,7 +479,8 @@ class Layer(QueryLayer):  # pylint: disable=too-few-public-methods
             strokeColor=strokeColor,
             strokeWidth=strokeWidth,
             interactivity=interactivity,
-            legend=legend
+            legend=legend,
+            aggregation=aggregation
         )
 
 
@@ -350,26 +491,57 @@ class LocalLayer(QueryLayer):  # pylint: disable=too-few-public-methods
 
     See :obj:`QueryLayer` for the full styling documentation.
 
+    Args:
+        dataframe (geopandas.GeoDataFrame): Data to visualize. Geometries are
+          expected to be in WGS84 (EPSG:4326).
+        encoding (str, optional): How the data is embedded in the map. One of
+          ``geojson`` (default), which embeds a GeoJSON string, or ``binary``,
+          which embeds coordinates quantized to `precision` decimal digits,
+          delta-encoded and packed as base64 32-bit integers. The ``binary``
+          encoding is several times smaller than GeoJSON and much faster for
+          the browser to parse, which matters for large GeoDataFrames.
+        precision (int, optional): Number of decimal digits kept for each
+          coordinate when `encoding` is ``binary``. Must be between 0 and 6.
+          Defaults to 6 (about 10 cm at the equator).
+        simplify (int, optional): Zoom level used to simplify geometries
+          before embedding them. Geometries are simplified with a tolerance of
+          one pixel at that zoom level, so they look the same up to that zoom.
+          Defaults to ``None``, which embeds the geometries untouched.
+
     Example:
         In this example, we grab data from the cartoframes example account
         using `read_mcdonals_nyc` to get McDonald's locations within New York
-        City. Using the `decode_geom=True` argument, we decode the geometries
-        into a form that works with GeoPandas. Finally, we pass the
-        GeoDataFrame into :py:class:`LocalLayer
+        City. Using the `as_geodataframe=True` argument, we read it as a
+        GeoPandas GeoDataFrame. Finally, we pass the GeoDataFrame into :py:class:`LocalLayer
         <cartoframes.contrib.vector.LocalLayer>` to visualize.
 
         .. code::
 
-            import geopandas as gpd
             from cartoframes.examples import read_mcdonalds_nyc, example_context
             from cartoframes.contrib import vector
-            gdf = gpd.GeoDataFrame(read_mcdonalds_nyc(decode_geom=True))
+            gdf = read_mcdonalds_nyc(as_geodataframe=True)
             vector.vmap([vector.LocalLayer(gdf), ], context=example_context)
+
+        Large GeoDataFrames can be embedded in a compact binary form and
+        simplified for the zoom levels they will be viewed at.
+
+        .. code::
+
+            vector.vmap(
+                [vector.LocalLayer(gdf, encoding='binary', simplify=12), ],
+                context=example_context)
     """
     def __init__(self, dataframe, color=None, size=None, time=None,
                  strokeColor=None, strokeWidth=None, interactivity=None,
-                 legend=None):
-        if HAS_GEOPANDAS and isinstance(dataframe, geopandas.GeoDataFrame):
+                 legend=None, encoding=LOCAL_ENCODING_GEOJSON, precision=6,
+                 simplify=None):
+        if encoding not in (LOCAL_ENCODING_GEOJSON, LOCAL_ENCODING_BINARY):
+            raise ValueError('`encoding` must be one of `{}` or `{}`'.format(
+                LOCAL_ENCODING_GEOJSON, LOCAL_ENCODING_BINARY))
+        if not isinstance(precision, int) or not 0 <= precision <= 6:
+            raise ValueError('`precision` must be an integer between 0 and 6')
+
+        if _is_geopandas(dataframe, 'GeoDataFrame'):
             # filter out null geometries
             _df_nonnull = dataframe[~dataframe.geometry.isna()]
             # convert time cols to epoch
@@ -377,8 +549,17 @@ class LocalLayer(QueryLayer):  # pylint: disable=too-few-public-methods
                     include=['datetimetz', 'datetime', 'timedelta']).columns
             for timecol in timecols:
                 _df_nonnull[timecol] = _df_nonnull[timecol].astype(np.int64)
-            self._geojson_str = _df_nonnull.to_json()
             self.bounds = _df_nonnull.total_bounds.tolist()
+            if simplify is not None:
+                _df_nonnull = _df_nonnull.set_geometry(
+                    _df_nonnull.geometry.simplify(
+                        _simplify_tolerance(simplify),
+                        preserve_topology=True))
+            if encoding == LOCAL_ENCODING_BINARY:
+                self._encoded_data = _encode_quantized(_df_nonnull, precision)
+            else:
+                self._encoded_data = _df_nonnull.to_json()
+            self.encoding = encoding
         else:
             raise ValueError('LocalLayer only works with GeoDataFrames from '
                              'the geopandas package')
@@ -402,6 +583,7 @@ def vmap(layers,
          basemap=BaseMaps.voyager,
          bounds=None,
          viewport=None,
+         renderer=None,
          **kwargs):
     """CARTO VL-powered interactive map
 
@@ -441,6 +623,14 @@ def vmap(layers,
                 range between 0 and 60 degrees. Zero degrees results in a two-dimensional
                 map, as if your line of sight forms a perpendicular angle with
                 the earth's surface.
+        renderer (str or file-like, optional): What the map is returned as:
+          an ``IPython.display.HTML`` object with ``'notebook'``, the HTML
+          document as a string with ``'raw'``, or written to a binary
+          file-like object. Defaults to ``'notebook'``. See
+          :py:mod:`cartoframes.display`.
+
+    Returns:
+        IPython.display.HTML or str: The map.
 
     Example:
 
@@ -522,6 +712,7 @@ def vmap(layers,
                 viewport={'lng': 10, 'lat': 15, 'zoom': 10, 'bearing': 90, 'pitch': 45}
             )
     """
+    renderer = get_renderer(renderer)
     if bounds:
         bounds = _format_bounds(bounds)
     else:
@@ -530,6 +721,8 @@ def vmap(layers,
     jslayers = []
     for _, layer in enumerate(layers):
         is_local = isinstance(layer, LocalLayer)
+        if not is_local and layer.aggregation:
+            _setup_aggregation(layer, context)
         intera = (
             dict(event=layer.interactivity, header=layer.header)
             if layer.interactivity is not None
@@ -537,8 +730,9 @@ def vmap(layers,
         )
         jslayers.append({
             'is_local': is_local,
+            'encoding': layer.encoding if is_local else None,
             'styling': layer.styling,
-            'source': layer._geojson_str if is_local else layer.query,
+            'source': layer._encoded_data if is_local else layer.query,
             'interactivity': intera,
             'legend': layer.legend
         })
@@ -555,7 +749,120 @@ def vmap(layers,
             basemap=basemap,
             _carto_vl_path=_carto_vl_path,
             _airship_path=_airship_path)
-    return HTML(html)
+    return renderer.html(html)
+
+
+def _setup_aggregation(layer, context):
+    """Rewrites the query of `layer` so that it only selects the columns used
+    in its styling and, for point layers larger than the aggregation
+    threshold, aggregates the points into a zoom-dependent grid"""
+    columns = [
+        col for col in layer._get_style_columns()  # pylint: disable=protected-access
+        if col not in _GEOM_COLS and col != AGGREGATION_COUNT_COL
+    ]
+
+    column_types = {}
+    if columns:
+        resp = context.sql_client.send(
+            utils.minify_sql((
+                'SELECT {cols}',
+                'FROM ({query}) AS _wrap',
+                'LIMIT 0',
+            )).format(cols=','.join(columns), query=layer.orig_query),
+            do_post=False)
+        column_types = {
+            col: info['type'] for col, info in utils.dict_items(resp['fields'])
+        }
+
+    num_rows, geom_type = _get_layer_stats(layer.orig_query, context)
+    if (geom_type == 'ST_Point' and
+            num_rows > layer.aggregation['threshold']):
+        layer.query = _get_aggregated_query(
+            layer.orig_query,
+            [(col, column_types.get(col)) for col in columns],
+            layer.aggregation['resolution'])
+    else:
+        layer.query = _get_pruned_query(
+            layer.orig_query,
+            columns,
+            AGGREGATION_COUNT_COL in layer._get_style_columns())  # pylint: disable=protected-access
+
+
+def _get_layer_stats(query, context):
+    """Returns the planner estimate of the number of rows in `query` and the
+    type of its first non-null geometry"""
+    plan = context.sql_client.send(
+        'EXPLAIN (FORMAT JSON) {query}'.format(query=query),
+        do_post=False)['rows'][0]['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    num_rows = plan[0]['Plan']['Plan Rows']
+
+    resp = context.sql_client.send(
+        utils.minify_sql((
+            'SELECT ST_GeometryType(the_geom) AS geom_type',
+            'FROM ({query}) AS _wrap',
+            'WHERE the_geom IS NOT NULL',
+            'LIMIT 1',
+        )).format(query=query),
+        do_post=False)
+    geom_type = resp['rows'][0]['geom_type'] if resp['rows'] else None
+
+    return num_rows, geom_type
+
+
+def _get_pruned_query(query, columns, with_count=False):
+    """Query selecting only `columns` and the geometry columns of `query`"""
+    select_cols = list(_GEOM_COLS) + list(columns)
+    if with_count:
+        select_cols.append('1 AS {}'.format(AGGREGATION_COUNT_COL))
+    return utils.minify_sql((
+        'SELECT {cols}',
+        'FROM ({query}) AS _cf_pruned',
+    )).format(cols=', '.join(select_cols), query=query)
+
+
+def _get_aggregated_query(query, columns, resolution):
+    """Query snapping the points of `query` to a grid of `resolution` pixels
+    at the zoom level the tile is requested at. Numeric columns are averaged
+    and other columns keep their most common value.
+
+    Args:
+        query (str): Query with point geometries
+        columns (list of tuple): (column name, SQL API type) pairs
+        resolution (int): Grid cell size in pixels
+    """
+    aggregates = [
+        ('avg({col}) AS {col}' if col_type == 'number'
+         else 'mode() WITHIN GROUP (ORDER BY {col}) AS {col}').format(col=col)
+        for col, col_type in columns
+    ]
+    return utils.minify_sql((
+        'SELECT',
+        '    min(cartodb_id) AS cartodb_id,',
+        '    ST_Transform(',
+        '        ST_SetSRID(ST_MakePoint(_cf_x, _cf_y), 3857), 4326',
+        '    ) AS the_geom,',
+        '    ST_SetSRID(ST_MakePoint(_cf_x, _cf_y), 3857)',
+        '        AS the_geom_webmercator,',
+        '    {aggregates}',
+        '    count(*) AS {count_col}',
+        'FROM (',
+        '    SELECT',
+        '        *,',
+        '        (floor(ST_X(the_geom_webmercator) / ({res} * !pixel_width!))',
+        '         + 0.5) * {res} * !pixel_width! AS _cf_x,',
+        '        (floor(ST_Y(the_geom_webmercator) / ({res} * !pixel_height!))',
+        '         + 0.5) * {res} * !pixel_height! AS _cf_y',
+        '    FROM ({query}) AS _cf_wrap',
+        '    WHERE the_geom_webmercator IS NOT NULL',
+        ') AS _cf_grid',
+        'GROUP BY _cf_x, _cf_y',
+    )).format(
+        aggregates=''.join(agg + ', ' for agg in aggregates),
+        count_col=AGGREGATION_COUNT_COL,
+        res=resolution,
+        query=query)
 
 
 def _format_bounds(bounds):
@@ -1,10 +1,16 @@
 import binascii as ba
+import json
+import sys
+from collections import OrderedDict
 from warnings import warn
+import numpy as np
 import pandas as pd
 import time
 from tqdm import tqdm
 
-from .columns import Column, normalize_names, normalize_name
+from .arrow import ArrowSource
+from .columns import Column, Schema, normalize_names, normalize_name, DTYPE_BACKEND_NUMPY, DTYPE_BACKEND_COMPACT
+from .instrumentation import SPAN_ENCODE, SPAN_NORMALIZE, SPAN_SCHEMA, get_instrumentation, record_retry
 
 from carto.exceptions import CartoException, CartoRateLimitException
 
@@ -12,6 +18,25 @@ from carto.exceptions import CartoException, CartoRateLimitException
 tqdm(disable=True, total=0)  # initialise internal lock
 
 
+GEOM_FORMAT_WKB = 'wkb'
+GEOM_FORMAT_TWKB = 'twkb'
+GEOM_FORMAT_GEOJSON = 'geojson'
+GEOM_FORMATS = (GEOM_FORMAT_WKB, GEOM_FORMAT_TWKB, GEOM_FORMAT_GEOJSON, )
+# TWKB needs a precision, 6 decimals are ~10cm in WGS84
+DEFAULT_TWKB_PRECISION = 6
+
+# geometry types by shapely type id, linear rings are stored as lines
+GEOM_TYPE_NAMES = ['Point', 'LineString', 'LineString', 'Polygon', 'MultiPoint', 'MultiLineString',
+                   'MultiPolygon', 'GeometryCollection']
+# Multi* types that single geometries are promoted to when mixed with them
+MULTI_GEOM_TYPES = {
+    'Point': 'MultiPoint',
+    'LineString': 'MultiLineString',
+    'Polygon': 'MultiPolygon',
+}
+GENERIC_GEOM_TYPE = 'Geometry'
+
+
 class Dataset(object):
     FAIL = 'fail'
     REPLACE = 'replace'
@@ -23,21 +48,42 @@ class Dataset(object):
 
     DEFAULT_RETRY_TIMES = 3
 
+    # text columns whose distinct values are at most this fraction of the rows
+    # are read as categoricals with the `compact` dtype backend
+    CATEGORY_MAX_RATIO = 0.1
+    CATEGORY_SAMPLE_SIZE = 10000
+
+    # indexed with GiST instead of B-tree
+    GEOM_COLUMNS = ('the_geom', 'the_geom_webmercator', )
+
     def __init__(self, carto_context, table_name, schema='public', df=None):
         self.cc = carto_context
         self.table_name = normalize_name(table_name)
         self.schema = schema
         self.df = df
+        self.chunks = None
+        self.source = None
+        self._geom_type = None
         self.normalized_column_names = None
+        self.df_schema = None
         if self.df is not None:
             _save_index_as_column(self.df)
-            self.normalized_column_names = _normalize_column_names(self.df)
+            instrumentation = get_instrumentation(self.cc)
+            with instrumentation.span(SPAN_NORMALIZE, columns=len(self.df.columns)):
+                self.normalized_column_names = _normalize_column_names(self.df.columns)
+            with instrumentation.span(SPAN_SCHEMA, rows=len(self.df)):
+                self.df_schema = Schema.from_dataframe(self.df, self.normalized_column_names)
         if self.table_name != table_name:
             warn('Table will be named `{}`'.format(table_name))
 
     @staticmethod
     def create_from_query(cart_context, query, table_name):
         dataset = Dataset(cart_context, table_name)
+        bulk_load = getattr(dataset.cc, '_bulk_load', None)
+        if bulk_load is not None:
+            bulk_load.create_table(dataset, dataset._create_table_from_query(query), batch=True)
+            return dataset
+
         dataset.cc.batch_sql_client \
                .create_and_wait_for_completion(
                    '''BEGIN; {drop}; {create}; {cartodbfy}; COMMIT;'''
@@ -47,9 +93,47 @@ class Dataset(object):
 
         return dataset
 
-    def upload(self, with_lonlat=None, if_exists='fail'):
-        if self.df is None:
+    @staticmethod
+    def from_file(carto_context, source, table_name, schema='public', geom_col=None):
+        """Dataset to upload from a Parquet, Feather or CSV file, or from Arrow
+        data, streamed in record batches instead of loaded into a DataFrame.
+        See :py:class:`ArrowSource <cartoframes.arrow.ArrowSource>`."""
+        dataset = Dataset(carto_context, table_name, schema)
+        dataset.source = ArrowSource(source, geom_col=geom_col)
+        instrumentation = get_instrumentation(carto_context)
+        with instrumentation.span(SPAN_NORMALIZE, columns=len(dataset.source.column_names)):
+            dataset.normalized_column_names = _normalize_column_names(dataset.source.column_names)
+        with instrumentation.span(SPAN_SCHEMA):
+            dataset.df_schema = dataset.source.get_table_schema(dataset.normalized_column_names)
+        return dataset
+
+    @staticmethod
+    def from_chunks(carto_context, chunks, table_name, schema='public'):
+        """Dataset to upload from an iterator of DataFrames with the same
+        columns, like ``pandas.read_csv(..., chunksize=...)``. The table is
+        created from the first one, and all of them are streamed through a
+        single COPY, so only one chunk is in memory at a time. The geometries
+        of the rest must fit the geometry type of the first one, or a
+        ValueError is raised before sending them."""
+        chunks = iter(chunks)
+        try:
+            first = next(chunks)
+        except StopIteration:
+            raise ValueError('There are no DataFrames to upload')
+        dataset = Dataset(carto_context, table_name, schema, df=first)
+        dataset.chunks = chunks
+        return dataset
+
+    @staticmethod
+    def from_parquet(carto_context, path, table_name, schema='public', geom_col=None):
+        """Dataset to upload from a Parquet file, see :obj:`from_file`"""
+        return Dataset.from_file(carto_context, path, table_name, schema, geom_col)
+
+    def upload(self, with_lonlat=None, if_exists='fail', indexes=None, cluster_on=None, analyze=False):
+        if self.df is None and self.source is None:
             raise ValueError('You have to create a `Dataset` with a pandas DataFrame in order to upload it to CARTO')
+        if self.source is not None and with_lonlat is not None:
+            raise ValueError('`with_lonlat` is only supported when uploading DataFrames')
 
         if not self.exists():
             self._create_table(with_lonlat)
@@ -62,14 +146,36 @@ class Dataset(object):
                 self._create_table(with_lonlat)
 
         self._copyfrom(with_lonlat)
+        self._post_load(indexes, cluster_on, analyze)
 
         return self
 
-    def download(self, limit=None, decode_geom=False, retry_times=DEFAULT_RETRY_TIMES):
-        table_columns = self.get_table_columns()
-        query = self._get_read_query(table_columns, limit)
-
-        return self.cc.fetch(query, decode_geom=decode_geom)
+    def download(self, limit=None, decode_geom=False, retry_times=DEFAULT_RETRY_TIMES,
+                 dtype_backend=DTYPE_BACKEND_NUMPY, columns=None, where=None, order_by=None, sample=None,
+                 simplify_tolerance=None, precision=None, geom_format=GEOM_FORMAT_WKB, as_geodataframe=False,
+                 spill_to=None):
+        if spill_to is not None and (decode_geom or as_geodataframe or geom_format != GEOM_FORMAT_WKB):
+            raise ValueError('`spill_to` stores geometries as WKB, it is not compatible with '
+                             '`decode_geom`, `as_geodataframe` or other `geom_format`')
+
+        table_schema = self.get_table_columns()
+        read_schema = table_schema.select(
+            self._get_read_columns(table_schema, columns, decode_geom or as_geodataframe))
+        query = self._get_read_query(read_schema, limit, where=where, order_by=order_by, sample=sample,
+                                     simplify_tolerance=simplify_tolerance, precision=precision,
+                                     geom_format=geom_format)
+
+        if spill_to is not None:
+            # the Arrow types come from the query fields, more precise than the table ones
+            return self.cc._fetch_arrow(query, spill_to=spill_to)
+
+        category_columns = None
+        if dtype_backend == DTYPE_BACKEND_COMPACT:
+            category_columns = self._get_category_columns(read_schema, query)
+
+        return self.cc._fetch(query, decode_geom=decode_geom, schema=read_schema,
+                              dtype_backend=dtype_backend, category_columns=category_columns,
+                              geom_format=geom_format, as_geodataframe=as_geodataframe)
 
     def delete(self):
         if self.exists():
@@ -92,6 +198,11 @@ class Dataset(object):
             return False
 
     def _create_table(self, with_lonlat=None):
+        bulk_load = getattr(self.cc, '_bulk_load', None)
+        if bulk_load is not None:
+            bulk_load.create_table(self, self._create_table_query(with_lonlat, with_the_geom=True))
+            return
+
         job = self.cc.batch_sql_client \
                   .create_and_wait_for_completion(
                       '''BEGIN; {drop}; {create}; {cartodbfy}; COMMIT;'''
@@ -102,23 +213,114 @@ class Dataset(object):
         if job['status'] != 'done':
             raise CartoException('Cannot create table: {}.'.format(job['failed_reason']))
 
+    def _index_name(self, columns):
+        return '{table_name}_{columns}_idx'.format(table_name=self.table_name, columns='_'.join(columns))
+
+    def _get_table_column_name(self, column):
+        """Name in the table of the DataFrame or file `column`"""
+        if column in Column.RESERVED_COLUMN_NAMES:
+            return 'the_geom' if column in Column.SUPPORTED_GEOM_COL_NAMES else column
+        return dict((orig, norm) for norm, orig in self.normalized_column_names or ()).get(column, column)
+
+    def _get_index_columns(self, columns):
+        """Table column names of `columns`, a column name or a list of them"""
+        if not isinstance(columns, (list, tuple)):
+            columns = [columns]
+        return [self._get_table_column_name(column) for column in columns]
+
+    def _create_index_query(self, columns):
+        """B-tree index on `columns` (a column name or a list of them), or
+        GiST if it is a geometry column"""
+        columns = self._get_index_columns(columns)
+        method = 'gist' if any(column in Dataset.GEOM_COLUMNS for column in columns) else 'btree'
+        return 'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} USING {method} ({columns})'.format(
+            index_name=self._index_name(columns), table_name=self.table_name, method=method,
+            columns=', '.join(columns))
+
+    def _post_load_queries(self, indexes=None, cluster_on=None, analyze=False):
+        """Queries to index, cluster and analyze the table once loaded"""
+        queries = [self._create_index_query(columns) for columns in indexes or ()]
+        if cluster_on:
+            # CDB_CartodbfyTable already indexes the geometry columns, with the same naming
+            cluster_index_query = self._create_index_query(cluster_on)
+            if cluster_index_query not in queries:
+                queries.append(cluster_index_query)
+            queries.append('CLUSTER {table_name} USING {index_name}'.format(
+                table_name=self.table_name, index_name=self._index_name(self._get_index_columns(cluster_on))))
+        if analyze:
+            queries.append('ANALYZE {table_name}'.format(table_name=self.table_name))
+        return queries
+
+    def _post_load(self, indexes=None, cluster_on=None, analyze=False):
+        """Index, cluster and analyze the table after the data is copied,
+        which is faster than maintaining the indexes during the load"""
+        queries = self._post_load_queries(indexes, cluster_on, analyze)
+        if not queries:
+            return
+
+        bulk_load = getattr(self.cc, '_bulk_load', None)
+        if bulk_load is not None:
+            bulk_load.post_load(self, queries)
+            return
+
+        job = self.cc.batch_sql_client.create_and_wait_for_completion('; '.join(queries))
+        if job['status'] != 'done':
+            raise CartoException('Cannot index table: {}.'.format(job['failed_reason']))
+
     def _cartodbfy_query(self):
         return "SELECT CDB_CartodbfyTable('{org}', '{table_name}')" \
             .format(org=(self.cc.creds.username() if self.cc.is_org else 'public'),
                     table_name=self.table_name)
 
     def _copyfrom(self, with_lonlat=None):
+        if self.source is not None:
+            return self._copyfrom_source()
+
         geom_col = _get_geom_col_name(self.df)
 
-        columns = ','.join(norm for norm, orig in self.normalized_column_names)
+        columns = ','.join(self.df_schema.names)
         self.cc.copy_client.copyfrom(
             """COPY {table_name}({columns},the_geom)
                FROM stdin WITH (FORMAT csv, DELIMITER '|');""".format(table_name=self.table_name, columns=columns),
-            self._rows(self.df, [c for c in self.df.columns if c != 'cartodb_id'], with_lonlat, geom_col)
+            _CopyData(self._chunk_rows(with_lonlat, geom_col), len(self.df) if self.chunks is None else None)
+        )
+
+    def _iter_chunks(self):
+        """The DataFrame to upload followed by the rest of `chunks`, with the
+        same columns and dtypes"""
+        yield self.df
+        for chunk in self.chunks or ():
+            _save_index_as_column(chunk)
+            if list(chunk.columns) != list(self.df.columns):
+                raise ValueError('All the DataFrames to upload must have the same columns')
+            yield _conform_dtypes(chunk, self.df.dtypes)
+
+    def _chunk_rows(self, with_lonlat, geom_col):
+        cols = [c for c in self.df.columns if c != 'cartodb_id']
+        for df in self._iter_chunks():
+            for row in self._rows(df, cols, with_lonlat, geom_col):
+                yield row
+
+    def _copyfrom_source(self):
+        columns = list(self.df_schema.names)
+        if self.source.geom_col is not None:
+            columns.append('the_geom')
+        self.cc.copy_client.copyfrom(
+            """COPY {table_name}({columns})
+               FROM stdin WITH (FORMAT csv);""".format(table_name=self.table_name, columns=','.join(columns)),
+            _CopyData(self.source.iter_csv([orig for _, orig in self.normalized_column_names]),
+                      self.source.get_num_rows())
         )
 
     def _rows(self, df, cols, with_lonlat, geom_col):
-        for i, row in df.iterrows():
+        geoms = None
+        # with `with_lonlat`, the geometry column is replaced by the points
+        if geom_col is not None and not (with_lonlat and geom_col in Column.SUPPORTED_GEOM_COL_NAMES):
+            with get_instrumentation(self.cc).span(SPAN_ENCODE, rows=len(df)):
+                # the type was inferred from the first DataFrame only
+                geoms = _encode_geom_column(df[geom_col], self._get_geom_type(with_lonlat),
+                                            check_type=df is not self.df)
+        for i, (_, row) in enumerate(df.iterrows()):
             csv_row = ''
             the_geom_val = None
             lng_val = None
@@ -135,14 +337,12 @@ class Dataset(object):
                     if col == with_lonlat[1]:
                         lat_val = row[col]
                 if col == geom_col:
-                    the_geom_val = row[col]
+                    the_geom_val = geoms[i]
                 else:
                     csv_row += '{val}|'.format(val=val)
 
             if the_geom_val is not None:
-                geom = _decode_geom(the_geom_val)
-                if geom:
-                    csv_row += 'SRID=4326;{geom}'.format(geom=geom.wkt)
+                csv_row += the_geom_val
             if with_lonlat is not None and lng_val is not None and lat_val is not None:
                 csv_row += 'SRID=4326;POINT({lng} {lat})'.format(lng=lng_val, lat=lat_val)
 
@@ -158,16 +358,29 @@ class Dataset(object):
         create_query = '''CREATE TABLE {table_name} AS ({query})'''.format(table_name=self.table_name, query=query)
         return create_query
 
-    def _create_table_query(self, with_lonlat=None):
-        if with_lonlat is None:
-            geom_type = _get_geom_col_type(self.df)
-        else:
-            geom_type = 'Point'
+    def _get_geom_type(self, with_lonlat=None):
+        """Type of the geometry column of the table, from all the geometries
+        of the DataFrame to upload. Computed once, before creating the table"""
+        if self.source is not None:
+            return self.source.geom_type
+        if with_lonlat is not None:
+            return 'Point'
+        if self._geom_type is None:
+            with get_instrumentation(self.cc).span(SPAN_SCHEMA):
+                self._geom_type = _get_geom_col_type(self.df)
+        return self._geom_type
+
+    def _create_table_query(self, with_lonlat=None, with_the_geom=False):
+        """`with_the_geom` adds a generic `the_geom` column to tables without
+        geometries, which is otherwise added by `CDB_CartodbfyTable` before
+        the data is copied"""
+        geom_type = self._get_geom_type(with_lonlat)
+        if with_the_geom and not geom_type:
+            geom_type = GENERIC_GEOM_TYPE
 
         col = ('{col} {ctype}')
-        cols = ', '.join(col.format(col=norm,
-                                    ctype=_dtypes2pg(self.df.dtypes[orig]))
-                         for norm, orig in self.normalized_column_names)
+        cols = ', '.join(col.format(col=column.name, ctype=column.pgtype)
+                         for column in self.df_schema)
 
         if geom_type:
             cols += ', {geom_colname} geometry({geom_type}, 4326)'.format(geom_colname='the_geom', geom_type=geom_type)
@@ -175,15 +388,53 @@ class Dataset(object):
         create_query = '''CREATE TABLE {table_name} ({cols})'''.format(table_name=self.table_name, cols=cols)
         return create_query
 
-    def _get_read_query(self, table_columns, limit=None):
+    def _get_read_columns(self, table_columns, columns=None, decode_geom=False):
+        """Names of the columns to read: all of them but `the_geom_webmercator`
+        by default. If `columns` are given, `cartodb_id` is added to them, and
+        `the_geom` too when geometries are decoded"""
+        table_column_names = [column.name for column in table_columns]
+        if columns is None:
+            return [name for name in table_column_names if name != 'the_geom_webmercator']
+
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        missing_columns = [name for name in columns if name not in table_column_names]
+        if missing_columns:
+            raise ValueError('Columns not found in table `{table_name}`: {columns}'.format(
+                table_name=self.table_name, columns=', '.join(missing_columns)))
+
+        if decode_geom and 'the_geom' in table_column_names and 'the_geom' not in columns:
+            columns.append('the_geom')
+        if 'cartodb_id' in table_column_names and 'cartodb_id' not in columns:
+            columns.insert(0, 'cartodb_id')
+
+        return columns
+
+    def _get_read_query(self, table_columns, limit=None, where=None, order_by=None, sample=None,
+                        simplify_tolerance=None, precision=None, geom_format=GEOM_FORMAT_WKB):
         """Create the read (COPY TO) query"""
-        query_columns = [column.name for column in table_columns if column.name != 'the_geom_webmercator']
+        geom_column = _get_geom_read_column(simplify_tolerance, precision, geom_format)
+        query_columns = [geom_column if column.name == 'the_geom' else column.name
+                         for column in table_columns if column.name != 'the_geom_webmercator']
 
         query = 'SELECT {columns} FROM "{schema}"."{table_name}"'.format(
             table_name=self.table_name,
             schema=self.schema,
             columns=', '.join(query_columns))
 
+        if sample is not None:
+            if isinstance(sample, (int, float)) and not isinstance(sample, bool) and 0 < sample <= 1:
+                query += ' TABLESAMPLE BERNOULLI ({percent})'.format(percent=sample * 100)
+            else:
+                raise ValueError("`sample` parameter must be a number in the (0, 1] range")
+
+        if where:
+            query += ' WHERE {where}'.format(where=where)
+
+        if order_by:
+            if not isinstance(order_by, str):
+                order_by = ', '.join(order_by)
+            query += ' ORDER BY {order_by}'.format(order_by=order_by)
+
         if limit is not None:
             if isinstance(limit, int) and (limit >= 0):
                 query += ' LIMIT {limit}'.format(limit=limit)
@@ -202,7 +453,7 @@ class Dataset(object):
 
         try:
             table_info = self.cc.sql_client.send(query)
-            return [Column(c['column_name'], pgtype=c['data_type']) for c in table_info['rows']]
+            return Schema(Column(c['column_name'], pgtype=c['data_type']) for c in table_info['rows'])
         except CartoException as e:
             # this may happen when using the default_public API key
             if str(e) == 'Access denied':
@@ -212,6 +463,44 @@ class Dataset(object):
                 '''.format(table=self.table_name, schema=self.schema)
                 return get_columns(self.cc, query)
 
+    def _get_category_columns(self, table_schema, query):
+        """Text columns with few distinct values according to the table
+        statistics. Columns without statistics are checked on a sample."""
+        if not table_schema.text_columns:
+            return []
+
+        stats_query = '''
+            SELECT s.attname, s.n_distinct, c.reltuples
+            FROM pg_stats s
+            JOIN pg_namespace n ON n.nspname = s.schemaname
+            JOIN pg_class c ON c.relname = s.tablename AND c.relnamespace = n.oid
+            WHERE s.schemaname = '{schema}' AND s.tablename = '{table}'
+        '''.format(table=self.table_name, schema=self.schema)
+
+        try:
+            stats = {row['attname']: row for row in self.cc.sql_client.send(stats_query)['rows']}
+        except CartoException as err:
+            self.cc._debug_print(err=err)
+            stats = {}
+
+        category_columns = []
+        unknown_columns = []
+        for column in table_schema.text_columns:
+            if column not in stats:
+                unknown_columns.append(column)
+                continue
+            # negative n_distinct is the ratio of distinct values to rows
+            n_distinct = stats[column]['n_distinct']
+            rows = max(stats[column]['reltuples'], 1)
+            ratio = -n_distinct if n_distinct < 0 else n_distinct / float(rows)
+            if ratio <= Dataset.CATEGORY_MAX_RATIO:
+                category_columns.append(column)
+
+        if unknown_columns:
+            category_columns += get_category_columns(self.cc, query, unknown_columns)
+
+        return category_columns
+
     def get_table_column_names(self, exclude=None):
         """Get column names and types from a table"""
         columns = [c.name for c in self.get_table_columns()]
@@ -222,6 +511,98 @@ class Dataset(object):
         return columns
 
 
+class BulkLoad(object):
+    """Session to load several tables deferring `CDB_CartodbfyTable`.
+
+    Tables created while the session is active are created as plain tables
+    right away with the SQL API, and the data is copied into them. When the
+    session ends, all of them are cartodbfied (which adds `cartodb_id`,
+    `the_geom_webmercator` and builds their indexes) in a single Batch SQL
+    job, instead of one job per table before loading it. Tables created from
+    queries are still created with a Batch SQL job each, since the queries
+    can take longer than the SQL API timeout.
+
+    Use it through :py:meth:`CartoContext.bulk_load
+    <cartoframes.context.CartoContext.bulk_load>`.
+
+    Args:
+        carto_context (:py:class:`CartoContext <cartoframes.context.CartoContext>`):
+          Context the tables are loaded with.
+    """
+    def __init__(self, carto_context):
+        self.cc = carto_context
+        self.datasets = []
+        # deferred indexing queries by table name
+        self.post_load_queries = OrderedDict()
+
+    def __enter__(self):
+        if getattr(self.cc, '_bulk_load', None) is not None:
+            raise CartoException('There is already a bulk load in progress')
+        self.cc._bulk_load = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cc._bulk_load = None
+        # the tables loaded so far are left as they are if the load failed
+        if exc_type is None:
+            self.cartodbfy()
+
+    def create_table(self, dataset, create_query, batch=False):
+        """Drop and create the table of `dataset` with `create_query`, and
+        defer its cartodbfication. Indexing queries deferred for a previous
+        table with the same name are dropped along with it.
+
+        The table is created with the SQL API, or with a Batch SQL job if
+        `batch` is set, for queries like ``CREATE TABLE ... AS`` that can take
+        longer than the SQL API timeout."""
+        query = 'BEGIN; {drop}; {create}; COMMIT;'.format(
+            drop=dataset._drop_table_query(),
+            create=create_query)
+        if batch:
+            job = self.cc.batch_sql_client.create_and_wait_for_completion(query)
+            if job['status'] != 'done':
+                raise CartoException('Cannot create table: {}.'.format(job['failed_reason']))
+        else:
+            self.cc.sql_client.send(query)
+        self.datasets = [loaded for loaded in self.datasets if loaded.table_name != dataset.table_name]
+        self.datasets.append(dataset)
+        self.post_load_queries.pop(dataset.table_name, None)
+
+    def post_load(self, dataset, queries):
+        """Defer the indexing `queries` of the table of `dataset` until it is
+        cartodbfied"""
+        self.post_load_queries.setdefault(dataset.table_name, []).extend(queries)
+
+    def cartodbfy(self):
+        """Cartodbfy all the tables created in the session, and then run the
+        deferred indexing queries, in one Batch SQL job"""
+        queries = []
+        if self.datasets:
+            queries.append('BEGIN; {cartodbfy}; COMMIT'.format(
+                cartodbfy='; '.join(dataset._cartodbfy_query() for dataset in self.datasets)))
+        for table_queries in self.post_load_queries.values():
+            queries.extend(table_queries)
+        if not queries:
+            return
+
+        job = self.cc.batch_sql_client.create_and_wait_for_completion('; '.join(queries) + ';')
+        if job['status'] != 'done':
+            raise CartoException('Cannot cartodbfy tables: {}.'.format(job['failed_reason']))
+        self.datasets = []
+        self.post_load_queries = OrderedDict()
+
+
+class _CopyData(object):
+    """CSV chunks to COPY into a table, with the number of rows they hold if
+    known, to report the progress of the upload"""
+    def __init__(self, chunks, total_rows=None):
+        self.chunks = chunks
+        self.total_rows = total_rows
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
 def recursive_read(context, query, retry_times=Dataset.DEFAULT_RETRY_TIMES):
     try:
         return context.copy_client.copyto_stream(query)
@@ -230,6 +611,7 @@ def recursive_read(context, query, retry_times=Dataset.DEFAULT_RETRY_TIMES):
             retry_times -= 1
             warn('Read call rate limited. Waiting {s} seconds'.format(s=err.retry_after))
             time.sleep(err.retry_after)
+            record_retry(context, err.retry_after)
             warn('Retrying...')
             return recursive_read(context, query, retry_times=retry_times)
         else:
@@ -241,19 +623,80 @@ def recursive_read(context, query, retry_times=Dataset.DEFAULT_RETRY_TIMES):
 def get_columns(context, query):
     col_query = '''SELECT * FROM ({query}) _q LIMIT 0'''.format(query=query)
     table_info = context.sql_client.send(col_query)
-    return Column.from_sql_api_fields(table_info['fields'])
+    return Schema.from_sql_api_fields(table_info['fields'])
+
+
+def get_category_columns(context, query, column_names, sample_size=Dataset.CATEGORY_SAMPLE_SIZE):
+    """Columns of `query` with few distinct values in a sample of its rows"""
+    if not column_names:
+        return []
+
+    sample_query = '''
+        SELECT {counts}, count(*) AS _cf_sample_size
+        FROM (SELECT * FROM ({query}) _q LIMIT {sample_size}) _sample
+    '''.format(counts=', '.join('count(DISTINCT "{col}") AS "{col}"'.format(col=col) for col in column_names),
+               query=query,
+               sample_size=sample_size)
+    counts = context.sql_client.send(sample_query)['rows'][0]
+
+    sample_rows = max(counts['_cf_sample_size'], 1)
+    return [col for col in column_names
+            if counts[col] / float(sample_rows) <= Dataset.CATEGORY_MAX_RATIO]
+
+
+def _get_geom_read_column(simplify_tolerance=None, precision=None, geom_format=GEOM_FORMAT_WKB):
+    """Expression to read `the_geom`, simplified with `simplify_tolerance`,
+    with `precision` decimal digits and encoded as `geom_format`"""
+    if geom_format not in GEOM_FORMATS:
+        raise ValueError('`geom_format` must be one of {}'.format(', '.join(GEOM_FORMATS)))
+    if precision is not None and not (isinstance(precision, int) and 0 <= precision <= 15):
+        raise ValueError('`precision` must be an integer between 0 and 15')
+
+    geom = 'the_geom'
+    if simplify_tolerance:
+        geom = 'ST_SimplifyPreserveTopology({geom}, {tolerance})'.format(geom=geom, tolerance=simplify_tolerance)
+
+    if geom_format == GEOM_FORMAT_TWKB:
+        geom = 'ST_AsTWKB({geom}, {precision})'.format(
+            geom=geom, precision=DEFAULT_TWKB_PRECISION if precision is None else precision)
+    elif geom_format == GEOM_FORMAT_GEOJSON:
+        geom = 'ST_AsGeoJSON({geom}{precision})'.format(
+            geom=geom, precision='' if precision is None else ', {}'.format(precision))
+    elif precision is not None:
+        geom = 'ST_QuantizeCoordinates({geom}, {precision})'.format(geom=geom, precision=precision)
+
+    return geom if geom == 'the_geom' else '{geom} AS the_geom'.format(geom=geom)
 
 
 def _save_index_as_column(df):
     index_name = df.index.name
     if index_name is not None:
         if index_name not in df.columns:
-            df.reset_index(inplace=True)
-            df.set_index(index_name, drop=False, inplace=True)
+            # inserting a column keeps the index (and a GeoDataFrame spatial index) untouched
+            df.insert(0, index_name, df.index)
+
+
+def _conform_dtypes(df, dtypes):
+    """Cast the columns of `df` to `dtypes`, so they are written like the
+    columns of the table created for them. Integer columns with nulls, which
+    pandas reads as floats, are cast to nullable integers."""
+    for col, dtype in dtypes.items():
+        if df[col].dtype == dtype:
+            continue
+        target = dtype
+        if (pd.api.types.is_integer_dtype(dtype) and df[col].isnull().any() and
+                hasattr(pd, 'Int64Dtype')):
+            target = 'Int64'
+        try:
+            df[col] = df[col].astype(target)
+        except (TypeError, ValueError):
+            raise ValueError('Column `{col}` is {dtype} in the first DataFrame but {other} in a later one'
+                             .format(col=col, dtype=dtype, other=df[col].dtype))
+    return df
 
 
-def _normalize_column_names(df):
-    column_names = [c for c in df.columns if c not in Column.RESERVED_COLUMN_NAMES]
+def _normalize_column_names(columns):
+    column_names = [c for c in columns if c not in Column.RESERVED_COLUMN_NAMES]
     normalized_columns = normalize_names(column_names)
 
     column_tuples = [(norm, orig) for orig, norm in zip(column_names, normalized_columns)]
@@ -271,23 +714,15 @@ def _normalize_column_names(df):
     return column_tuples
 
 
-def _dtypes2pg(dtype):
-    """Returns equivalent PostgreSQL type for input `dtype`"""
-    mapping = {
-        'float64': 'numeric',
-        'int64': 'integer',
-        'float32': 'numeric',
-        'int32': 'integer',
-        'object': 'text',
-        'bool': 'boolean',
-        'datetime64[ns]': 'timestamp',
-        'datetime64[ns, UTC]': 'timestamp',
-    }
-    return mapping.get(str(dtype), 'text')
+def _is_geopandas(obj, class_name):
+    """Whether `obj` is a geopandas `class_name` (GeoDataFrame or GeoSeries),
+    without importing geopandas: if it is not imported, `obj` can't be one"""
+    geopandas = sys.modules.get('geopandas')
+    return geopandas is not None and isinstance(obj, getattr(geopandas, class_name))
 
 
 def _get_geom_col_name(df):
-    geom_col = getattr(df, '_geometry_column_name', None)
+    geom_col = df.geometry.name if _is_geopandas(df, 'GeoDataFrame') else None
     if geom_col is None:
         try:
             geom_col = next(x for x in df.columns if x.lower() in Column.SUPPORTED_GEOM_COL_NAMES)
@@ -298,32 +733,24 @@ def _get_geom_col_name(df):
 
 
 def _get_geom_col_type(df):
+    """Type of the geometry column of the table for `df`, from all its
+    geometries (see :obj:`_infer_geom_type`)"""
     geom_col = _get_geom_col_name(df)
     if geom_col is None:
         return None
 
-    try:
-        geom = _decode_geom(_first_not_null_value(df, geom_col))
-    except IndexError:
+    geom_type = _infer_geom_type(_get_geoms(df[geom_col]))
+    if geom_type is None:
         warn('Dataset with null geometries')
-        geom = None
-
-    if geom is None:
-        return None
-
-    return geom.geom_type
-
-
-def _first_not_null_value(df, col):
-    return df[col].loc[~df[col].isnull()].iloc[0]
+    return geom_type
 
 
 def _encode_decode_decorator(func):
     """decorator for encoding and decoding geoms"""
-    def wrapper(*args):
+    def wrapper(*args, **kwargs):
         """error catching"""
         try:
-            processed_geom = func(*args)
+            processed_geom = func(*args, **kwargs)
             return processed_geom
         except ImportError as err:
             raise ImportError('The Python package `shapely` needs to be '
@@ -360,3 +787,328 @@ def _decode_geom(ewkb):
                         except Exception:
                             pass
     return None
+
+
+@_encode_decode_decorator
+def _decode_geojson(geojson):
+    """Decode a GeoJSON geometry into a shapely geometry"""
+    from shapely.geometry import shape
+    if not geojson:
+        return None
+    return shape(json.loads(geojson))
+
+
+def _read_varint(data, pos):
+    """Read an unsigned varint from `data` at `pos`, returns it and the next position"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _read_zigzag(data, pos):
+    """Read a signed (zigzag encoded) varint"""
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _parse_twkb(data, pos=0):
+    """Parse a TWKB geometry starting at `pos`. Returns the shapely geometry
+    (or None if empty) and the position where it ends"""
+    from shapely.geometry import (Point, LineString, Polygon, MultiPoint,
+                                  MultiLineString, MultiPolygon,
+                                  GeometryCollection)
+
+    geom_type = data[pos] & 0x0f
+    precision = (data[pos] >> 4)
+    precision = (precision >> 1) ^ -(precision & 1)
+    metadata = data[pos + 1]
+    pos += 2
+
+    has_bbox = metadata & 0x01
+    has_size = metadata & 0x02
+    has_idlist = metadata & 0x04
+    has_extended_dims = metadata & 0x08
+    is_empty = metadata & 0x10
+
+    scales = [10.0 ** precision] * 2
+    if has_extended_dims:
+        dims = data[pos]
+        pos += 1
+        if dims & 0x01:
+            scales.append(10.0 ** ((dims >> 2) & 0x07))
+        if dims & 0x02:
+            scales.append(10.0 ** ((dims >> 5) & 0x07))
+    ndims = len(scales)
+
+    if has_size:
+        _, pos = _read_varint(data, pos)
+    if has_bbox:
+        for _ in range(2 * ndims):
+            _, pos = _read_zigzag(data, pos)
+    if is_empty:
+        return None, pos
+
+    # coordinates are deltas from the previous point of the geometry
+    last = [0] * ndims
+
+    def read_point(pos):
+        for dim in range(ndims):
+            delta, pos = _read_zigzag(data, pos)
+            last[dim] += delta
+        return tuple(value / scale for value, scale in zip(last, scales)), pos
+
+    def read_points(pos):
+        npoints, pos = _read_varint(data, pos)
+        points = []
+        for _ in range(npoints):
+            point, pos = read_point(pos)
+            points.append(point)
+        return points, pos
+
+    def read_rings(pos):
+        nrings, pos = _read_varint(data, pos)
+        rings = []
+        for _ in range(nrings):
+            ring, pos = read_points(pos)
+            rings.append(ring)
+        return rings, pos
+
+    def read_parts(pos):
+        nparts, pos = _read_varint(data, pos)
+        if has_idlist:
+            for _ in range(nparts):
+                _, pos = _read_zigzag(data, pos)
+        return nparts, pos
+
+    if geom_type == 1:
+        point, pos = read_point(pos)
+        return Point(point), pos
+    if geom_type == 2:
+        points, pos = read_points(pos)
+        return LineString(points), pos
+    if geom_type == 3:
+        rings, pos = read_rings(pos)
+        return Polygon(rings[0], rings[1:]), pos
+
+    nparts, pos = read_parts(pos)
+    parts = []
+    for _ in range(nparts):
+        if geom_type == 4:
+            point, pos = read_point(pos)
+            parts.append(point)
+        elif geom_type == 5:
+            points, pos = read_points(pos)
+            parts.append(LineString(points))
+        elif geom_type == 6:
+            rings, pos = read_rings(pos)
+            parts.append(Polygon(rings[0], rings[1:]))
+        elif geom_type == 7:
+            part, pos = _parse_twkb(data, pos)
+            if part is not None:
+                parts.append(part)
+        else:
+            raise ValueError('Unknown TWKB geometry type {}'.format(geom_type))
+
+    if geom_type == 4:
+        return MultiPoint(parts), pos
+    if geom_type == 5:
+        return MultiLineString(parts), pos
+    if geom_type == 6:
+        return MultiPolygon(parts), pos
+    return GeometryCollection(parts), pos
+
+
+@_encode_decode_decorator
+def _decode_twkb(twkb):
+    """Decode TWKB, as output by PostgreSQL for `bytea` values (hex with a
+    leading `\\x`) or raw bytes, into a shapely geometry"""
+    if not twkb:
+        return None
+    if not isinstance(twkb, (bytes, bytearray)):
+        twkb = ba.unhexlify(twkb[2:] if twkb.startswith('\\x') else twkb)
+    return _parse_twkb(bytearray(twkb))[0]
+
+
+def _decode_geom_column(series, geom_format=GEOM_FORMAT_WKB):
+    """Decode a column of `geom_format` geometries into an array of shapely
+    geometries, in a single vectorized call when shapely>=2.0 is available.
+    Values it can't decode are decoded one by one, like without shapely>=2.0
+    (WKT in a WKB column is decoded, and other invalid WKB is ``None``)"""
+    import shapely
+    values = np.array(series, dtype=object)
+    values[np.asarray(series.isnull() | (series == ''))] = None
+    decoder = GEOM_DECODERS[geom_format]
+
+    if geom_format == GEOM_FORMAT_WKB and hasattr(shapely, 'from_wkb'):
+        geoms = shapely.from_wkb(values, on_invalid='ignore')
+    elif geom_format == GEOM_FORMAT_GEOJSON and hasattr(shapely, 'from_geojson'):
+        geoms = shapely.from_geojson(values, on_invalid='ignore')
+    else:
+        return np.array([decoder(value) for value in values], dtype=object)
+
+    for i in np.flatnonzero(shapely.is_missing(geoms) & (values != None)):  # noqa: E711
+        geoms[i] = decoder(values[i])
+    return geoms
+
+
+def _get_geoms(series):
+    """Geometries of a column as an object array of shapely geometries, with
+    ``None`` for nulls. GeoSeries are reprojected to EPSG:4326 if needed, and
+    values other than shapely geometries (WKB, WKT) are decoded one by one."""
+    if _is_geopandas(series, 'GeoSeries'):
+        crs = series.crs
+        if crs is not None and getattr(crs, 'to_epsg', lambda: 4326)() != 4326:
+            series = series.to_crs(epsg=4326)
+
+    values = np.asarray(series, dtype=object)
+    import shapely
+    if hasattr(shapely, 'is_valid_input') and shapely.is_valid_input(values).all():
+        return values
+
+    geoms = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        geoms[i] = _decode_geom(value) if value is not None else None
+    return geoms
+
+
+def _get_geom_stats(geoms):
+    """Distinct geometry types and SRIDs, and whether all / any of the
+    not null geometries have Z coordinates"""
+    import shapely
+    if hasattr(shapely, 'get_type_id'):
+        geoms = geoms[~shapely.is_missing(geoms)]
+        types = {GEOM_TYPE_NAMES[type_id] for type_id in np.unique(shapely.get_type_id(geoms))}
+        srids = set(np.unique(shapely.get_srid(geoms)).tolist())
+        has_z = shapely.has_z(geoms)
+    else:
+        geoms = [geom for geom in geoms if geom is not None]
+        types = {'LineString' if geom.geom_type == 'LinearRing' else geom.geom_type for geom in geoms}
+        srids = set()
+        has_z = np.array([geom.has_z for geom in geoms], dtype=bool)
+    return types, srids, len(has_z) > 0 and bool(has_z.all()), bool(has_z.any())
+
+
+def _infer_geom_type(geoms):
+    """Type of a geometry column that fits all of `geoms`: their type if
+    they share it, the Multi* type of a mix of single and multi geometries of
+    the same kind, or the generic `Geometry`. ``None`` if all are null.
+
+    Raises:
+        ValueError: If the geometries mix 2D and 3D, or have SRIDs other than
+          4326, since the table could not store them.
+    """
+    types, srids, all_z, any_z = _get_geom_stats(geoms)
+    if not types:
+        return None
+    if srids - {0, 4326}:
+        raise ValueError('Geometries must be in EPSG:4326, found SRIDs {}'.format(
+            ', '.join(str(srid) for srid in sorted(srids - {0, 4326}))))
+    if any_z and not all_z:
+        raise ValueError('Geometries mix 2D and 3D coordinates, they cannot be written to the same column')
+
+    multi_types = {MULTI_GEOM_TYPES.get(geom_type, geom_type) for geom_type in types}
+    if len(types) == 1:
+        geom_type = types.pop()
+    elif len(multi_types) == 1 and next(iter(multi_types)) in MULTI_GEOM_TYPES.values():
+        geom_type = multi_types.pop()
+    else:
+        geom_type = GENERIC_GEOM_TYPE
+    return geom_type + 'Z' if all_z else geom_type
+
+
+def _promote_geoms(geoms, geom_type):
+    """Turn the single geometries of `geoms` into the Multi* `geom_type`"""
+    import shapely
+    multi_type = geom_type.rstrip('Z')
+    single_type = next((single for single, multi in MULTI_GEOM_TYPES.items() if multi == multi_type), None)
+    if single_type is None:
+        return geoms
+
+    # LinearRing is a LineString too
+    single_type_ids = [type_id for type_id, name in enumerate(GEOM_TYPE_NAMES) if name == single_type]
+    if hasattr(shapely, 'get_type_id'):
+        singles = np.isin(shapely.get_type_id(geoms), single_type_ids)
+        if singles.any():
+            geoms = geoms.copy()
+            to_multi = getattr(shapely, multi_type.lower() + 's')
+            geoms[singles] = to_multi(geoms[singles], indices=np.arange(singles.sum()))
+        return geoms
+
+    from shapely import geometry
+    promoted = np.empty(len(geoms), dtype=object)
+    for i, geom in enumerate(geoms):
+        is_single = geom is not None and (
+            'LineString' if geom.geom_type == 'LinearRing' else geom.geom_type) == single_type
+        promoted[i] = getattr(geometry, multi_type)([geom]) if is_single else geom
+    return promoted
+
+
+def _check_geom_type(geoms, geom_type):
+    """Check that `geoms` can be written to a column of `geom_type`, or to
+    the generic column added by `CDB_CartodbfyTable` if it is ``None``
+
+    Raises:
+        ValueError: If they can't, or they can't be written to any column
+          (see :obj:`_infer_geom_type`).
+    """
+    geoms_type = _infer_geom_type(geoms)
+    geom_type = geom_type or GENERIC_GEOM_TYPE
+    if geoms_type is None:
+        return
+    base_type, base_geoms_type = geom_type.rstrip('Z'), geoms_type.rstrip('Z')
+    if (geom_type.endswith('Z') == geoms_type.endswith('Z') and
+            base_type in (GENERIC_GEOM_TYPE, base_geoms_type, MULTI_GEOM_TYPES.get(base_geoms_type))):
+        return
+    raise ValueError('Geometries of type {geoms_type} cannot be written to the column of type {geom_type} created '
+                     'from the first DataFrame, which must have geometries of all the types and dimensions of the '
+                     'rest'.format(geoms_type=geoms_type, geom_type=geom_type))
+
+
+@_encode_decode_decorator
+def _encode_geom_column(series, geom_type=None, check_type=False):
+    """Encode a column of geometries as EWKB hex with SRID 4326, the text
+    input format of PostGIS geometries, or ``None`` for null geometries.
+    Single geometries are promoted if `geom_type` is a Multi* type, and if
+    `check_type` is set, geometries that don't fit it raise a ValueError.
+
+    Columns of shapely geometries are encoded in one vectorized call with
+    shapely>=2.0."""
+    geoms = _get_geoms(series)
+    if check_type:
+        _check_geom_type(geoms, geom_type)
+    if geom_type is not None:
+        geoms = _promote_geoms(geoms, geom_type)
+
+    import shapely
+    if hasattr(shapely, 'to_wkb'):
+        return shapely.to_wkb(shapely.set_srid(geoms, 4326), hex=True, include_srid=True).tolist()
+    return ['SRID=4326;{geom}'.format(geom=geom.wkt) if geom else None for geom in geoms]
+
+
+def to_geodataframe(df, geom_format=GEOM_FORMAT_WKB):
+    """GeoDataFrame from a DataFrame read from CARTO, with its `the_geom`
+    column decoded into a `geometry` column with CRS EPSG:4326"""
+    try:
+        import geopandas
+    except ImportError:
+        raise ImportError('The Python package `geopandas` needs to be installed '
+                          'to read GeoDataFrames. Install it with `pip install geopandas`')
+
+    if 'the_geom' in df:
+        df['the_geom'] = geopandas.GeoSeries(_decode_geom_column(df['the_geom'], geom_format), index=df.index)
+        df.rename({'the_geom': 'geometry'}, axis='columns', inplace=True)
+        return geopandas.GeoDataFrame(df, geometry='geometry', crs='epsg:4326')
+    return geopandas.GeoDataFrame(df)
+
+
+GEOM_DECODERS = {
+    GEOM_FORMAT_WKB: _decode_geom,
+    GEOM_FORMAT_TWKB: _decode_twkb,
+    GEOM_FORMAT_GEOJSON: _decode_geojson,
+}
@@ -0,0 +1,167 @@
+"""Renderers of the maps made by :py:meth:`CartoContext.map
+<cartoframes.context.CartoContext.map>` and :py:func:`vector.vmap
+<cartoframes.contrib.vector.vmap>`: interactive maps are HTML documents,
+static maps PNG images. A renderer turns them into what those functions
+return.
+
+- ``'notebook'`` (:py:class:`NotebookRenderer`), the default: IPython
+  display objects, or matplotlib Axes for static maps if matplotlib is
+  installed.
+- ``'raw'`` (:py:class:`RawRenderer`): HTML as a ``str`` and images as PNG
+  ``bytes``, without importing IPython or matplotlib.
+- A binary file-like object (:py:class:`StreamRenderer`): the HTML (UTF-8)
+  or image is written to it.
+
+Example:
+
+    Serve a map from a web service.
+
+    .. code:: python
+
+        html = cc.map(layers, renderer='raw')
+        png = cc.map(layers, interactive=False, renderer='raw')
+
+    Write it to a file.
+
+    .. code:: python
+
+        with open('map.html', 'wb') as f:
+            cc.map(layers, renderer=f)
+"""
+import sys
+
+RENDERER_NOTEBOOK = 'notebook'
+RENDERER_RAW = 'raw'
+RENDERERS = (RENDERER_NOTEBOOK, RENDERER_RAW, )
+
+
+class Renderer(object):
+    """Base class of the renderers"""
+    def html(self, html):
+        """Render the HTML document `html` (str) of an interactive map"""
+        raise NotImplementedError()
+
+    def image(self, data, url, size, ax=None):
+        """Render a static map image
+
+        Args:
+            data (bytes): PNG image.
+            url (str): URL of the image in the CARTO Static Maps API, or
+              ``None`` if it was drawn locally.
+            size (tuple): Width and height of the image, in pixels.
+            ax (matplotlib.axes.Axes, optional): Axis to draw the image on.
+        """
+        raise NotImplementedError()
+
+    def axes(self, ax, size):
+        """Render a static map drawn locally with matplotlib on `ax`. By
+        default, its PNG image is rendered with :obj:`image`."""
+        from .render import to_png
+        return self.image(to_png(ax), None, size)
+
+
+class RawRenderer(Renderer):
+    """Renders maps as an HTML ``str`` or PNG ``bytes``"""
+    def html(self, html):
+        return html
+
+    def image(self, data, url, size, ax=None):
+        return data
+
+
+class StreamRenderer(Renderer):
+    """Writes maps to the binary file-like `stream`, and returns the number
+    of bytes written"""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def html(self, html):
+        return self._write(html.encode('utf-8'))
+
+    def image(self, data, url, size, ax=None):
+        return self._write(data)
+
+    def _write(self, data):
+        self.stream.write(data)
+        return len(data)
+
+
+class NotebookRenderer(Renderer):
+    """Renders maps as ``IPython.display.HTML`` objects, and static maps as
+    matplotlib Axes if `use_matplotlib` is set and matplotlib can be
+    imported, or ``IPython.display.Image`` objects otherwise. Without
+    IPython, maps are rendered like :py:class:`RawRenderer` does."""
+    def __init__(self, use_matplotlib=True):
+        self.use_matplotlib = use_matplotlib
+
+    def html(self, html):
+        try:
+            from IPython.display import HTML
+        except ImportError:
+            return html
+        return HTML(html)
+
+    def image(self, data, url, size, ax=None):
+        plt, mpi = _import_matplotlib() if self.use_matplotlib else (None, None)
+        if plt is not None:
+            from io import BytesIO
+            raw_data = mpi.imread(BytesIO(data), format='png')
+            if ax is None:
+                dpi = plt.rcParams['figure.dpi']
+                mpl_size = (size[0] / dpi, size[1] / dpi)
+                fig = plt.figure(figsize=mpl_size, dpi=dpi, frameon=False)
+                fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+                ax = plt.gca()
+            ax.imshow(raw_data)
+            ax.axis('off')
+            return ax
+
+        try:
+            from IPython.display import Image
+        except ImportError:
+            return data
+        return Image(data=data,
+                     format='png',
+                     width=size[0],
+                     height=size[1],
+                     metadata=dict(origin_url=url))
+
+    def axes(self, ax, size):
+        return ax
+
+
+def get_renderer(renderer=None, use_matplotlib=True):
+    """:py:class:`Renderer` for the `renderer` argument of the map functions
+
+    Args:
+        renderer (str, Renderer or file-like, optional): One of
+          ``'notebook'`` or ``'raw'``, a :py:class:`Renderer`, or a binary
+          stream to write to. Defaults to ``'notebook'``.
+        use_matplotlib (bool, optional): Whether the notebook renderer draws
+          static maps with matplotlib.
+    """
+    if isinstance(renderer, Renderer):
+        return renderer
+    if renderer is None or renderer == RENDERER_NOTEBOOK:
+        return NotebookRenderer(use_matplotlib=use_matplotlib)
+    if renderer == RENDERER_RAW:
+        return RawRenderer()
+    if hasattr(renderer, 'write'):
+        return StreamRenderer(renderer)
+    raise ValueError('`renderer` must be one of {}, a Renderer or a file-like object'.format(
+        ', '.join('`{}`'.format(name) for name in RENDERERS)))
+
+
+def _import_matplotlib():
+    """matplotlib's pyplot and image modules, or ``None`` if they can't be
+    imported"""
+    first_import = 'matplotlib.pyplot' not in sys.modules
+    try:
+        import matplotlib.image as mpi
+        import matplotlib.pyplot as plt
+    except (ImportError, RuntimeError):
+        return None, None
+    if first_import:
+        # set dpi based on CARTO Static Maps API dpi
+        plt.rcParams['figure.dpi'] = 72.0
+    return plt, mpi
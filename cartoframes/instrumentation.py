@@ -0,0 +1,295 @@
+"""Instrumentation of the operations of a :py:class:`CartoContext
+<cartoframes.context.CartoContext>`.
+
+Every public operation (``read``, ``write``, ``fetch``, ``query``,
+``execute``, ``map``...), SQL API request, COPY stream, Batch SQL job,
+geometry encoding and decoding, and every HTTP request sent to CARTO, is
+recorded as a :py:class:`Span`: its name, wall time, parent span and
+attributes like the bytes sent and received, the rows, the retries and the
+time waited because of rate limits.
+
+Hooks registered with :py:meth:`CartoContext.add_hook
+<cartoframes.context.CartoContext.add_hook>` get the spans when they start
+and end, to feed them to a metrics pipeline. Exceptions raised by hooks are
+turned into warnings, so they don't break the operations.
+
+Example:
+
+    .. code:: python
+
+        from cartoframes import CartoContext
+        cc = CartoContext(BASEURL, APIKEY)
+        cc.add_hook(lambda span: print(span.name, span.duration, span.attributes))
+        cc.read('my_table')
+
+Spans can be exported to OpenTelemetry with :py:class:`OpenTelemetryHook`.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from warnings import warn
+
+# Names of the spans
+SPAN_HTTP = 'http'
+SPAN_SQL = 'sql'
+SPAN_COPYFROM = 'copyfrom'
+SPAN_COPYTO = 'copyto'
+SPAN_BATCH_JOB = 'batch_job'
+SPAN_ENCODE = 'encode'
+SPAN_DECODE = 'decode'
+SPAN_NORMALIZE = 'normalize_names'
+SPAN_SCHEMA = 'schema'
+
+
+class Span(object):
+    """A timed operation
+
+    Attributes:
+        span_id (int): Unique id of the span.
+        name (str): Operation, like ``'read'``, ``'sql'``, ``'copyfrom'`` or
+          ``'http'``.
+        parent (:py:class:`Span`): Span of the operation this one is part of,
+          or ``None``.
+        attributes (dict): Details of the operation. Depending on it,
+          ``bytes_sent``, ``bytes_received``, ``rows``, ``retries``,
+          ``rate_limit_wait`` (seconds), ``query``, ``api``, ``status``...
+        start (float): Start time, in seconds since the epoch.
+        end (float): End time, or ``None`` while running.
+        error (str): Representation of the exception that ended the
+          operation, if any.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.span_id = next(Span._ids)
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """Wall time in seconds, up to now if the span is running"""
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def set(self, key, value):
+        """Set the attribute `key`"""
+        self.attributes[key] = value
+
+    def add(self, key, value=1):
+        """Add `value` to the counter attribute `key`"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self):
+        """The span as a flat dict, for logs and metrics"""
+        data = {
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'name': self.name,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'error': self.error,
+        }
+        data.update(self.attributes)
+        return data
+
+    def __repr__(self):
+        return 'Span(name={}, duration={:.3f}, attributes={})'.format(self.name, self.duration, self.attributes)
+
+
+class Hook(object):
+    """Receiver of the spans of a context. Subclasses override
+    :py:meth:`on_start`, :py:meth:`on_end` or both, and
+    :py:meth:`on_progress` to follow COPY transfers while they run. Plain
+    functions can also be used as hooks, they are called when spans end."""
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+    def on_progress(self, span, data):
+        """Called with each chunk of CSV `data` sent by a ``copyfrom`` span
+        or received by a ``copyto`` one. It runs in the transfer loop, so it
+        should return quickly."""
+        pass
+
+
+class _FunctionHook(Hook):
+    def __init__(self, function):
+        self.function = function
+
+    def on_end(self, span):
+        self.function(span)
+
+
+class Instrumentation(object):
+    """Spans and hooks of a context"""
+    def __init__(self):
+        self.hooks = []
+        self._local = threading.local()
+
+    def add_hook(self, hook):
+        """Register `hook`, a :py:class:`Hook` or a function called with each
+        span when it ends. Returns the registered hook."""
+        if not isinstance(hook, Hook):
+            hook = _FunctionHook(hook)
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        """Unregister `hook`, or the hook created for the function `hook`"""
+        self.hooks = [registered for registered in self.hooks
+                      if registered is not hook and getattr(registered, 'function', None) != hook]
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self):
+        """Innermost running span of this thread, or ``None``"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Context manager timing the operation `name` as a :py:class:`Span`
+        child of the current one"""
+        stack = self._stack()
+        span = Span(name, attributes, parent=stack[-1] if stack else None)
+        self._call_hooks('on_start', span)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = repr(err)
+            raise
+        finally:
+            stack.remove(span)
+            span.end = time.time()
+            self._call_hooks('on_end', span)
+
+    def progress(self, span, data):
+        """Notify the hooks of `data` sent or received by `span`"""
+        self._call_hooks('on_progress', span, data)
+
+    def _call_hooks(self, method, span, *args):
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(span, *args)
+            except Exception as err:
+                warn('Hook {hook} failed on span `{name}`: {err!r}'.format(
+                    hook=hook, name=span.name, err=err))
+
+    def count_stream(self, stream, span):
+        """Wrap the file-like `stream` adding the bytes read to the
+        ``bytes_received`` of `span`, and the time waiting for them to its
+        ``network_time``"""
+        return _CountingStream(stream, span, self)
+
+
+#: Instrumentation of contexts without one, like test doubles
+NULL_INSTRUMENTATION = Instrumentation()
+
+
+def get_instrumentation(context):
+    """:py:class:`Instrumentation` of `context`"""
+    return getattr(context, 'instrumentation', None) or NULL_INSTRUMENTATION
+
+
+def record_retry(context, wait):
+    """Record on the current span a retry after waiting `wait` seconds
+    because of a rate limit"""
+    span = get_instrumentation(context).current_span()
+    if span is not None:
+        span.add('retries')
+        span.add('rate_limit_wait', wait)
+
+
+def traced(name):
+    """Decorator running a :py:class:`CartoContext
+    <cartoframes.context.CartoContext>` method in a span called `name`"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with get_instrumentation(self).span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _CountingStream(object):
+    def __init__(self, stream, span, instrumentation):
+        self.stream = stream
+        self.span = span
+        self.instrumentation = instrumentation
+
+    def _count(self, read, *args):
+        start = time.time()
+        data = read(*args)
+        self.span.add('network_time', time.time() - start)
+        self.span.add('bytes_received', len(data))
+        self.instrumentation.progress(self.span, data)
+        return data
+
+    def read(self, *args):
+        return self._count(self.stream.read, *args)
+
+    def readline(self, *args):
+        return self._count(self.stream.readline, *args)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+
+class OpenTelemetryHook(Hook):
+    """Hook exporting the spans to OpenTelemetry. Requires the
+    ``opentelemetry-api`` package.
+
+    Example:
+
+        .. code:: python
+
+            from cartoframes.instrumentation import OpenTelemetryHook
+            cc.add_hook(OpenTelemetryHook())
+
+    Args:
+        tracer (opentelemetry.trace.Tracer, optional): Tracer creating the
+          spans. Defaults to the ``cartoframes`` tracer of the global tracer
+          provider.
+    """
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError as err:
+            raise ImportError('The Python package `opentelemetry-api` needs to be installed to export spans '
+                              'to OpenTelemetry. ({})'.format(err))
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('cartoframes')
+        self._spans = {}
+
+    def on_start(self, span):
+        parent = self._spans.get(span.parent.span_id) if span.parent is not None else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        self._spans[span.span_id] = self.tracer.start_span(
+            'cartoframes.{}'.format(span.name), context=context, start_time=int(span.start * 1e9))
+
+    def on_end(self, span):
+        otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(key, value if isinstance(value, (bool, int, float, str)) else str(value))
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
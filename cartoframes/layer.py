@@ -4,6 +4,8 @@ for example usage for data layers. See `layer.BaseMap <#layer.BaseMap>`__ for
 basemap layers.
 """
 from __future__ import absolute_import
+import re
+
 import pandas as pd
 import webcolors
 
@@ -157,6 +159,8 @@ class QueryLayer(AbstractLayer):
             `the_geom_webmercator` for the map to display. Read more about
             queries in `CARTO's docs
             <https://carto.com/docs/tips-and-tricks/geospatial-analysis>`__.
+            When the map is rendered, only those columns and the ones used
+            for styling are selected from the query.
 
         time (dict or str, optional): Time-based style to apply to layer.
 
@@ -324,6 +328,8 @@ class QueryLayer(AbstractLayer):
         # e.g., dict(my_col='numeric', other_col='text')
         self.style_cols = dict()
         self.geom_type = None
+        # columns of `query`, set with the style columns when known
+        self.query_columns = None
         self.cartocss = None
         self.torque_cartocss = None
 
@@ -340,6 +346,33 @@ class QueryLayer(AbstractLayer):
         # validation step
         self._validate_columns()
 
+    def _get_pruned_query(self):
+        """Wraps the layer query so that it only selects the columns needed
+        to render it: `cartodb_id`, the geometry columns, and the columns used
+        for color, size, time and tooltips, of those in `query_columns`. This
+        keeps Mapnik from reading (and the tiler from transferring) columns
+        that are never styled.
+
+        The query is left as it is if its columns are not known, or if it has
+        an ``ORDER BY``, since the order the features are drawn in would not
+        be guaranteed once wrapped."""
+        if (self.query_columns is None or
+                re.search(r'\border\s+by\b', self.orig_query, re.IGNORECASE)):
+            return self.orig_query
+
+        columns = ['cartodb_id', 'the_geom', 'the_geom_webmercator', ]
+        tooltip_cols = (
+            [self.tooltip] if isinstance(self.tooltip, str)
+            else list(self.tooltip or [])
+        )
+        for col in list(self.style_cols) + tooltip_cols:
+            if col not in columns:
+                columns.append(col)
+        columns = [col for col in columns if col in self.query_columns]
+
+        return 'SELECT {cols} FROM ({query}) AS _cf_pruned'.format(
+            cols=', '.join(columns), query=self.orig_query)
+
     def _parse_color(self, color):
         """Setup the color scheme"""
         # If column was specified, force a scheme
@@ -445,6 +478,9 @@ class QueryLayer(AbstractLayer):
         a map is requested to be rendered from zero or more data layers"""
         basemap = layers[0]
 
+        # only select the columns the map needs from the layer query
+        self.query = self._get_pruned_query()
+
         # if color not specified, choose a default
         if self.time:
             # default time/torque color
@@ -519,7 +555,7 @@ class QueryLayer(AbstractLayer):
                 '    ) AS _wrap',
                 ') AS __wrap',
                 'WHERE __wrap.{col} = orig.{col}',
-            ]).format(col=self.color, query=self.orig_query)
+            ]).format(col=self.color, query=self.query)
             agg_func = '\'CDB_Math_Mode(cf_value_{})\''.format(self.color)
             self.scheme = {
                 'bins': [str(i) for i in range(1, 11)],
@@ -531,7 +567,7 @@ class QueryLayer(AbstractLayer):
             self.query = ' '.join([
                 'SELECT *, {col} as value',
                 'FROM ({query}) as _wrap'
-            ]).format(col=self.color, query=self.orig_query)
+            ]).format(col=self.color, query=self.query)
             agg_func = '\'avg({})\''.format(self.color)
         else:
             agg_func = "'{method}(cartodb_id)'".format(
@@ -0,0 +1,1001 @@
+"""In-process fake of the CARTO APIs used by :py:class:`CartoContext
+<cartoframes.context.CartoContext>`, to test and load-test cartoframes
+offline and reproducibly.
+
+:py:class:`MockCartoServer` serves the Auth, SQL, COPY, Batch SQL, Maps and
+Datasets APIs from a local HTTP server running in a background thread, backed
+by a SQLite database. Latency, bandwidth limits and rate limiting (``429 Too
+Many Requests`` responses) can be injected to exercise the caching, retry and
+parallelism code paths.
+
+Example:
+
+    .. code:: python
+
+        from cartoframes.mock_server import MockCartoServer
+
+        with MockCartoServer(latency=0.05, rate_limit_every=10) as server:
+            cc = server.context()
+            cc.write(df, 'my_table')
+            df = cc.read('my_table')
+            print(server.stats())
+
+SQLite is not PostGIS: the queries cartoframes sends are translated (schemas,
+``geometry(Type, SRID)`` types, index methods, ``TABLESAMPLE``), geometries
+are stored as hex EWKB, and a few PostGIS functions (``ST_AsBinary``,
+``ST_AsText``, ``ST_AsGeoJSON``, ``ST_SimplifyPreserveTopology``,
+``ST_GeometryType``, ``ST_MakePoint``, ``ST_SetSRID``, ``CDB_LatLng``,
+``ST_Extent`` and ``ST_XMin``-like ones) are emulated with shapely, when it is installed. Other PostgreSQL features fail
+as SQL errors.
+"""
+import binascii
+import collections
+import csv
+import io
+import json
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+DEFAULT_USERNAME = 'cartoframes'
+DEFAULT_API_KEY = 'mock_api_key'
+
+# APIs, as named in the `latency` option and the request log
+AUTH_API = 'auth'
+SQL_API = 'sql'
+COPYFROM_API = 'copyfrom'
+COPYTO_API = 'copyto'
+BATCH_API = 'batch'
+MAPS_API = 'maps'
+DATASETS_API = 'datasets'
+# APIs that are rate limited by CARTO
+RATE_LIMITED_APIS = (SQL_API, COPYFROM_API, COPYTO_API, BATCH_API, MAPS_API, )
+
+# bytes read or written at a time, and the unit of the bandwidth throttling
+CHUNK_SIZE = 64 * 1024
+# rows inserted at a time by COPY FROM
+COPY_BATCH_SIZE = 10000
+
+# Declared column types to (information_schema data_type, SQL API type,
+# SQL API pgtype)
+PG_TYPES = {
+    'smallint': ('smallint', 'number', 'int2'),
+    'int2': ('smallint', 'number', 'int2'),
+    'integer': ('integer', 'number', 'int4'),
+    'int': ('integer', 'number', 'int4'),
+    'int4': ('integer', 'number', 'int4'),
+    'bigint': ('bigint', 'number', 'int8'),
+    'int8': ('bigint', 'number', 'int8'),
+    'real': ('real', 'number', 'float4'),
+    'float4': ('real', 'number', 'float4'),
+    'double precision': ('double precision', 'number', 'float8'),
+    'float8': ('double precision', 'number', 'float8'),
+    'numeric': ('numeric', 'number', 'numeric'),
+    'boolean': ('boolean', 'boolean', 'bool'),
+    'bool': ('boolean', 'boolean', 'bool'),
+    'date': ('date', 'date', 'date'),
+    'timestamp': ('timestamp without time zone', 'date', 'timestamp'),
+    'timestamptz': ('timestamp with time zone', 'date', 'timestamptz'),
+    'text': ('text', 'string', 'text'),
+    'geometry': ('USER-DEFINED', 'geometry', 'geometry'),
+    'bytea': ('bytea', 'string', 'bytea'),
+}
+TEXT_TYPE = PG_TYPES['text']
+
+BOOLEAN_VALUES = {'t': 1, 'true': 1, '1': 1, 'f': 0, 'false': 0, '0': 0}
+
+# Declared type of geometry columns, with TEXT affinity so SQLite does not
+# parse hex EWKB like `0101...E610...` as numbers
+GEOMETRY_TYPE = 'geometry text'
+
+# Statements answered without SQLite
+CARTODBFY_RE = re.compile(r"^SELECT\s+CDB_CartodbfyTable\s*\(\s*'[^']*'\s*,\s*'([^']+)'\s*\)$", re.I)
+CLUSTER_RE = re.compile(r'^CLUSTER\b', re.I)
+CURRENT_SCHEMAS_RE = re.compile(r'^select\s+unnest\s*\(\s*current_schemas', re.I)
+INFORMATION_SCHEMA_RE = re.compile(r"information_schema\.columns\s+WHERE\s+table_name\s*=\s*'([^']+)'", re.I)
+PG_STATS_RE = re.compile(r'\bpg_stats\b', re.I)
+COPY_FROM_RE = re.compile(r'^COPY\s+("?[\w.]+"?)\s*\(([^)]*)\)\s+FROM\s+stdin\s*(?:WITH\s*\((.*)\))?\s*;?$',
+                          re.I | re.S)
+COPY_TO_RE = re.compile(r'^COPY\s+(?:\((.*)\)|("?[\w.]+"?))\s+TO\s+stdout\s*(?:WITH\s*\(([^()]*)\))?\s*;?$',
+                        re.I | re.S)
+COPY_OPTION_RE = re.compile(r"(\w+)\s*(?:'((?:[^']|'')*)'|(\w+))?")
+
+# PostgreSQL syntax translated to SQLite
+REWRITES = (
+    (re.compile(r'"?public"?\.', re.I), ''),
+    (re.compile(r'\bgeometry\s*\([^)]*\)', re.I), GEOMETRY_TYPE),
+    (re.compile(r'\bUSING\s+(?:gist|btree|hash)\b', re.I), ''),
+    (re.compile(r'::\s*(?:double precision|\w+)', re.I), ''),
+    (re.compile(r'("?\w+"?)\s+TABLESAMPLE\s+BERNOULLI\s*\(\s*([\d.]+)\s*\)', re.I),
+     r'(SELECT * FROM \1 WHERE abs(random() % 1000000) < \2 * 10000) AS \1'),
+)
+
+MockRequest = collections.namedtuple(
+    'MockRequest', ['api', 'method', 'path', 'status', 'bytes_received', 'bytes_sent', 'seconds'])
+MockRequest.__doc__ = 'A request served by :py:class:`MockCartoServer`'
+
+
+class MockSQLError(Exception):
+    """Error of a query run by :py:class:`MockDatabase`"""
+    pass
+
+
+class MockDatabase(object):
+    """SQLite database behind :py:class:`MockCartoServer`, running the
+    PostgreSQL queries sent by cartoframes
+
+    Args:
+        path (str, optional): SQLite database file. Defaults to an in-memory
+          database.
+    """
+    def __init__(self, path=':memory:'):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        _register_functions(self.connection)
+
+    def close(self):
+        self.connection.close()
+
+    def tables(self):
+        """Names of the tables"""
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+            return [row[0] for row in cursor]
+
+    def table_columns(self, table_name):
+        """``(name, declared type)`` of the columns of `table_name`"""
+        with self.lock:
+            cursor = self.connection.execute('PRAGMA table_info("{}")'.format(table_name.strip('"')))
+            return [(row[1], _base_type(row[2])) for row in cursor]
+
+    def execute(self, query):
+        """Run the statements of `query`
+
+        Returns:
+            tuple: SQL API ``fields`` and ``rows`` of the last statement.
+        """
+        fields, rows = {}, []
+        with self.lock:
+            for statement in split_statements(query):
+                fields, rows = self._execute(statement)
+        return fields, rows
+
+    def _execute(self, statement):
+        if CARTODBFY_RE.match(statement):
+            self._cartodbfy(CARTODBFY_RE.match(statement).group(1))
+            return {}, []
+        if CLUSTER_RE.match(statement):
+            return {}, []
+        if CURRENT_SCHEMAS_RE.match(statement):
+            return {'unnest': _field(TEXT_TYPE)}, [{'unnest': 'public'}]
+        if INFORMATION_SCHEMA_RE.search(statement):
+            table_name = INFORMATION_SCHEMA_RE.search(statement).group(1)
+            rows = [{'column_name': name, 'data_type': PG_TYPES.get(ctype, TEXT_TYPE)[0]}
+                    for name, ctype in self.table_columns(table_name)]
+            return {'column_name': _field(TEXT_TYPE), 'data_type': _field(TEXT_TYPE)}, rows
+        if PG_STATS_RE.search(statement):
+            return {}, []
+        if statement.upper().startswith('COPY'):
+            raise MockSQLError('COPY is only supported by the COPY API')
+
+        cursor = self._run(statement)
+        if cursor.description is None:
+            return {}, []
+        names, types, rows = self._fetch(cursor)
+        fields = collections.OrderedDict((name, _field(ctype)) for name, ctype in zip(names, types))
+        return fields, [dict(zip(names, _json_row(row, types))) for row in rows]
+
+    def _run(self, statement, params=()):
+        for pattern, replacement in REWRITES:
+            statement = pattern.sub(replacement, statement)
+        try:
+            return self.connection.execute(statement, params)
+        except sqlite3.Error as err:
+            raise MockSQLError(str(err))
+
+    def _fetch(self, cursor):
+        """Column names, types and rows of a query result"""
+        names = [column[0] for column in cursor.description]
+        try:
+            rows = cursor.fetchall()
+        except sqlite3.Error as err:
+            raise MockSQLError(str(err))
+        return names, self._result_types(names, rows), rows
+
+    def _result_types(self, names, rows):
+        """Types of the columns of a result: the declared type of the table
+        columns with the same name, or else guessed from the values"""
+        declared = {}
+        for table_name in reversed(self.tables()):
+            declared.update(self.table_columns(table_name))
+        types = []
+        for i, name in enumerate(names):
+            value = next((row[i] for row in rows if row[i] is not None), None)
+            if isinstance(value, bytes):
+                types.append('bytea')
+            elif name in declared:
+                types.append(declared[name])
+            elif isinstance(value, bool):
+                types.append('boolean')
+            elif isinstance(value, int):
+                types.append('bigint')
+            elif isinstance(value, float):
+                types.append('double precision')
+            else:
+                types.append('text')
+        return types
+
+    def _cartodbfy(self, table_name):
+        """Add `cartodb_id`, `the_geom` and `the_geom_webmercator` to a table,
+        like ``CDB_CartodbfyTable``"""
+        table_name = table_name.split('.')[-1].strip('"')
+        columns = self.table_columns(table_name)
+        if not columns:
+            raise MockSQLError('relation "{}" does not exist'.format(table_name))
+        names = [name for name, _ in columns]
+        kept = [(name, ctype) for name, ctype in columns
+                if name not in ('cartodb_id', 'the_geom', 'the_geom_webmercator')]
+        definitions = ['cartodb_id INTEGER PRIMARY KEY', 'the_geom ' + GEOMETRY_TYPE,
+                       'the_geom_webmercator ' + GEOMETRY_TYPE]
+        definitions += ['"{}" {}'.format(name, ctype or 'text') for name, ctype in kept]
+        copied = ['cartodb_id', 'the_geom'] + [name for name, _ in kept]
+        copied = [name for name in copied if name in names]
+
+        tmp_name = '_cdb_{}'.format(table_name)
+        self._run('CREATE TABLE "{}" ({})'.format(tmp_name, ', '.join(definitions)))
+        self._run('INSERT INTO "{tmp}" ({cols}) SELECT {cols} FROM "{table}"'.format(
+            tmp=tmp_name, table=table_name, cols=', '.join('"{}"'.format(name) for name in copied)))
+        self._run('DROP TABLE "{}"'.format(table_name))
+        self._run('ALTER TABLE "{}" RENAME TO "{}"'.format(tmp_name, table_name))
+
+    def copy_from(self, query, lines):
+        """Run a ``COPY table (columns) FROM stdin`` query with the data in
+        `lines`, an iterable of text lines
+
+        Returns:
+            int: Number of rows copied.
+        """
+        match = COPY_FROM_RE.match(query.strip())
+        if match is None:
+            raise MockSQLError('Unsupported COPY FROM query: {}'.format(query))
+        table_name = match.group(1).split('.')[-1].strip('"')
+        columns = [name.strip().strip('"') for name in match.group(2).split(',')]
+        options = _copy_options(match.group(3))
+        if options.get('format', 'text').lower() != 'csv':
+            raise MockSQLError('Only COPY FROM with FORMAT csv is supported')
+
+        types = dict(self.table_columns(table_name))
+        missing = [name for name in columns if name not in types]
+        if missing:
+            raise MockSQLError('column "{}" of relation "{}" does not exist'.format(missing[0], table_name))
+        converters = [_copy_converter(types[name]) for name in columns]
+        null = options.get('null', '')
+
+        insert = 'INSERT INTO "{table}" ({cols}) VALUES ({values})'.format(
+            table=table_name,
+            cols=', '.join('"{}"'.format(name) for name in columns),
+            values=', '.join('?' * len(columns)))
+        reader = csv.reader(lines, delimiter=options.get('delimiter', ','))
+        if options.get('header', 'false').lower() in ('true', 'on', '1'):
+            next(reader, None)
+
+        count = 0
+        batch = []
+        with self.lock:
+            for row in reader:
+                batch.append([None if value == null else convert(value)
+                              for convert, value in zip(converters, row)])
+                if len(batch) == COPY_BATCH_SIZE:
+                    count += self._insert(insert, batch)
+                    batch = []
+            count += self._insert(insert, batch)
+        return count
+
+    def _insert(self, insert, rows):
+        try:
+            self.connection.executemany(insert, rows)
+        except sqlite3.Error as err:
+            raise MockSQLError(str(err))
+        return len(rows)
+
+    def copy_to(self, query):
+        """Run a ``COPY (query) TO stdout`` query
+
+        Returns:
+            bytes: The result as CSV.
+        """
+        match = COPY_TO_RE.match(query.strip())
+        if match is None:
+            raise MockSQLError('Unsupported COPY TO query: {}'.format(query))
+        select = match.group(1) or 'SELECT * FROM {}'.format(match.group(2))
+        options = _copy_options(match.group(3))
+
+        with self.lock:
+            names, types, rows = self._fetch(self._run(select))
+
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=options.get('delimiter', ','), lineterminator='\n')
+        if options.get('header', 'false').lower() in ('true', 'on', '1'):
+            writer.writerow(names)
+        for row in rows:
+            writer.writerow([_csv_value(value, ctype) for value, ctype in zip(row, types)])
+        return output.getvalue().encode('utf-8')
+
+
+class MockCartoServer(object):
+    """Fake CARTO server for offline tests and load tests. See the module
+    documentation.
+
+    Example:
+
+        .. code:: python
+
+            server = MockCartoServer(latency={'copyto': 0.5},
+                                     bandwidth=1024 * 1024)
+            server.start()
+            cc = server.context()
+            ...
+            server.stop()
+
+    Args:
+        username (str, optional): User of the CARTO account.
+        api_key (str, optional): API key accepted by the server.
+        latency (float or dict, optional): Seconds each request is delayed
+          by, or a dict of delays by API: ``'auth'``, ``'sql'``,
+          ``'copyfrom'``, ``'copyto'``, ``'batch'``, ``'maps'`` and
+          ``'datasets'``. Defaults to no latency.
+        bandwidth (int, optional): Maximum bytes per second uploaded and
+          downloaded by each request. Defaults to no limit.
+        rate_limit_every (int, optional): Answer every `rate_limit_every`-th
+          request to the SQL, COPY, Batch and Maps APIs with a ``429 Too Many
+          Requests`` error.
+        rate_limit_probability (float, optional): Probability of answering a
+          request to those APIs with a ``429`` error.
+        retry_after (int, optional): Seconds to wait before retrying a rate
+          limited request, sent in the ``Retry-After`` header. Defaults to 1.
+        seed (int, optional): Seed of the random rate limiting, so runs are
+          reproducible.
+        database (:py:class:`MockDatabase`, optional): Database to serve.
+          Defaults to a new in-memory one.
+    """
+    def __init__(self, username=DEFAULT_USERNAME, api_key=DEFAULT_API_KEY, latency=None, bandwidth=None,
+                 rate_limit_every=None, rate_limit_probability=0, retry_after=1, seed=None, database=None):
+        self.username = username
+        self.api_key = api_key
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.database = database or MockDatabase()
+        self.requests = []
+        self.jobs = {}
+        self.map_templates = {}
+        self.privacy = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._limited_count = 0
+        self._httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start serving in a background thread"""
+        if self._httpd is None:
+            self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _MockRequestHandler)
+            self._httpd.mock = self
+            self._thread = threading.Thread(target=self._httpd.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+            self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def base_url(self):
+        """Base URL of the account, to use with the :py:meth:`session`"""
+        return 'https://127.0.0.1:{port}/user/{username}/'.format(port=self.port, username=self.username)
+
+    def session(self):
+        """requests Session sending the requests to :py:attr:`base_url` to the
+        server over plain HTTP, since the CARTO SDK only accepts HTTPS URLs"""
+        session = Session()
+        session.mount('https://127.0.0.1:{}/'.format(self.port), _LocalAdapter())
+        return session
+
+    def context(self, **kwargs):
+        """:py:class:`CartoContext <cartoframes.context.CartoContext>`
+        connected to the server. `kwargs` are passed to its constructor."""
+        from .context import CartoContext
+        return CartoContext(base_url=self.base_url, api_key=self.api_key, session=self.session(), **kwargs)
+
+    def stats(self):
+        """Number of requests, rate limited requests, bytes and seconds by API
+
+        Returns:
+            dict: ``{api: {'requests', 'rate_limited', 'bytes_received',
+            'bytes_sent', 'seconds'}}``
+        """
+        stats = {}
+        with self._lock:
+            requests = list(self.requests)
+        for request in requests:
+            api_stats = stats.setdefault(request.api, {'requests': 0, 'rate_limited': 0, 'bytes_received': 0,
+                                                       'bytes_sent': 0, 'seconds': 0.0})
+            api_stats['requests'] += 1
+            api_stats['rate_limited'] += request.status == 429
+            api_stats['bytes_received'] += request.bytes_received
+            api_stats['bytes_sent'] += request.bytes_sent
+            api_stats['seconds'] += request.seconds
+        return stats
+
+    def reset_stats(self):
+        """Forget the requests served so far, and restart the count of
+        `rate_limit_every`"""
+        with self._lock:
+            self.requests = []
+            self._limited_count = 0
+
+    def _log(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def _get_latency(self, api):
+        if isinstance(self.latency, dict):
+            return self.latency.get(api, 0)
+        return self.latency or 0
+
+    def _is_rate_limited(self, api):
+        if api not in RATE_LIMITED_APIS:
+            return False
+        with self._lock:
+            self._limited_count += 1
+            if self.rate_limit_every and self._limited_count % self.rate_limit_every == 0:
+                return True
+            return self._random.random() < self.rate_limit_probability
+
+    def _run_job(self, query):
+        """Run a Batch SQL API job synchronously"""
+        job = {
+            'job_id': str(uuid.uuid4()),
+            'user': self.username,
+            'query': query,
+            'status': 'done',
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        try:
+            self.database.execute(';'.join(query) if isinstance(query, list) else query)
+        except MockSQLError as err:
+            job['status'] = 'failed'
+            job['failed_reason'] = str(err)
+        job['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        with self._lock:
+            self.jobs[job['job_id']] = job
+        return job
+
+    def _get_dataset(self, table_name):
+        """Datasets API representation of a table"""
+        return {
+            'id': table_name,
+            'name': table_name,
+            'type': 'table',
+            'privacy': self.privacy.get(table_name, 'PRIVATE'),
+            'table': {'id': table_name, 'name': table_name},
+            'dependent_visualizations_count': 0,
+        }
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _LocalAdapter(HTTPAdapter):
+    """Sends HTTPS requests to the local server over HTTP"""
+    def send(self, request, **kwargs):
+        request.url = 'http://' + request.url[len('https://'):]
+        return super(_LocalAdapter, self).send(request, **kwargs)
+
+
+class _Throttle(object):
+    """Sleeps to keep a transfer under `bandwidth` bytes per second"""
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.start = time.time()
+        self.size = 0
+
+    def consume(self, size):
+        self.size += size
+        if self.bandwidth:
+            delay = self.size / float(self.bandwidth) - (time.time() - self.start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # (method, path relative to the account, API, handler name)
+    ROUTES = (
+        ('GET', re.compile(r'^api/v3/api_keys/?$'), AUTH_API, 'api_keys'),
+        ('GET', re.compile(r'^api/v2/sql/?$'), SQL_API, 'sql'),
+        ('POST', re.compile(r'^api/v2/sql/?$'), SQL_API, 'sql'),
+        ('POST', re.compile(r'^api/v2/sql/copyfrom/?$'), COPYFROM_API, 'copyfrom'),
+        ('GET', re.compile(r'^api/v2/sql/copyto/?$'), COPYTO_API, 'copyto'),
+        ('POST', re.compile(r'^api/v2/sql/copyto/?$'), COPYTO_API, 'copyto'),
+        ('POST', re.compile(r'^api/v2/sql/job/?$'), BATCH_API, 'create_job'),
+        ('GET', re.compile(r'^api/v2/sql/job/([^/]+)/?$'), BATCH_API, 'read_job'),
+        ('DELETE', re.compile(r'^api/v2/sql/job/([^/]+)/?$'), BATCH_API, 'read_job'),
+        ('POST', re.compile(r'^api/v1/map/named/?$'), MAPS_API, 'create_template'),
+        ('PUT', re.compile(r'^api/v1/map/named/([^/]+)/?$'), MAPS_API, 'update_template'),
+        ('POST', re.compile(r'^api/v1/map/named/([^/]+)/?$'), MAPS_API, 'instantiate_template'),
+        ('GET', re.compile(r'^api/v1/map/static/named/([^/]+)/(\d+)/(\d+)\.png$'), MAPS_API, 'static_map'),
+        ('GET', re.compile(r'^api/v1/viz/?$'), DATASETS_API, 'list_datasets'),
+        ('GET', re.compile(r'^api/v1/viz/([^/]+)/?$'), DATASETS_API, 'get_dataset'),
+        ('PUT', re.compile(r'^api/v1/viz/([^/]+)/?$'), DATASETS_API, 'update_dataset'),
+        ('DELETE', re.compile(r'^api/v1/viz/([^/]+)/?$'), DATASETS_API, 'delete_dataset'),
+    )
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        mock = self.server.mock
+        start = time.time()
+        self._received = 0
+        self._sent = 0
+        self._throttle = _Throttle(mock.bandwidth)
+
+        url = urlparse(self.path)
+        self.params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        prefix = '/user/{}/'.format(mock.username)
+        path = url.path[len(prefix):] if url.path.startswith(prefix) else url.path.lstrip('/')
+
+        api, handler, args = None, None, ()
+        for route_method, pattern, route_api, name in self.ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                api, handler, args = route_api, getattr(self, '_' + name), match.groups()
+                break
+
+        status = 404
+        try:
+            if handler is None:
+                self._read_body()
+                status = self._send_json({'errors': ['Not found: {} {}'.format(method, path)]}, 404)
+            else:
+                time.sleep(mock._get_latency(api))
+                if mock._is_rate_limited(api):
+                    self._read_body()
+                    status = self._send_rate_limited()
+                else:
+                    status = handler(*args)
+        finally:
+            mock._log(MockRequest(api, method, path, status, self._received, self._sent, time.time() - start))
+
+    # request and response helpers
+
+    def _iter_body(self):
+        """Chunks of the request body, decompressed"""
+        decompressor = None
+        if self.headers.get('Content-Encoding') == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in self._iter_raw_body():
+            self._received += len(chunk)
+            self._throttle.consume(len(chunk))
+            yield decompressor.decompress(chunk) if decompressor else chunk
+        if decompressor:
+            yield decompressor.flush()
+
+    def _iter_raw_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while self.rfile.readline().strip():
+                        pass
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, CHUNK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def _read_body(self):
+        return b''.join(self._iter_body())
+
+    def _read_json(self):
+        body = self._read_body()
+        return json.loads(body.decode('utf-8')) if body else {}
+
+    def _read_params(self):
+        """Query string parameters, updated with the form ones of the body"""
+        body = self._read_body()
+        if body and 'json' not in self.headers.get('Content-Type', ''):
+            self.params.update((key, values[-1]) for key, values in parse_qs(body.decode('utf-8')).items())
+        return self.params
+
+    def _send(self, body, status=200, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self._throttle.consume(len(chunk))
+            self.wfile.write(chunk)
+        self._sent += len(body)
+        return status
+
+    def _send_json(self, data, status=200):
+        return self._send(json.dumps(data).encode('utf-8'), status)
+
+    def _send_sql_error(self, err):
+        return self._send_json({'error': [str(err)]}, 400)
+
+    def _send_rate_limited(self):
+        mock = self.server.mock
+        return self._send(
+            json.dumps({'error': ['You are over platform\'s limits. Please contact us to know more details']})
+            .encode('utf-8'),
+            429,
+            headers={
+                'Carto-Rate-Limit-Limit': 1,
+                'Carto-Rate-Limit-Remaining': 0,
+                'Carto-Rate-Limit-Reset': int(time.time()) + mock.retry_after,
+                'Retry-After': mock.retry_after,
+            })
+
+    # API endpoints
+
+    def _api_keys(self):
+        self._read_body()
+        return self._send_json({'result': [{'name': 'Master', 'type': 'master', 'token': self.server.mock.api_key}],
+                                'total': 1, 'count': 1})
+
+    def _sql(self):
+        query = self._read_params().get('q', '')
+        start = time.time()
+        try:
+            fields, rows = self.server.mock.database.execute(query)
+        except MockSQLError as err:
+            return self._send_sql_error(err)
+        return self._send_json({'rows': rows, 'fields': fields, 'total_rows': len(rows),
+                                'time': time.time() - start})
+
+    def _copyfrom(self):
+        start = time.time()
+        try:
+            count = self.server.mock.database.copy_from(self.params.get('q', ''), _iter_lines(self._iter_body()))
+        except MockSQLError as err:
+            # the rest of the body is discarded to keep the connection usable
+            self._read_body()
+            return self._send_sql_error(err)
+        return self._send_json({'total_rows': count, 'time': time.time() - start})
+
+    def _copyto(self):
+        query = self._read_params().get('q', '')
+        try:
+            data = self.server.mock.database.copy_to(query)
+        except MockSQLError as err:
+            return self._send_sql_error(err)
+        return self._send(data, content_type='text/csv')
+
+    def _create_job(self):
+        return self._send_json(self.server.mock._run_job(self._read_json().get('query')), 201)
+
+    def _read_job(self, job_id):
+        self._read_body()
+        job = self.server.mock.jobs.get(job_id)
+        if job is None:
+            return self._send_json({'error': ['Job with id {} not found'.format(job_id)]}, 404)
+        return self._send_json(job)
+
+    def _create_template(self):
+        template = self._read_json()
+        templates = self.server.mock.map_templates
+        if template.get('name') in templates:
+            return self._send_json({'errors': ['Template with name {} already exists'.format(template['name'])]},
+                                   409)
+        templates[template.get('name')] = template
+        return self._send_json({'template_id': template.get('name')})
+
+    def _update_template(self, name):
+        self.server.mock.map_templates[name] = self._read_json()
+        return self._send_json({'template_id': name})
+
+    def _instantiate_template(self, name):
+        self._read_body()
+        if name not in self.server.mock.map_templates:
+            return self._send_json({'errors': ['Template {} not found'.format(name)]}, 404)
+        return self._send_json({'layergroupid': '{}:{}'.format(name, int(time.time())),
+                                'metadata': {'layers': []}})
+
+    def _static_map(self, name, width, height):
+        self._read_body()
+        if name not in self.server.mock.map_templates:
+            return self._send_json({'errors': ['Template {} not found'.format(name)]}, 404)
+        return self._send(_blank_png(int(width), int(height)), content_type='image/png')
+
+    def _list_datasets(self):
+        self._read_body()
+        mock = self.server.mock
+        datasets = [mock._get_dataset(name) for name in mock.database.tables()]
+        return self._send_json({'visualizations': datasets, 'total_entries': len(datasets)})
+
+    def _get_dataset(self, table_name):
+        self._read_body()
+        mock = self.server.mock
+        if table_name not in mock.database.tables():
+            return self._send_json({'errors': ['Dataset {} not found'.format(table_name)]}, 404)
+        return self._send_json(mock._get_dataset(table_name))
+
+    def _update_dataset(self, table_name):
+        data = self._read_json()
+        mock = self.server.mock
+        if table_name not in mock.database.tables():
+            return self._send_json({'errors': ['Dataset {} not found'.format(table_name)]}, 404)
+        if data.get('privacy'):
+            mock.privacy[table_name] = data['privacy'].upper()
+        return self._send_json(mock._get_dataset(table_name))
+
+    def _delete_dataset(self, table_name):
+        self._read_body()
+        try:
+            self.server.mock.database.execute('DROP TABLE "{}"'.format(table_name))
+        except MockSQLError:
+            return self._send_json({'errors': ['Dataset {} not found'.format(table_name)]}, 404)
+        return self._send(b'', 204)
+
+
+def split_statements(query):
+    """Split `query` in statements, keeping the semicolons in strings"""
+    statements = []
+    current = ''
+    for part in query.split(';'):
+        current += part
+        if sqlite3.complete_statement(current + ';'):
+            if current.strip():
+                statements.append(current.strip())
+            current = ''
+        else:
+            current += ';'
+    if current.strip(' ;\n\t'):
+        statements.append(current.strip())
+    return statements
+
+
+def _base_type(declared_type):
+    """Lowercase declared type without modifiers: `geometry(Point, 4326)`
+    and `geometry text` are `geometry`"""
+    declared_type = re.sub(r'\s*\(.*\)$', '', (declared_type or '').strip().lower())
+    return 'geometry' if declared_type.startswith('geometry') else declared_type
+
+
+def _field(ctype):
+    """SQL API field of a column of type `ctype`"""
+    _, sqlapi_type, pgtype = ctype if isinstance(ctype, tuple) else PG_TYPES.get(ctype, TEXT_TYPE)
+    return {'type': sqlapi_type, 'pgtype': pgtype}
+
+
+def _json_row(row, types):
+    return [bool(value) if ctype in ('boolean', 'bool') and value is not None else
+            '\\x' + binascii.hexlify(value).decode() if isinstance(value, bytes) else value
+            for value, ctype in zip(row, types)]
+
+
+def _csv_value(value, ctype):
+    """Value of a COPY TO CSV, formatted as PostgreSQL does"""
+    if value is None:
+        return ''
+    if ctype in ('boolean', 'bool'):
+        return 't' if value else 'f'
+    if isinstance(value, bytes):
+        return '\\x' + binascii.hexlify(value).decode()
+    return value
+
+
+def _copy_options(options):
+    """Options of a COPY query, by lowercase name"""
+    result = {}
+    for name, quoted, word in COPY_OPTION_RE.findall(options or ''):
+        result[name.lower()] = quoted.replace("''", "'") if quoted else word
+    return result
+
+
+def _copy_converter(ctype):
+    """Function parsing the COPY values of a column of type `ctype`"""
+    if ctype in ('boolean', 'bool'):
+        return lambda value: BOOLEAN_VALUES.get(value.lower(), value)
+    if ctype == 'geometry':
+        return _to_hex_ewkb
+    return lambda value: value
+
+
+def _iter_lines(chunks):
+    """Text lines of a stream of UTF-8 bytes chunks"""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8') + '\n'
+    if pending:
+        yield pending.decode('utf-8')
+
+
+def _blank_png(width, height):
+    """Transparent RGBA PNG image"""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    rows = (b'\x00' + b'\x00' * 4 * width) * height
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) +
+            chunk(b'IEND', b''))
+
+
+# Geometries are stored as hex EWKB, as PostGIS outputs them. PostGIS
+# functions are emulated with shapely.
+
+def _load_geom(value):
+    from shapely import wkb
+    if value is None:
+        return None
+    return wkb.loads(value, hex=True)
+
+
+def _dump_geom(geom, srid=4326):
+    from shapely import wkb
+    if geom is None:
+        return None
+    return wkb.dumps(geom, hex=True, srid=srid)
+
+
+def _to_hex_ewkb(value):
+    """Hex EWKB of a geometry given as EWKT, WKT or hex (E)WKB"""
+    if re.match(r'^[0-9a-fA-F]+$', value):
+        return value.upper()
+    try:
+        from shapely import wkt
+    except ImportError:
+        return value
+    srid = 4326
+    if value.upper().startswith('SRID='):
+        srid_part, value = value.split(';', 1)
+        srid = int(srid_part[len('SRID='):])
+    return _dump_geom(wkt.loads(value), srid)
+
+
+def _geometry_type(value):
+    return 'ST_{}'.format(_load_geom(value).geom_type) if value else None
+
+
+def _as_geojson(value, precision=9):
+    from shapely.geometry import mapping
+    if value is None:
+        return None
+    geom = _load_geom(value)
+    if precision is not None:
+        from shapely import wkt
+        geom = wkt.loads(wkt.dumps(geom, rounding_precision=int(precision)))
+    return json.dumps(mapping(geom))
+
+
+def _make_point(x, y):
+    from shapely.geometry import Point
+    return _dump_geom(Point(x, y), srid=0) if x is not None and y is not None else None
+
+
+def _set_srid(value, srid):
+    return _dump_geom(_load_geom(value), srid) if value else None
+
+
+def _lat_lng(lat, lng):
+    return _set_srid(_make_point(lng, lat), 4326)
+
+
+GEOM_FUNCTIONS = (
+    ('ST_AsBinary', 1, lambda value: _load_geom(value).wkb if value else None),
+    ('ST_AsText', 1, lambda value: _load_geom(value).wkt if value else None),
+    ('ST_AsGeoJSON', 1, _as_geojson),
+    ('ST_AsGeoJSON', 2, _as_geojson),
+    ('ST_GeometryType', 1, _geometry_type),
+    ('ST_SimplifyPreserveTopology', 2,
+     lambda value, tolerance: _dump_geom(_load_geom(value).simplify(tolerance)) if value else None),
+    ('ST_MakePoint', 2, _make_point),
+    ('ST_SetSRID', 2, _set_srid),
+    ('CDB_LatLng', 2, _lat_lng),
+)
+
+
+def _bound(index):
+    return lambda value: _load_geom(value).bounds[index] if value else None
+
+
+class _Extent(object):
+    """``ST_Extent`` aggregate: bounding box of the geometries"""
+    def __init__(self):
+        self.bounds = None
+
+    def step(self, value):
+        if value:
+            bounds = _load_geom(value).bounds
+            if self.bounds is None:
+                self.bounds = bounds
+            else:
+                self.bounds = (min(self.bounds[0], bounds[0]), min(self.bounds[1], bounds[1]),
+                               max(self.bounds[2], bounds[2]), max(self.bounds[3], bounds[3]))
+
+    def finalize(self):
+        from shapely.geometry import box
+        return _dump_geom(box(*self.bounds)) if self.bounds else None
+
+
+GEOM_FUNCTIONS += (
+    ('ST_XMin', 1, _bound(0)),
+    ('ST_YMin', 1, _bound(1)),
+    ('ST_XMax', 1, _bound(2)),
+    ('ST_YMax', 1, _bound(3)),
+)
+
+
+def _register_functions(connection):
+    for name, nargs, function in GEOM_FUNCTIONS:
+        connection.create_function(name, nargs, function)
+    connection.create_aggregate('ST_Extent', 1, _Extent)
@@ -0,0 +1,210 @@
+"""Profiler breaking down where the time of each :py:class:`CartoContext
+<cartoframes.context.CartoContext>` operation goes, built on its
+:py:mod:`instrumentation <cartoframes.instrumentation>` spans.
+
+Example:
+
+    .. code:: python
+
+        from cartoframes import CartoContext
+        cc = CartoContext(BASEURL, APIKEY)
+        with cc.profile() as profiler:
+            cc.write(df, 'my_table', overwrite=True)
+            cc.read('my_table')
+        print(profiler.report())
+        profiler.to_dataframe()
+
+A ``write`` is broken down into column name normalization, schema
+inference, the Batch SQL jobs creating and indexing the table, the encoding
+of the rows, the time sending them and the time the server took to COPY
+them, which overlaps with the sending as rows are streamed. A ``read`` or
+``fetch`` into the SQL API queries looking up the columns, the time
+receiving the rows, parsing them and decoding geometries.
+"""
+from __future__ import print_function
+
+from collections import OrderedDict
+
+import pandas as pd
+
+from .instrumentation import (Hook, SPAN_BATCH_JOB, SPAN_COPYFROM, SPAN_COPYTO, SPAN_DECODE, SPAN_NORMALIZE,
+                              SPAN_SCHEMA, SPAN_SQL)
+
+# Stages of the breakdowns, in the order they are reported
+STAGE_NORMALIZE = 'normalize_column_names'
+STAGE_SCHEMA = 'schema_inference'
+STAGE_SQL = 'sql_queries'
+STAGE_BATCH_JOBS = 'batch_jobs'
+STAGE_ENCODE = 'row_encoding'
+STAGE_SEND = 'network_send'
+STAGE_SERVER_COPY = 'server_copy'
+STAGE_RECEIVE = 'network_receive'
+STAGE_PARSE = 'parsing'
+STAGE_DECODE = 'geometry_decoding'
+STAGE_RATE_LIMIT = 'rate_limit_wait'
+STAGE_OTHER = 'other'
+
+STAGES = (STAGE_NORMALIZE, STAGE_SCHEMA, STAGE_SQL, STAGE_BATCH_JOBS, STAGE_ENCODE, STAGE_SEND,
+          STAGE_SERVER_COPY, STAGE_RECEIVE, STAGE_PARSE, STAGE_DECODE, STAGE_RATE_LIMIT, STAGE_OTHER)
+
+# Stages running at the same time as others, left out of `other`
+OVERLAPPING_STAGES = (STAGE_SERVER_COPY, )
+
+# Stages of the spans timed as a whole
+SPAN_STAGES = {
+    SPAN_NORMALIZE: STAGE_NORMALIZE,
+    SPAN_SCHEMA: STAGE_SCHEMA,
+    SPAN_SQL: STAGE_SQL,
+    SPAN_BATCH_JOB: STAGE_BATCH_JOBS,
+    SPAN_DECODE: STAGE_DECODE,
+}
+
+COLUMNS = ('call', 'operation', 'stage', 'seconds', 'percent', 'count', 'bytes', 'rows')
+
+
+def _root(span):
+    while span.parent is not None:
+        span = span.parent
+    return span
+
+
+class ProfiledCall(object):
+    """Breakdown of one operation of a context, like a ``write``
+
+    Attributes:
+        operation (str): Name of the operation.
+        duration (float): Wall time of the operation, in seconds.
+        stages (collections.OrderedDict): Stats of each stage the time was
+          spent on, by stage name: ``seconds``, ``count`` (number of spans),
+          ``bytes`` and ``rows``.
+    """
+    def __init__(self, span, spans):
+        self.operation = span.name
+        self.duration = span.duration
+        self.stages = OrderedDict((stage, {'seconds': 0.0, 'count': 0, 'bytes': 0, 'rows': 0})
+                                  for stage in STAGES)
+        for child in spans:
+            self._add_span(child)
+        if span.name in SPAN_STAGES or span.name in (SPAN_COPYFROM, SPAN_COPYTO):
+            # a client call outside of the context methods
+            self._add_span(span)
+        self._add(STAGE_OTHER, max(self.duration - sum(
+            stats['seconds'] for stage, stats in self.stages.items() if stage not in OVERLAPPING_STAGES), 0.0),
+            count=0)
+        self.stages = OrderedDict((stage, stats) for stage, stats in self.stages.items() if stats['count'] or
+                                  stats['seconds'] > 0)
+
+    def _add(self, stage, seconds, count=1, size=0, rows=0):
+        stats = self.stages[stage]
+        stats['seconds'] += seconds
+        stats['count'] += count
+        stats['bytes'] += size or 0
+        stats['rows'] += rows or 0
+
+    def _add_span(self, span):
+        attributes = span.attributes
+        if span.name in SPAN_STAGES:
+            self._add(SPAN_STAGES[span.name], span.duration, rows=attributes.get('rows'))
+        elif span.name == SPAN_COPYFROM:
+            encode_time = attributes.get('encode_time', 0)
+            self._add(STAGE_ENCODE, encode_time, rows=attributes.get('rows'))
+            self._add(STAGE_SEND, max(span.duration - encode_time, 0.0), size=attributes.get('bytes_sent'))
+            self._add(STAGE_SERVER_COPY, attributes.get('server_time') or 0.0, rows=attributes.get('rows'))
+        elif span.name == SPAN_COPYTO:
+            network_time = attributes.get('network_time', 0)
+            rate_limit_wait = attributes.get('rate_limit_wait', 0)
+            self._add(STAGE_RECEIVE, network_time, size=attributes.get('bytes_received'))
+            self._add(STAGE_PARSE, max(span.duration - network_time - rate_limit_wait, 0.0),
+                      rows=attributes.get('rows'))
+            if rate_limit_wait:
+                self._add(STAGE_RATE_LIMIT, rate_limit_wait, count=attributes.get('retries', 1))
+
+    def to_dataframe(self):
+        """The breakdown as a DataFrame with one row per stage"""
+        return pd.DataFrame([
+            (self.operation, stage, stats['seconds'],
+             100.0 * stats['seconds'] / self.duration if self.duration else 0.0,
+             stats['count'], stats['bytes'], stats['rows'])
+            for stage, stats in self.stages.items()], columns=COLUMNS[1:])
+
+    def report(self):
+        """The breakdown as a printable table"""
+        lines = ['{operation}: {duration:.3f}s'.format(operation=self.operation, duration=self.duration)]
+        for stage, stats in self.stages.items():
+            line = '  {stage:<24}{seconds:>9.3f}s {percent:>6.1f}%'.format(
+                stage=stage, seconds=stats['seconds'],
+                percent=100.0 * stats['seconds'] / self.duration if self.duration else 0.0)
+            details = []
+            if stats['rows']:
+                details.append('{:,} rows'.format(stats['rows']))
+            if stats['bytes']:
+                details.append('{:,} bytes'.format(stats['bytes']))
+            if details:
+                line += '  ' + ', '.join(details)
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+
+class Profiler(Hook):
+    """Instrumentation hook collecting a :py:class:`ProfiledCall` for each
+    operation of a context. Use it through :py:meth:`CartoContext.profile
+    <cartoframes.context.CartoContext.profile>`, or ``profile=True`` when
+    creating the context.
+
+    Args:
+        carto_context (:py:class:`CartoContext <cartoframes.context.CartoContext>`, optional):
+          Context profiled while the profiler is used as a context manager.
+        verbose (bool, optional): Print the breakdown of each operation when
+          it ends. Defaults to ``False``.
+
+    Attributes:
+        calls (list): :py:class:`ProfiledCall` of each operation.
+    """
+    def __init__(self, carto_context=None, verbose=False):
+        self.cc = carto_context
+        self.verbose = verbose
+        self.calls = []
+        self._spans = []
+
+    def __enter__(self):
+        self.cc.add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cc.remove_hook(self)
+
+    def on_end(self, span):
+        if span.parent is not None:
+            self._spans.append(span)
+            return
+        spans = [child for child in self._spans if _root(child) is span]
+        self._spans = [child for child in self._spans if _root(child) is not span]
+        call = ProfiledCall(span, spans)
+        self.calls.append(call)
+        if self.verbose:
+            print(call.report())
+
+    def clear(self):
+        """Forget the operations profiled so far"""
+        self.calls = []
+
+    def to_dataframe(self):
+        """Breakdowns of all the operations as a DataFrame with one row per
+        operation (numbered by ``call``) and stage, and the columns
+        ``seconds``, ``percent`` (of the time of the operation), ``count``,
+        ``bytes`` and ``rows``"""
+        frames = []
+        for number, call in enumerate(self.calls):
+            df = call.to_dataframe()
+            df.insert(0, 'call', number)
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def report(self):
+        """Breakdowns of all the operations as a printable table"""
+        return '\n'.join(call.report() for call in self.calls)
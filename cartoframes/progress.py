@@ -0,0 +1,165 @@
+"""Progress of the COPY uploads and downloads of a :py:class:`CartoContext
+<cartoframes.context.CartoContext>`, as progress bars or callbacks.
+
+Example:
+
+    Show progress bars with the rows, throughput and estimated time left
+    of every upload and download.
+
+    .. code:: python
+
+        from cartoframes import CartoContext
+        cc = CartoContext(BASEURL, APIKEY, progress=True)
+        cc.write(df, 'my_table')
+
+    Log the progress from a service instead.
+
+    .. code:: python
+
+        def log_progress(progress):
+            logger.info('%s: %d rows, %.1f MB/s', progress.operation,
+                        progress.rows, progress.megabytes_per_second)
+
+        cc = CartoContext(BASEURL, APIKEY, progress=log_progress)
+
+The rows are counted from the lines of the CSV data while it is transferred,
+and set to the exact number when the transfer ends. The total, and so the
+estimated time left, is only known for uploads of DataFrames and of Parquet
+files or Arrow tables.
+"""
+import time
+
+from tqdm import tqdm
+
+from .instrumentation import Hook, SPAN_COPYFROM, SPAN_COPYTO
+
+# Minimum seconds between two reports of the progress of a transfer
+PROGRESS_INTERVAL = 0.5
+
+DESCRIPTIONS = {
+    SPAN_COPYFROM: 'Uploading',
+    SPAN_COPYTO: 'Downloading',
+}
+
+
+class Progress(object):
+    """Progress of a COPY transfer
+
+    Attributes:
+        operation (str): ``'copyfrom'`` for uploads, ``'copyto'`` for
+          downloads.
+        rows (int): Rows transferred so far.
+        bytes (int): CSV bytes transferred so far, before compression.
+        elapsed (float): Seconds since the transfer started.
+        total_rows (int): Rows to transfer, or ``None`` if unknown.
+        finished (bool): Whether the transfer has ended.
+    """
+    def __init__(self, operation, rows, size, elapsed, total_rows=None, finished=False):
+        self.operation = operation
+        self.rows = rows
+        self.bytes = size
+        self.elapsed = elapsed
+        self.total_rows = total_rows
+        self.finished = finished
+
+    @property
+    def rows_per_second(self):
+        """Average rows transferred per second"""
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self):
+        """Average megabytes transferred per second"""
+        return self.bytes / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Estimated seconds left, or ``None`` if unknown"""
+        if self.finished:
+            return 0.0
+        if not self.total_rows or not self.rows:
+            return None
+        return max(self.total_rows - self.rows, 0) / self.rows_per_second
+
+    def __repr__(self):
+        return 'Progress(operation={}, rows={}, bytes={}, elapsed={:.1f}s)'.format(
+            self.operation, self.rows, self.bytes, self.elapsed)
+
+
+class _Transfer(object):
+    def __init__(self, span, bar):
+        self.span = span
+        self.bar = bar
+        self.lines = 0
+        self.bytes = 0
+        self.reported = 0.0
+
+    @property
+    def rows(self):
+        if self.span.name == SPAN_COPYTO:
+            # COPY TO results have a header line
+            return max(self.lines - 1, 0)
+        return self.lines
+
+
+class ProgressHook(Hook):
+    """Instrumentation hook reporting the progress of COPY uploads and
+    downloads as `tqdm <https://tqdm.github.io/>`__ progress bars, to a
+    callback, or both. Reports are throttled to one every `interval`
+    seconds per transfer, plus a last one when it ends. Use it through the
+    `progress` argument of :py:class:`CartoContext
+    <cartoframes.context.CartoContext>`, or with :py:meth:`CartoContext.add_hook
+    <cartoframes.context.CartoContext.add_hook>`.
+
+    Args:
+        callback (function, optional): Function called with a
+          :py:class:`Progress`.
+        bar (bool, optional): Show progress bars. Defaults to ``True`` if
+          there is no `callback`.
+        interval (float, optional): Minimum seconds between two reports.
+    """
+    def __init__(self, callback=None, bar=None, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.bar = callback is None if bar is None else bar
+        self.interval = interval
+        self._transfers = {}
+
+    def on_start(self, span):
+        if span.name not in DESCRIPTIONS:
+            return
+        bar = None
+        if self.bar:
+            bar = tqdm(total=span.attributes.get('total_rows'), desc=DESCRIPTIONS[span.name], unit=' rows',
+                       unit_scale=True, mininterval=self.interval)
+        self._transfers[span.span_id] = _Transfer(span, bar)
+
+    def on_progress(self, span, data):
+        transfer = self._transfers.get(span.span_id)
+        if transfer is None:
+            return
+        transfer.lines += data.count(b'\n')
+        transfer.bytes += len(data)
+        now = time.time()
+        if now - transfer.reported >= self.interval:
+            transfer.reported = now
+            self._report(transfer, now)
+
+    def on_end(self, span):
+        transfer = self._transfers.pop(span.span_id, None)
+        if transfer is None:
+            return
+        rows = span.attributes.get('rows')
+        if rows is not None:
+            transfer.lines = rows + 1 if span.name == SPAN_COPYTO else rows
+        self._report(transfer, span.end, finished=True)
+        if transfer.bar is not None:
+            transfer.bar.close()
+
+    def _report(self, transfer, now, finished=False):
+        progress = Progress(transfer.span.name, transfer.rows, transfer.bytes, now - transfer.span.start,
+                            total_rows=transfer.span.attributes.get('total_rows'), finished=finished)
+        if transfer.bar is not None:
+            transfer.bar.set_postfix_str('{:.1f} MB/s'.format(progress.megabytes_per_second), refresh=False)
+            transfer.bar.update(progress.rows - transfer.bar.n)
+        if self.callback is not None:
+            self.callback(progress)
@@ -0,0 +1,388 @@
+"""Local renderer for static maps. Instead of requesting a PNG from the CARTO
+Static Maps API, the layer data is fetched once (simplified to the resolution
+of the image) and drawn with matplotlib's Agg backend, applying the same
+classification and CARTOColors schemes that TurboCARTO applies to the layer
+CartoCSS.
+
+The renderer does not use `pyplot`, so maps can be rendered concurrently from
+several threads.
+"""
+from __future__ import absolute_import, division
+import math
+
+import numpy as np
+import pandas as pd
+
+from .styling import BinMethod, get_scheme_colors
+from .utils import minify_sql
+
+#: Renders static maps with the CARTO Static Maps API
+MAPS_API = 'maps_api'
+#: Renders static maps locally with matplotlib
+LOCAL = 'local'
+STATIC_RENDERERS = (MAPS_API, LOCAL, )
+
+# web mercator constants
+EARTH_RADIUS = 6378137.0
+MERCATOR_MAX = math.pi * EARTH_RADIUS
+MAX_LATITUDE = 85.0511287798
+TILE_SIZE = 256
+# resolution used when the data bounds collapse to a point (zoom 16)
+MIN_RESOLUTION = 2 * MERCATOR_MAX / (TILE_SIZE * 2 ** 16)
+# same dpi as the CARTO Static Maps API
+DPI = 72.0
+
+# background colors approximating the CARTO basemaps, labels are not drawn
+BASEMAP_BACKGROUNDS = {
+    'voyager': '#f2f0ed',
+    'light': '#fafaf8',
+    'dark': '#0e0e0e',
+}
+DEFAULT_BACKGROUND = '#ffffff'
+NULL_COLOR = '#cccccc'
+# max number of values used to compute jenks natural breaks
+JENKS_SAMPLE_SIZE = 1000
+
+
+def lnglat_to_mercator(lng, lat):
+    """Project a WGS84 coordinate to web mercator (EPSG:3857)"""
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = math.radians(lng) * EARTH_RADIUS
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def get_extent(size, zoom=None, lat=None, lng=None, bounds=None):
+    """Get the web mercator extent covered by a static map
+
+    Args:
+        size (tuple): ``(width, height)`` of the image in pixels.
+        zoom (int, optional): Zoom level of the map, used along with
+          ``lat`` and ``lng``.
+        lat (float, optional): Latitude of the center of the map.
+        lng (float, optional): Longitude of the center of the map.
+        bounds (dict, optional): WGS84 bounds to fit in the image, with
+          ``west``, ``south``, ``east`` and ``north`` keys. Used when no
+          ``zoom`` is given.
+
+    Returns:
+        tuple: ``(west, south, east, north)`` in web mercator meters, with the
+        same aspect ratio as ``size``.
+    """
+    width, height = size
+    if zoom is not None:
+        resolution = 2 * MERCATOR_MAX / (TILE_SIZE * 2 ** zoom)
+        center_x, center_y = lnglat_to_mercator(lng, lat)
+    else:
+        west, south = lnglat_to_mercator(bounds['west'], bounds['south'])
+        east, north = lnglat_to_mercator(bounds['east'], bounds['north'])
+        resolution = max((east - west) / width, (north - south) / height,
+                         MIN_RESOLUTION)
+        center_x, center_y = (west + east) / 2, (south + north) / 2
+
+    half_width = width * resolution / 2
+    half_height = height * resolution / 2
+    return (center_x - half_width, center_y - half_height,
+            center_x + half_width, center_y + half_height)
+
+
+def get_render_query(layer, extent, tolerance):
+    """Query for the data of `layer` within `extent`, with geometries in web
+    mercator simplified to `tolerance` meters"""
+    columns = [col for col in layer.style_cols
+               if not layer.time or col != layer.time['column']]
+    return minify_sql((
+        'SELECT',
+        '    ST_SimplifyPreserveTopology(the_geom_webmercator, {tolerance})',
+        '        AS the_geom{comma}',
+        '    {cols}',
+        'FROM ({query}) AS _cf_render',
+        'WHERE the_geom_webmercator &&',
+        '    ST_MakeEnvelope({west}, {south}, {east}, {north}, 3857)',
+    )).format(tolerance=tolerance,
+              comma=',' if columns else '',
+              cols=', '.join(columns),
+              query=layer.query,
+              west=extent[0], south=extent[1],
+              east=extent[2], north=extent[3])
+
+
+def get_breaks(values, bins, bin_method):
+    """Get the upper bounds of each class of a quantitative classification
+
+    Args:
+        values (array-like): Values to classify. Nulls are ignored.
+        bins (int or list): Number of classes, or the list of upper bounds.
+        bin_method (str): One of the quantitative methods in
+          :obj:`BinMethod <cartoframes.styling.BinMethod>`.
+
+    Returns:
+        list of float: Sorted upper bound of each class.
+    """
+    if not isinstance(bins, int):
+        return sorted(bins)
+    values = np.asarray(pd.Series(values).dropna(), dtype=float)
+    if values.size == 0:
+        return []
+    if bin_method == BinMethod.equal:
+        breaks = np.linspace(values.min(), values.max(), bins + 1)[1:]
+    elif bin_method == BinMethod.jenks:
+        breaks = _jenks_breaks(values, bins)
+    elif bin_method == BinMethod.headtails:
+        breaks = _headtails_breaks(values, bins)
+    else:
+        breaks = np.percentile(values, np.linspace(0, 100, bins + 1)[1:])
+    return sorted(set(float(b) for b in breaks))
+
+
+def _headtails_breaks(values, bins):
+    """Head/tails breaks: split the values at their mean and keep splitting
+    the head (values above the mean) until there are `bins` classes"""
+    breaks = []
+    head = values
+    while len(breaks) < bins - 1 and head.size > 1:
+        mean = head.mean()
+        breaks.append(mean)
+        head = head[head > mean]
+    breaks.append(values.max())
+    return breaks
+
+
+def _jenks_breaks(values, bins):
+    """Jenks natural breaks (Fisher's exact optimization) computed over a
+    sample of at most `JENKS_SAMPLE_SIZE` values"""
+    values = np.sort(values)
+    if values.size > JENKS_SAMPLE_SIZE:
+        idx = np.linspace(0, values.size - 1, JENKS_SAMPLE_SIZE)
+        values = values[np.round(idx).astype(int)]
+    size = values.size
+    bins = min(bins, size)
+    cumsum = np.concatenate(([0.], np.cumsum(values)))
+    cumsum2 = np.concatenate(([0.], np.cumsum(values ** 2)))
+
+    def variance(start, end):
+        """sum of squared deviations of values[start:end], `start` can be
+        an array of positions"""
+        count = end - start
+        total = cumsum[end] - cumsum[start]
+        return cumsum2[end] - cumsum2[start] - total * total / count
+
+    # cost[k][j]: best cost of splitting values[:j] in k + 1 classes, and
+    #  split[k][j]: where its last class starts
+    cost = np.full((bins, size + 1), np.inf)
+    split = np.zeros((bins, size + 1), dtype=int)
+    cost[0][1:] = variance(0, np.arange(1, size + 1))
+    for klass in range(1, bins):
+        for end in range(klass + 1, size + 1):
+            starts = np.arange(klass, end)
+            candidates = cost[klass - 1][starts] + variance(starts, end)
+            best = int(np.argmin(candidates))
+            cost[klass][end] = candidates[best]
+            split[klass][end] = starts[best]
+
+    breaks = [values[-1]]
+    end = size
+    for klass in range(bins - 1, 0, -1):
+        end = split[klass][end]
+        breaks.append(values[end - 1])
+    return breaks[::-1]
+
+
+def classify(values, scheme_info):
+    """Assign a class to each value following a styling scheme
+
+    Args:
+        values (pandas.Series): Values of the styled column.
+        scheme_info (dict): Scheme from :obj:`cartoframes.styling`.
+
+    Returns:
+        tuple: Array with the class index of each value (``-1`` for nulls),
+        and the number of classes.
+    """
+    values = pd.Series(values).reset_index(drop=True)
+    bins = scheme_info['bins']
+    bin_method = scheme_info['bin_method']
+    nulls = values.isnull().values
+    classes = np.full(len(values), -1, dtype=int)
+
+    if bin_method == BinMethod.category or (
+            not isinstance(bins, int) and
+            not all(isinstance(b, (int, float)) for b in bins)):
+        if isinstance(bins, int):
+            # most frequent categories first, the rest are "others"
+            categories = list(
+                values.value_counts().index[:max(bins - 1, 0)])
+            nclasses = bins
+        else:
+            categories = list(bins)
+            nclasses = len(categories) + 1
+        lookup = {category: idx for idx, category in enumerate(categories)}
+        classes[~nulls] = [lookup.get(value, nclasses - 1)
+                           for value in values[~nulls]]
+        return classes, nclasses
+
+    breaks = get_breaks(values, bins, bin_method)
+    if not breaks:
+        return classes, 1
+    nclasses = len(breaks)
+    classes[~nulls] = np.minimum(
+        np.searchsorted(breaks, values[~nulls].astype(float).values),
+        nclasses - 1)
+    return classes, nclasses
+
+
+def get_colors(layer, data):
+    """Get the fill color of each row of `data` for `layer`"""
+    if not layer.scheme:
+        return [layer.color] * len(data)
+    classes, nclasses = classify(data[layer.color], layer.scheme)
+    palette = get_scheme_colors(layer.scheme, nclasses)
+    return [palette[klass] if klass >= 0 else NULL_COLOR
+            for klass in classes]
+
+
+def get_sizes(layer, data):
+    """Get the marker or line width of each row of `data` for `layer`"""
+    if not isinstance(layer.size, dict):
+        return np.full(len(data), float(layer.size))
+    classes, nclasses = classify(
+        data[layer.size['column']],
+        {'bins': layer.size['bins'], 'bin_method': layer.size['bin_method']})
+    min_size, max_size = layer.size['range']
+    steps = (np.linspace(min_size, max_size, nclasses) if nclasses > 1
+             else np.array([max_size], dtype=float))
+    return np.where(classes >= 0, steps[np.maximum(classes, 0)], min_size)
+
+
+def _parts(geom):
+    """Single part geometries of a (multi) geometry"""
+    if geom is None or geom.is_empty:
+        return []
+    return list(getattr(geom, 'geoms', [geom]))
+
+
+def _polygon_path(polygon, path_cls):
+    """matplotlib Path of a polygon with its holes"""
+    vertices = []
+    codes = []
+    for ring in [polygon.exterior] + list(polygon.interiors):
+        coords = np.asarray(ring.coords)[:, :2]
+        ring_codes = np.full(len(coords), path_cls.LINETO, dtype=path_cls.code_type)
+        ring_codes[0] = path_cls.MOVETO
+        ring_codes[-1] = path_cls.CLOSEPOLY
+        vertices.append(coords)
+        codes.append(ring_codes)
+    return path_cls(np.concatenate(vertices), np.concatenate(codes))
+
+
+def draw_layer(ax, layer, data, basemap):
+    """Draw the geometries in `data` on `ax` with the style of `layer`"""
+    from matplotlib.collections import LineCollection, PathCollection
+    from matplotlib.colors import to_rgba
+    from matplotlib.path import Path
+
+    if data.empty:
+        return
+    colors = get_colors(layer, data)
+    sizes = get_sizes(layer, data)
+    opacity = layer.opacity
+
+    shapes = []
+    shape_colors = []
+    shape_sizes = []
+    for geom, color, size in zip(data['geometry'], colors, sizes):
+        for part in _parts(geom):
+            shapes.append(part)
+            shape_colors.append(to_rgba(color, opacity))
+            shape_sizes.append(size)
+    if not shapes:
+        return
+
+    if layer.geom_type == 'point':
+        coords = np.array([(part.x, part.y) for part in shapes])
+        line_color = '#000' if basemap.source == 'dark' else '#FFF'
+        # marker-width is a diameter in pixels, scatter takes areas in
+        #  points^2, and one point is one pixel at 72 dpi
+        ax.scatter(coords[:, 0], coords[:, 1],
+                   s=np.asarray(shape_sizes) ** 2,
+                   c=shape_colors,
+                   edgecolors=line_color,
+                   linewidths=0.5)
+    elif layer.geom_type == 'line':
+        ax.add_collection(LineCollection(
+            [np.asarray(part.coords)[:, :2] for part in shapes],
+            colors=shape_colors,
+            linewidths=shape_sizes))
+    elif layer.geom_type == 'polygon':
+        ax.add_collection(PathCollection(
+            [_polygon_path(part, Path) for part in shapes],
+            facecolors=shape_colors,
+            edgecolors=[to_rgba('#FFF', 0.25)],
+            linewidths=0.5,
+            transform=ax.transData))
+    else:
+        raise ValueError('Unsupported geometry type: {}'.format(
+            layer.geom_type))
+
+
+def render_static(context, layers, size, extent, ax=None):
+    """Render a static map locally with matplotlib
+
+    Args:
+        context (:py:class:`CartoContext <cartoframes.context.CartoContext>`):
+          Context used to fetch the layer data.
+        layers (list): Layers already set up by :py:meth:`CartoContext.map
+          <cartoframes.context.CartoContext.map>`, with the basemap first.
+        size (tuple): ``(width, height)`` of the image in pixels.
+        extent (tuple): ``(west, south, east, north)`` in web mercator, see
+          :obj:`get_extent`.
+        ax (matplotlib.axes.Axes, optional): Axis to draw on. If not given, a
+          new figure attached to an Agg canvas is created.
+
+    Returns:
+        matplotlib.axes.Axes: Axis with the map drawn. Save it to a file with
+        ``ax.figure.savefig(...)``.
+    """
+    try:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+    except ImportError:
+        raise ImportError('The local static map renderer requires '
+                          'matplotlib. Install it with '
+                          '`pip install matplotlib`')
+
+    basemap = layers[0]
+    background = BASEMAP_BACKGROUNDS.get(
+        getattr(basemap, 'source', None), DEFAULT_BACKGROUND)
+    if ax is None:
+        fig = Figure(figsize=(size[0] / DPI, size[1] / DPI), dpi=DPI,
+                     frameon=False)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+
+    # simplify geometries below the size of one pixel
+    tolerance = (extent[2] - extent[0]) / size[0]
+    for layer in layers:
+        if layer.is_basemap:
+            continue
+        data = context.fetch(get_render_query(layer, extent, tolerance),
+                             decode_geom=True)
+        draw_layer(ax, layer, data, basemap)
+
+    ax.set_facecolor(background)
+    ax.set_xlim(extent[0], extent[2])
+    ax.set_ylim(extent[1], extent[3])
+    ax.set_aspect('equal')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    return ax
+
+
+def to_png(ax):
+    """PNG image of the figure of `ax`, as bytes"""
+    from io import BytesIO
+    output = BytesIO()
+    ax.figure.savefig(output, format='png', dpi=ax.figure.dpi)
+    return output.getvalue()
@@ -83,13 +83,5 @@ def temp_ignore_warnings(func):
 # schema definition functions
 def dtypes2pg(dtype):
     """Returns equivalent PostgreSQL type for input `dtype`"""
-    mapping = {
-        'float64': 'numeric',
-        'int64': 'numeric',
-        'float32': 'numeric',
-        'int32': 'numeric',
-        'object': 'text',
-        'bool': 'boolean',
-        'datetime64[ns]': 'timestamp',
-    }
-    return mapping.get(str(dtype), 'text')
+    from .columns import dtypes2pg as _dtypes2pg
+    return _dtypes2pg(dtype)
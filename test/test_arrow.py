@@ -0,0 +1,105 @@
+"""Unit tests for cartoframes.arrow"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cartoframes.arrow import (ArrowSource, arrow2pg, binary_to_hex, get_arrow_query, hex_to_binary,
+                               read_arrow, spill_arrow, open_spill)
+from cartoframes.columns import Schema
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class TestArrow(unittest.TestCase):
+    """Tests for reading query results into Arrow tables"""
+    def setUp(self):
+        self.schema = Schema.from_sql_api_fields({
+            'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+            'the_geom': {'type': 'geometry', 'pgtype': 'geometry'},
+            'name': {'type': 'string', 'pgtype': 'text'},
+            'updated_at': {'type': 'date', 'pgtype': 'timestamptz'},
+            'visited': {'type': 'boolean', 'pgtype': 'bool'},
+        })
+
+    def test_get_arrow_query(self):
+        self.assertEqual(
+            get_arrow_query('SELECT * FROM cities', self.schema),
+            'SELECT "cartodb_id", ST_AsBinary("the_geom") AS "the_geom", "name", "updated_at", "visited" '
+            'FROM (SELECT * FROM cities) _q')
+        schema = self.schema.select(['cartodb_id', 'name'])
+        self.assertEqual(get_arrow_query('SELECT cartodb_id, name FROM cities', schema),
+                         'SELECT cartodb_id, name FROM cities')
+
+    def test_hex_to_binary(self):
+        array = pa.array(['\\x0102', None, 'ff', '\\x'])
+        self.assertEqual(hex_to_binary(array).to_pylist(), [b'\x01\x02', None, b'\xff', b''])
+        self.assertEqual(hex_to_binary(array.slice(2)).to_pylist(), [b'\xff', b''])
+
+    def test_read_arrow(self):
+        stream = io.BytesIO(
+            b'cartodb_id,the_geom,name,updated_at,visited\n'
+            b'1,\\x0101000000000000000000f03f000000000000f03f,Paris,2019-01-01 10:00:00+00,t\n'
+            b'2,,,,f\n')
+        table = read_arrow(stream, self.schema)
+
+        self.assertEqual(table.column_names, ['cartodb_id', 'the_geom', 'name', 'updated_at', 'visited'])
+        self.assertEqual(table.schema.field('cartodb_id').type, pa.int32())
+        self.assertEqual(table.schema.field('updated_at').type, pa.timestamp('us', 'UTC'))
+        self.assertEqual(table.column('visited').to_pylist(), [True, False])
+        self.assertEqual(table.column('name').to_pylist(), ['Paris', None])
+
+        geom_field = table.schema.field('the_geom')
+        self.assertEqual(geom_field.type, pa.binary())
+        self.assertEqual(geom_field.metadata[b'ARROW:extension:name'], b'geoarrow.wkb')
+        self.assertEqual(table.column('the_geom').to_pylist(),
+                         [b'\x01\x01\x00\x00\x00' + b'\x00' * 6 + b'\xf0\x3f' + b'\x00' * 6 + b'\xf0\x3f',
+                          None])
+
+    def test_spill_arrow(self):
+        csv = (b'cartodb_id,the_geom,name,updated_at,visited\n' +
+               b''.join(b'%d,,city %d,,t\n' % (i, i) for i in range(1000)))
+        directory = tempfile.mkdtemp()
+        try:
+            parquet_path = os.path.join(directory, 'cities.parquet')
+            dataset = spill_arrow(io.BytesIO(csv), self.schema, parquet_path, block_size=4096)
+            self.assertEqual(dataset.count_rows(), 1000)
+            self.assertEqual(dataset.to_table().column('name')[999].as_py(), 'city 999')
+            self.assertEqual(open_spill(parquet_path).schema.field('the_geom').type, pa.binary())
+
+            feather_path = os.path.join(directory, 'cities.feather')
+            table = spill_arrow(io.BytesIO(csv), self.schema, feather_path, block_size=4096)
+            self.assertEqual(table.num_rows, 1000)
+            self.assertEqual(open_spill(feather_path).column('cartodb_id')[999].as_py(), 999)
+
+            with self.assertRaises(ValueError):
+                spill_arrow(io.BytesIO(csv), self.schema, os.path.join(directory, 'cities.csv'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_binary_to_hex(self):
+        array = pa.array([b'\x01\xab', None, b'\xff\x00'])
+        self.assertEqual(binary_to_hex(array, b'SRID=4326;').to_pylist(),
+                         ['SRID=4326;01AB', None, 'SRID=4326;FF00'])
+        self.assertEqual(hex_to_binary(binary_to_hex(array)).to_pylist(), array.to_pylist())
+
+    def test_arrow2pg(self):
+        self.assertEqual(arrow2pg(pa.int64()), 'bigint')
+        self.assertEqual(arrow2pg(pa.uint16()), 'integer')
+        self.assertEqual(arrow2pg(pa.float32()), 'numeric')
+        self.assertEqual(arrow2pg(pa.timestamp('ms', 'UTC')), 'timestamptz')
+        self.assertEqual(arrow2pg(pa.dictionary(pa.int8(), pa.string())), 'text')
+
+    def test_arrow_source_geoparquet(self):
+        metadata = {b'geo': b'{"primary_column": "shape", "columns": {"shape": {"geometry_types": ["Polygon"]}}}'}
+        table = pa.table({'name': ['a'], 'shape': [b'\x00']}).replace_schema_metadata(metadata)
+        source = ArrowSource(table)
+        self.assertEqual(source.geom_col, 'shape')
+        self.assertEqual(source.geom_type, 'Polygon')
+        self.assertEqual(source.column_names, ['name'])
+        self.assertEqual(source.get_num_rows(), 1)
@@ -0,0 +1,76 @@
+"""Unit tests for cartoframes.cache"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cartoframes.cache import StaticMapCache
+
+
+class TestStaticMapCache(unittest.TestCase):
+    """Tests for StaticMapCache"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = '{"sql_0": "SELECT * FROM acadia"}'
+        self.view = {'zoom': 4, 'lat': 0, 'lon': 0}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_key(self):
+        """cache.StaticMapCache.get_key"""
+        key = StaticMapCache.get_key('map', self.config, self.view, (800, 400))
+        self.assertEqual(
+            key,
+            StaticMapCache.get_key('map', self.config,
+                                   {'lon': 0, 'lat': 0, 'zoom': 4},
+                                   (800, 400)))
+        self.assertNotEqual(
+            key,
+            StaticMapCache.get_key('map', self.config, self.view, (400, 400)))
+        self.assertNotEqual(
+            key,
+            StaticMapCache.get_key('map', self.config, {'bbox': '0,0,1,1'},
+                                   (800, 400)))
+
+    def test_get_set(self):
+        """cache.StaticMapCache.get and set"""
+        cache = StaticMapCache(self.directory)
+        key = cache.get_key('map', self.config, self.view, (800, 400))
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, b'png', fingerprint='2019-01-01')
+        self.assertEqual(cache.get(key), b'png')
+        self.assertEqual(cache.get(key, fingerprint='2019-01-01'), b'png')
+
+        # stale entries are removed
+        self.assertIsNone(cache.get(key, fingerprint='2019-02-01'))
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, b'png')
+        cache.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_ttl(self):
+        """cache.StaticMapCache ttl"""
+        cache = StaticMapCache(self.directory, ttl=60)
+        cache.set('expired', b'png')
+        cache.set('valid', b'png')
+        expired_meta = cache._paths('expired')[1]
+        with open(expired_meta, 'w') as meta_file:
+            meta_file.write('{"created": %f}' % (time.time() - 120))
+        self.assertIsNone(cache.get('expired'))
+        self.assertEqual(cache.get('valid'), b'png')
+
+    def test_eviction(self):
+        """cache.StaticMapCache max_size"""
+        cache = StaticMapCache(self.directory, max_size=10)
+        cache.set('first', b'12345')
+        cache.set('second', b'12345')
+        os.utime(cache._paths('first')[0], (1, 1))
+        os.utime(cache._paths('second')[0], (2, 2))
+        cache.set('third', b'12345')
+        self.assertIsNone(cache.get('first'))
+        self.assertEqual(cache.get('second'), b'12345')
+        self.assertEqual(cache.get('third'), b'12345')
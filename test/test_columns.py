@@ -3,7 +3,9 @@
 """Unit tests for cartoframes.columns"""
 import unittest
 
-from cartoframes.columns import Column, normalize_names, pg2dtypes
+import pandas as pd
+
+from cartoframes.columns import Column, Schema, normalize_names, pg2dtypes, dtypes, date_columns_names
 
 
 class TestColumns(unittest.TestCase):
@@ -69,6 +71,22 @@ class TestColumns(unittest.TestCase):
     def test_normalize_names_unchanged(self):
         self.assertListEqual(normalize_names(self.cols_ans), self.cols_ans)
 
+    def test_normalize_names_collisions(self):
+        self.assertListEqual(normalize_names(['a', 'a', 'a', 'a_1', 'a']),
+                             ['a', 'a_1', 'a_1_2', 'a_1_1', 'a_1_2_3'])
+
+    def test_normalize_names_wide(self):
+        cols = ['Total population: {}'.format(i % 100) for i in range(1000)]
+        expected = []
+        for col in cols:
+            expected.append(Column(col).normalize(forbidden_column_names=expected).name)
+
+        self.assertListEqual(normalize_names(cols), expected)
+
+    def test_normalize_names_empty(self):
+        with self.assertRaises(ValueError):
+            normalize_names(['a', ''])
+
     def test_pg2dtypes(self):
         results = {
             'date': 'datetime64[D]',
@@ -81,3 +99,74 @@ class TestColumns(unittest.TestCase):
         for i in results:
             result = pg2dtypes(i)
             self.assertEqual(result, results[i])
+
+    def test_schema(self):
+        fields = {
+            'cartodb_id': {'type': 'number'},
+            'the_geom': {'type': 'geometry'},
+            'name': {'type': 'string'},
+            'value': {'type': 'number'},
+            'created': {'type': 'date'},
+        }
+        schema = Schema.from_sql_api_fields(fields)
+
+        self.assertEqual(schema.names, ('cartodb_id', 'the_geom', 'name', 'value', 'created'))
+        self.assertEqual(len(schema), 5)
+        self.assertIn('name', schema)
+        self.assertEqual(schema['value'].dtype, 'float64')
+        self.assertEqual(schema.names_by_pgtype('number'), ('cartodb_id', 'value'))
+        self.assertEqual(schema.date_columns, ('created', ))
+        self.assertEqual(schema.geom_columns, ('the_geom', ))
+        self.assertEqual(schema.get_dtypes(exclude_dates=True, exclude_the_geom=True),
+                         {'cartodb_id': 'int64', 'name': 'object', 'value': 'float64'})
+        self.assertEqual(list(schema.get_converters()), ['the_geom'])
+
+        # list of columns helpers share the schema lookups
+        columns = list(schema)
+        self.assertEqual(dtypes(columns), schema.get_dtypes())
+        self.assertEqual(date_columns_names(columns), ['created'])
+
+        with self.assertRaises(AttributeError):
+            schema.names = ('a', )
+
+    def test_schema_from_dataframe(self):
+        df = pd.DataFrame({'Big Number': [2 ** 40], 'b': [1.5], 'c': ['x']})
+        schema = Schema.from_dataframe(df, [('big_number', 'Big Number'), ('b', 'b'), ('c', 'c')])
+
+        self.assertEqual(schema.names, ('big_number', 'b', 'c'))
+        self.assertEqual(schema.pgtypes, ('bigint', 'numeric', 'text'))
+
+    def test_schema_compact_dtypes(self):
+        fields = {
+            'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+            'small': {'type': 'number', 'pgtype': 'int2'},
+            'big': {'type': 'number', 'pgtype': 'int8'},
+            'ratio': {'type': 'number', 'pgtype': 'float4'},
+            'value': {'type': 'number'},
+            'flag': {'type': 'boolean'},
+            'name': {'type': 'string', 'pgtype': 'text'},
+            'kind': {'type': 'string', 'pgtype': 'varchar'},
+        }
+        schema = Schema.from_sql_api_fields(fields)
+
+        self.assertEqual(schema.text_columns, ('name', 'kind'))
+        self.assertEqual(schema.get_dtypes(dtype_backend='compact', category_columns=['kind']), {
+            'cartodb_id': 'int64',
+            'small': 'Int16',
+            'big': 'Int64',
+            'ratio': 'float32',
+            'value': 'float64',
+            'flag': 'boolean',
+            'name': 'object',
+            'kind': 'category',
+        })
+        # default backend is unchanged
+        self.assertEqual(schema.get_dtypes()['small'], 'float64')
+
+        # information_schema types
+        self.assertEqual(Column('a', pgtype='integer').compact_dtype, 'Int32')
+        self.assertEqual(Column('a', pgtype='real').compact_dtype, 'float32')
+        self.assertEqual(Column('a', pgtype='text').compact_dtype, 'object')
+
+        with self.assertRaises(ValueError):
+            schema.get_dtypes(dtype_backend='arrow')
@@ -255,6 +255,129 @@ class TestContribVector(unittest.TestCase, _UserUrlLoader):
             {'west': None, 'south': None, 'east': None, 'north': None}
         )
 
+    @unittest.skipIf(not HAS_GEOPANDAS, 'no tests if geopandas is not present')
+    def test_vector_local_binary_encoding(self):
+        """contrib.vector.LocalLayer with binary encoding"""
+        import base64
+        import numpy as np
+        from shapely.geometry import Point, Polygon, MultiLineString
+        gdf = gpd.GeoDataFrame({
+            'name': ['a', 'b', 'c'],
+            'value': [1.5, None, 3],
+            'geometry': [
+                Point(-73.9857, 40.7484),
+                Polygon([(0, 0), (1, 0), (1, 1), (0, 0)],
+                        [[(0.2, 0.1), (0.8, 0.1), (0.8, 0.7), (0.2, 0.1)]]),
+                MultiLineString([[(10, 10), (20, 20)], [(-10.5, 3), (4, 5)]]),
+            ]
+        })
+        layer = vector.LocalLayer(gdf, encoding='binary', precision=4)
+        self.assertEqual(layer.encoding, 'binary')
+
+        data = json.loads(layer._encoded_data)
+        lengths = np.frombuffer(base64.b64decode(data['lengths']), '<u4')
+        coords = np.cumsum(
+            np.frombuffer(base64.b64decode(data['coords']), '<i4')
+            .reshape(-1, 2), axis=0) / float(data['scale'])
+
+        self.assertEqual(data['types'], [0, 2, 4])
+        # polygon: 2 rings of 4 points, multilinestring: 2 lines of 2 points
+        self.assertListEqual(lengths.tolist(), [2, 4, 4, 2, 2, 2])
+        self.assertListEqual(coords[0].tolist(), [-73.9857, 40.7484])
+        self.assertListEqual(coords[-2].tolist(), [-10.5, 3])
+        self.assertEqual(len(coords), 13)
+        self.assertListEqual(data['properties']['columns'], ['name', 'value'])
+        self.assertListEqual(data['properties']['data'][1], ['b', None])
+
+        with self.assertRaises(ValueError):
+            vector.LocalLayer(gdf, encoding='flatgeobuf')
+        with self.assertRaises(ValueError):
+            vector.LocalLayer(gdf, encoding='binary', precision=9)
+
+    @unittest.skipIf(not HAS_GEOPANDAS, 'no tests if geopandas is not present')
+    def test_vector_local_simplify(self):
+        """contrib.vector.LocalLayer geometry simplification"""
+        from shapely.geometry import LineString
+        line = LineString([(0, 0), (0.5, 0.0001), (1, 0)])
+        gdf = gpd.GeoDataFrame({'geometry': [line]})
+
+        layer = vector.LocalLayer(gdf, simplify=4)
+        feature = json.loads(layer._encoded_data)['features'][0]
+        self.assertEqual(len(feature['geometry']['coordinates']), 2)
+        # bounds are computed on the original geometries
+        self.assertEqual(layer.bounds[3], 0.0001)
+
+        layer = vector.LocalLayer(gdf)
+        feature = json.loads(layer._encoded_data)['features'][0]
+        self.assertEqual(len(feature['geometry']['coordinates']), 3)
+
+    def test_vector_layer_style_columns(self):
+        """contrib.vector.QueryLayer._get_style_columns"""
+        layer = vector.Layer(
+            'points',
+            color='ramp(globalQuantiles($price, 5), sunset)',
+            size='sqrt($price) + $rooms',
+            interactivity=['name', 'rooms'])
+        self.assertListEqual(layer._get_style_columns(),
+                             ['name', 'rooms', 'price'])
+
+        self.assertIsNone(vector.Layer('points').aggregation)
+        self.assertDictEqual(
+            vector.Layer('points', aggregation={'threshold': 10}).aggregation,
+            {'threshold': 10, 'resolution': 4})
+        with self.assertRaises(ValueError):
+            vector.Layer('points', aggregation={'radius': 10})
+
+    def test_vector_layer_aggregation(self):
+        """contrib.vector._setup_aggregation"""
+        class FakeSQLClient(object):
+            def __init__(self, num_rows, geom_type):
+                self.num_rows = num_rows
+                self.geom_type = geom_type
+
+            def send(self, query, **kwargs):
+                if query.startswith('EXPLAIN'):
+                    plan = [{'Plan': {'Plan Rows': self.num_rows}}]
+                    return {'rows': [{'QUERY PLAN': plan}]}
+                if 'LIMIT 0' in query:
+                    return {'fields': {'price': {'type': 'number'},
+                                       'name': {'type': 'string'}}}
+                return {'rows': [{'geom_type': self.geom_type}]}
+
+        class FakeContext(object):
+            def __init__(self, num_rows, geom_type):
+                self.sql_client = FakeSQLClient(num_rows, geom_type)
+
+        def make_layer():
+            return vector.Layer('points',
+                                color='ramp($price, sunset)',
+                                size='$cf_count / 10',
+                                interactivity='name',
+                                aggregation={'threshold': 1000})
+
+        # large point layers are aggregated
+        layer = make_layer()
+        vector._setup_aggregation(layer, FakeContext(5000, 'ST_Point'))
+        self.assertIn('avg(price) AS price', layer.query)
+        self.assertIn('mode() WITHIN GROUP (ORDER BY name) AS name',
+                      layer.query)
+        self.assertIn('count(*) AS cf_count', layer.query)
+        self.assertIn('!pixel_width!', layer.query)
+        self.assertEqual(layer.orig_query, 'SELECT * FROM points')
+
+        # small layers only select the columns used
+        layer = make_layer()
+        vector._setup_aggregation(layer, FakeContext(500, 'ST_Point'))
+        self.assertEqual(
+            layer.query,
+            'SELECT cartodb_id, the_geom, the_geom_webmercator, name, price, '
+            '1 AS cf_count\nFROM (SELECT * FROM points) AS _cf_pruned')
+
+        # polygons are never aggregated
+        layer = make_layer()
+        vector._setup_aggregation(layer, FakeContext(5000, 'ST_Polygon'))
+        self.assertIn('_cf_pruned', layer.query)
+
     def test_vector__get_super_bounds(self):
         """"""
         cc = cartoframes.CartoContext(base_url=self.baseurl,
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 """Unit tests for cartoframes.context"""
+import io
 import unittest
 import os
 import sys
@@ -10,11 +11,23 @@ import warnings
 from carto.exceptions import CartoException
 
 from cartoframes.context import CartoContext
-from cartoframes.datasets import Dataset, _decode_geom
+from cartoframes.datasets import (Dataset, BulkLoad, _decode_geom, _decode_twkb, _decode_geojson,
+                                  _encode_geom_column, _get_geom_col_type, to_geodataframe)
 from cartoframes.columns import normalize_name
+from cartoframes.instrumentation import Instrumentation
 
 from utils import _UserUrlLoader
 
+try:
+    import geopandas
+except ImportError:
+    geopandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 WILL_SKIP = False
 warnings.filterwarnings("ignore")
 
@@ -289,3 +302,445 @@ class TestDataset(unittest.TestCase, _UserUrlLoader):
                 '''.format(table=table_name))
         except CartoException as e:
             self.assertTrue('relation "{}" does not exist'.format(table_name) in str(e))
+
+
+class FakeSQLClient(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.queries = []
+
+    def send(self, query, **kwargs):
+        self.queries.append(query)
+        for key, response in self.responses:
+            if key in query:
+                return response
+        raise CartoException('Unexpected query')
+
+
+class FakeCopyClient(object):
+    def __init__(self):
+        self.queries = []
+        self.data = []
+
+    def copyfrom(self, query, iterable):
+        self.queries.append(query)
+        self.data.append(b''.join(iterable))
+
+
+class FakeBatchSQLClient(object):
+    def __init__(self):
+        self.jobs = []
+
+    def create_and_wait_for_completion(self, query):
+        self.jobs.append(query)
+        return {'status': 'done'}
+
+
+class FakeContext(object):
+    def __init__(self, responses):
+        self.sql_client = FakeSQLClient(responses)
+        self.copy_client = FakeCopyClient()
+        self.batch_sql_client = FakeBatchSQLClient()
+        self.is_org = False
+
+    def _debug_print(self, **kwargs):
+        pass
+
+
+class TestDatasetCategoryColumns(unittest.TestCase):
+    """Tests for the detection of categorical columns"""
+    def test_get_category_columns(self):
+        from cartoframes.datasets import get_category_columns
+        cc = FakeContext([
+            ('count(DISTINCT', {'rows': [{'kind': 3, 'name': 900, '_cf_sample_size': 1000}]}),
+        ])
+
+        self.assertEqual(get_category_columns(cc, 'SELECT * FROM t', ['kind', 'name']), ['kind'])
+        self.assertIn('LIMIT 10000', cc.sql_client.queries[0])
+        self.assertEqual(get_category_columns(cc, 'SELECT * FROM t', []), [])
+
+    def test_dataset_category_columns_from_stats(self):
+        from cartoframes.columns import Column, Schema
+        cc = FakeContext([
+            ('pg_stats', {'rows': [
+                {'attname': 'kind', 'n_distinct': 5, 'reltuples': 1000},
+                {'attname': 'name', 'n_distinct': -0.9, 'reltuples': 1000},
+                {'attname': 'code', 'n_distinct': -0.05, 'reltuples': 1000},
+            ]}),
+            ('count(DISTINCT', {'rows': [{'other': 1, '_cf_sample_size': 100}]}),
+        ])
+        schema = Schema(Column(name, pgtype='text') for name in ('kind', 'name', 'code', 'other'))
+        dataset = Dataset(cc, 'table')
+
+        self.assertEqual(dataset._get_category_columns(schema, 'SELECT * FROM table'),
+                         ['kind', 'code', 'other'])
+
+
+class TestDatasetReadQuery(unittest.TestCase):
+    """Tests for the read query of a dataset"""
+    def setUp(self):
+        from cartoframes.columns import Column, Schema
+        self.schema = Schema(Column(name, pgtype=pgtype) for name, pgtype in (
+            ('cartodb_id', 'integer'),
+            ('the_geom', 'USER-DEFINED'),
+            ('the_geom_webmercator', 'USER-DEFINED'),
+            ('state', 'text'),
+            ('population', 'integer'),
+        ))
+        self.dataset = Dataset(FakeContext([]), 'cities')
+
+    def test_read_columns(self):
+        dataset = self.dataset
+        self.assertEqual(dataset._get_read_columns(self.schema),
+                         ['cartodb_id', 'the_geom', 'state', 'population'])
+        self.assertEqual(dataset._get_read_columns(self.schema, ['population']),
+                         ['cartodb_id', 'population'])
+        self.assertEqual(dataset._get_read_columns(self.schema, 'population', decode_geom=True),
+                         ['cartodb_id', 'population', 'the_geom'])
+        with self.assertRaises(ValueError):
+            dataset._get_read_columns(self.schema, ['population', 'area'])
+
+    def test_read_query(self):
+        dataset = self.dataset
+        read_schema = self.schema.select(['cartodb_id', 'population'])
+
+        self.assertEqual(dataset._get_read_query(self.schema),
+                         'SELECT cartodb_id, the_geom, state, population FROM "public"."cities"')
+        self.assertEqual(
+            dataset._get_read_query(read_schema, limit=10, where="state = 'NY'",
+                                    order_by=['population DESC', 'cartodb_id']),
+            'SELECT cartodb_id, population FROM "public"."cities" '
+            'WHERE state = \'NY\' ORDER BY population DESC, cartodb_id LIMIT 10')
+        self.assertEqual(dataset._get_read_query(read_schema, sample=0.1),
+                         'SELECT cartodb_id, population FROM "public"."cities" TABLESAMPLE BERNOULLI (10.0)')
+        with self.assertRaises(ValueError):
+            dataset._get_read_query(read_schema, sample=2)
+
+    def test_read_query_geometries(self):
+        dataset = self.dataset
+        read_schema = self.schema.select(['cartodb_id', 'the_geom'])
+
+        self.assertEqual(
+            dataset._get_read_query(read_schema, simplify_tolerance=0.01, precision=3),
+            'SELECT cartodb_id, ST_QuantizeCoordinates(ST_SimplifyPreserveTopology(the_geom, 0.01), 3) '
+            'AS the_geom FROM "public"."cities"')
+        self.assertEqual(
+            dataset._get_read_query(read_schema, geom_format='twkb'),
+            'SELECT cartodb_id, ST_AsTWKB(the_geom, 6) AS the_geom FROM "public"."cities"')
+        self.assertEqual(
+            dataset._get_read_query(read_schema, precision=4, geom_format='geojson'),
+            'SELECT cartodb_id, ST_AsGeoJSON(the_geom, 4) AS the_geom FROM "public"."cities"')
+        with self.assertRaises(ValueError):
+            dataset._get_read_query(read_schema, geom_format='wkt')
+        with self.assertRaises(ValueError):
+            dataset._get_read_query(read_schema, precision=1.5)
+
+
+class TestDecodeGeometries(unittest.TestCase):
+    """Tests for the decoding of TWKB and GeoJSON geometries"""
+    def test_decode_twkb(self):
+        from shapely.geometry import Point, Polygon, MultiPoint
+        self.assertEqual(_decode_twkb('\\x01000202'), Point(1, 1))
+        self.assertEqual(_decode_twkb('4100ac02c103'), Point(1.5, -2.25))
+        # bounding box is skipped
+        self.assertEqual(_decode_twkb('0101020002000202'), Point(1, 1))
+        self.assertEqual(_decode_twkb('0300010500000200000201000001'),
+                         Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]))
+        # coordinates are deltas from the previous point
+        self.assertEqual(_decode_twkb('040002' '0202' '0204'),
+                         MultiPoint([(1, 1), (2, 3)]))
+        self.assertIsNone(_decode_twkb('0110'))
+        self.assertIsNone(_decode_twkb(None))
+
+    def test_decode_geojson(self):
+        from shapely.geometry import Point
+        self.assertEqual(_decode_geojson('{"type":"Point","coordinates":[1.5,-2]}'),
+                         Point(1.5, -2))
+        self.assertIsNone(_decode_geojson(''))
+
+
+@unittest.skipIf(geopandas is None, 'geopandas is not installed')
+class TestDatasetGeoDataFrame(unittest.TestCase):
+    """Tests for reading and writing GeoDataFrames"""
+    def setUp(self):
+        from shapely.geometry import Point
+        self.gdf = geopandas.GeoDataFrame({'name': ['a', 'b']}, geometry=[Point(1, 2), None], crs='epsg:4326')
+
+    def test_to_geodataframe(self):
+        import pandas as pd
+        from shapely.geometry import Point
+        df = pd.DataFrame({'name': ['a', 'b', 'c'],
+                           'the_geom': ['0101000020E6100000000000000000F03F0000000000000040', '', None]})
+        gdf = to_geodataframe(df)
+        self.assertIsInstance(gdf, geopandas.GeoDataFrame)
+        self.assertEqual(gdf.geometry.name, 'geometry')
+        self.assertEqual(gdf.crs, 'epsg:4326')
+        self.assertEqual(gdf.geometry[0], Point(1, 2))
+        self.assertTrue(gdf.geometry[1:].isna().all())
+
+    def test_to_geodataframe_invalid(self):
+        import pandas as pd
+        from shapely.geometry import Point
+        df = pd.DataFrame({'the_geom': ['0101000020E6100000000000000000F03F0000000000000040', 'not a geometry',
+                                        '0101', 'POINT (3 4)']})
+        gdf = to_geodataframe(df)
+        self.assertEqual(gdf.geometry[0], Point(1, 2))
+        self.assertTrue(gdf.geometry[1:3].isna().all())
+        self.assertEqual(gdf.geometry[3], Point(3, 4))
+
+    def test_encode_geom_column(self):
+        self.assertEqual(_encode_geom_column(self.gdf.geometry),
+                         ['0101000020E6100000000000000000F03F0000000000000040', None])
+        # reprojected to EPSG:4326
+        encoded = _encode_geom_column(self.gdf.to_crs(epsg=3857).geometry)[0]
+        self.assertTrue(encoded.startswith('0101000020E6100000'))
+
+    def test_rows(self):
+        gdf = self.gdf.rename_axis('idx')
+        gdf.sindex
+        dataset = Dataset(FakeContext([]), 'points', df=gdf)
+        self.assertTrue(gdf.has_sindex)
+        self.assertEqual(list(dataset._rows(gdf, ['idx', 'name', 'geometry'], None, 'geometry')),
+                         [b'0|a|0101000020E6100000000000000000F03F0000000000000040\n', b'1|b|\n'])
+
+    def test_rows_with_lonlat(self):
+        df = self.gdf.assign(lng=[3, 5], lat=[4, 6])
+        context = FakeContext([])
+        context.instrumentation = Instrumentation()
+        spans = []
+        context.instrumentation.add_hook(spans.append)
+        dataset = Dataset(context, 'points', df=df)
+        self.assertEqual(list(dataset._rows(df, ['name', 'geometry', 'lng', 'lat'], ('lng', 'lat'), 'geometry')),
+                         [b'a|3|4|SRID=4326;POINT(3 4)\n', b'b|5|6|SRID=4326;POINT(5 6)\n'])
+        # the geometries, replaced by the points, are not encoded
+        self.assertNotIn('encode', [span.name for span in spans])
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestDatasetFromFile(unittest.TestCase):
+    """Tests for uploading files and Arrow data"""
+    def setUp(self):
+        self.table = pyarrow.table({
+            'cartodb_id': [1, 2],
+            'Station Name': ['a', 'b'],
+            'riders': pyarrow.array([10, None], pyarrow.int32()),
+            'geom': pyarrow.array([b'\x01\x01\x00\x00\x00' + b'\x00' * 6 + b'\xf0\x3f' + b'\x00' * 6 + b'\xf0\x3f',
+                                   None]),
+        })
+
+    def test_from_file(self):
+        import pyarrow.parquet
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'stations.parquet')
+            pyarrow.parquet.write_table(self.table, path, row_group_size=1)
+
+            context = FakeContext([])
+            dataset = Dataset.from_parquet(context, path, 'stations')
+            self.assertEqual(dataset._create_table_query(),
+                             'CREATE TABLE stations (station_name text, riders integer, '
+                             'the_geom geometry(Geometry, 4326))')
+
+            dataset._copyfrom()
+            self.assertIn('COPY stations(station_name,riders,the_geom)', context.copy_client.queries[0])
+            self.assertEqual(context.copy_client.data[0],
+                             b'"a",10,"SRID=4326;0101000000000000000000F03F000000000000F03F"\n'
+                             b'"b",,\n')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_from_csv_file_types(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'stations.csv')
+            # the types change after the first block read from the file
+            with open(path, 'w') as csv_file:
+                csv_file.write('name,riders,code\n')
+                csv_file.write(''.join(',{0},{0}\n'.format(i) for i in range(200000)))
+                csv_file.write('hello,2.5,x\n')
+
+            context = FakeContext([])
+            dataset = Dataset.from_file(context, path, 'stations')
+            self.assertEqual(dataset._create_table_query(),
+                             'CREATE TABLE stations (name text, riders numeric, code text)')
+            dataset._copyfrom()
+            self.assertTrue(context.copy_client.data[0].endswith(b'"",199999,"199999"\n"hello",2.5,"x"\n'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_from_file_errors(self):
+        with self.assertRaises(ValueError):
+            Dataset.from_file(FakeContext([]), 'stations.xlsx', 'stations')
+        with self.assertRaises(ValueError):
+            Dataset.from_file(FakeContext([]), self.table, 'stations', geom_col='the_geom')
+        dataset = Dataset.from_file(FakeContext([]), self.table, 'stations')
+        with self.assertRaises(ValueError):
+            dataset.upload(with_lonlat=('lng', 'lat'))
+
+
+class TestDatasetFromChunks(unittest.TestCase):
+    """Tests for uploading iterators of DataFrames"""
+    def test_from_chunks(self):
+        import pandas as pd
+        chunks = pd.read_csv(io.StringIO('name,riders\na,1\nb,2\nc,\n'), chunksize=2)
+        context = FakeContext([])
+        dataset = Dataset.from_chunks(context, chunks, 'stations')
+        self.assertEqual(dataset._create_table_query(),
+                         'CREATE TABLE stations (name text, riders bigint)')
+
+        dataset._copyfrom()
+        self.assertEqual(len(context.copy_client.queries), 1)
+        self.assertEqual(context.copy_client.data[0], b'a|1|\nb|2|\nc||\n')
+
+    def test_from_chunks_errors(self):
+        import pandas as pd
+        with self.assertRaises(ValueError):
+            Dataset.from_chunks(FakeContext([]), iter([]), 'stations')
+
+        chunks = [pd.DataFrame({'name': ['a']}), pd.DataFrame({'station': ['b']})]
+        dataset = Dataset.from_chunks(FakeContext([]), chunks, 'stations')
+        with self.assertRaises(ValueError):
+            dataset._copyfrom()
+
+    def test_from_chunks_geom_type(self):
+        import pandas as pd
+        from shapely import wkb
+        from shapely.geometry import MultiPoint, Point, Polygon
+
+        def chunks(*geoms):
+            return [pd.DataFrame({'the_geom': [geom]}) for geom in geoms]
+
+        # the table is created from the first DataFrame, and single
+        # geometries of the rest are promoted
+        context = FakeContext([])
+        dataset = Dataset.from_chunks(context, chunks(MultiPoint([(1, 2)]), None, Point(3, 4)), 'stations')
+        self.assertIn('geometry(MultiPoint, 4326)', dataset._create_table_query())
+        dataset._copyfrom()
+        self.assertEqual(wkb.loads(context.copy_client.data[0].splitlines()[-1], hex=True), MultiPoint([(3, 4)]))
+
+        square = Polygon([(0, 0), (1, 0), (1, 1), (0, 0)])
+        for geoms in ((Point(1, 2), square), (Point(1, 2), Point(1, 2, 3)), (None, Point(1, 2, 3))):
+            dataset = Dataset.from_chunks(FakeContext([]), chunks(*geoms), 'stations')
+            with self.assertRaises(ValueError):
+                dataset._copyfrom()
+
+
+class TestDatasetGeometryType(unittest.TestCase):
+    """Tests for the geometry type of the tables created for DataFrames"""
+    def test_get_geom_col_type(self):
+        import pandas as pd
+        from shapely.geometry import Point, LineString, Polygon, MultiPolygon
+        square = Polygon([(0, 0), (1, 0), (1, 1), (0, 0)])
+
+        def geom_type(geoms):
+            return _get_geom_col_type(pd.DataFrame({'the_geom': geoms}))
+
+        self.assertEqual(geom_type([None, square]), 'Polygon')
+        # the type is computed from all the geometries, not the first one
+        self.assertEqual(geom_type([square, None, MultiPolygon([square])]), 'MultiPolygon')
+        self.assertEqual(geom_type(['POINT(1 2)', 'MULTIPOINT(1 2, 3 4)']), 'MultiPoint')
+        self.assertEqual(geom_type([Point(1, 2), LineString([(0, 0), (1, 1)])]), 'Geometry')
+        self.assertEqual(geom_type([Point(1, 2, 3)]), 'PointZ')
+        with self.assertRaises(ValueError):
+            geom_type([Point(1, 2, 3), Point(1, 2)])
+
+    def test_encode_promoted_geoms(self):
+        import pandas as pd
+        from shapely.geometry import LinearRing, MultiLineString, Polygon, MultiPolygon
+        from shapely import wkb
+        square = Polygon([(0, 0), (1, 0), (1, 1), (0, 0)])
+        encoded = _encode_geom_column(pd.Series([square, MultiPolygon([square]), None]), 'MultiPolygon')
+        self.assertEqual([wkb.loads(geom, hex=True) if geom else None for geom in encoded],
+                         [MultiPolygon([square]), MultiPolygon([square]), None])
+
+        # rings are promoted like lines
+        ring = LinearRing([(0, 0), (1, 0), (1, 1)])
+        series = pd.Series([ring, MultiLineString([[(0, 0), (1, 1)]])])
+        geom_type = _get_geom_col_type(pd.DataFrame({'the_geom': series}))
+        self.assertEqual(geom_type, 'MultiLineString')
+        self.assertEqual([wkb.loads(geom, hex=True).geom_type for geom in _encode_geom_column(series, geom_type)],
+                         ['MultiLineString', 'MultiLineString'])
+
+    def test_create_table_query(self):
+        import pandas as pd
+        df = pd.DataFrame({'name': ['a', 'b'],
+                           'the_geom': ['POLYGON((0 0, 1 0, 1 1, 0 0))', 'MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)))']})
+        dataset = Dataset(FakeContext([]), 'areas', df=df)
+        self.assertEqual(dataset._create_table_query(),
+                         'CREATE TABLE areas (name text, the_geom geometry(MultiPolygon, 4326))')
+
+
+class TestBulkLoad(unittest.TestCase):
+    """Tests for loading tables deferring their cartodbfication"""
+    def test_bulk_load(self):
+        import pandas as pd
+        context = FakeContext([('CREATE TABLE', {'rows': []})])
+        with BulkLoad(context):
+            Dataset(context, 'stations', df=pd.DataFrame({'name': ['a']}))._create_table()
+            Dataset.create_from_query(context, 'SELECT * FROM stations', 'stations_copy')
+            self.assertEqual(len(context.batch_sql_client.jobs), 1)
+
+        self.assertEqual(context.sql_client.queries, [
+            'BEGIN; DROP TABLE IF EXISTS stations; '
+            'CREATE TABLE stations (name text, the_geom geometry(Geometry, 4326)); COMMIT;',
+        ])
+        self.assertEqual(context.batch_sql_client.jobs, [
+            # queries can take longer than the SQL API timeout
+            'BEGIN; DROP TABLE IF EXISTS stations_copy; '
+            'CREATE TABLE stations_copy AS (SELECT * FROM stations); COMMIT;',
+            "BEGIN; SELECT CDB_CartodbfyTable('public', 'stations'); "
+            "SELECT CDB_CartodbfyTable('public', 'stations_copy'); COMMIT;"
+        ])
+        self.assertIsNone(context._bulk_load)
+
+    def test_bulk_load_error(self):
+        context = FakeContext([('CREATE TABLE', {'rows': []})])
+        with self.assertRaises(ZeroDivisionError):
+            with BulkLoad(context):
+                Dataset.create_from_query(context, 'SELECT 1', 'ones')
+                1 / 0
+        self.assertEqual(context.batch_sql_client.jobs, [
+            'BEGIN; DROP TABLE IF EXISTS ones; CREATE TABLE ones AS (SELECT 1); COMMIT;'
+        ])
+
+
+class TestDatasetPostLoad(unittest.TestCase):
+    """Tests for indexing tables after loading them"""
+    def test_post_load_queries(self):
+        import pandas as pd
+        dataset = Dataset(FakeContext([]), 'stores', df=pd.DataFrame({'Store ID': [1], 'state': ['NY']}))
+        self.assertEqual(dataset._post_load_queries(), [])
+        self.assertEqual(dataset._post_load_queries(['Store ID', ['state', 'store_id']], 'geometry', True), [
+            'CREATE INDEX IF NOT EXISTS stores_store_id_idx ON stores USING btree (store_id)',
+            'CREATE INDEX IF NOT EXISTS stores_state_store_id_idx ON stores USING btree (state, store_id)',
+            'CREATE INDEX IF NOT EXISTS stores_the_geom_idx ON stores USING gist (the_geom)',
+            'CLUSTER stores USING stores_the_geom_idx',
+            'ANALYZE stores',
+        ])
+
+    def test_post_load_bulk_load(self):
+        context = FakeContext([('CREATE TABLE', {'rows': []})])
+        with BulkLoad(context):
+            dataset = Dataset.create_from_query(context, 'SELECT 1 AS id', 'ones')
+            dataset._post_load(indexes=['id'])
+            self.assertEqual(len(context.batch_sql_client.jobs), 1)
+        self.assertEqual(context.batch_sql_client.jobs[1:], [
+            "BEGIN; SELECT CDB_CartodbfyTable('public', 'ones'); COMMIT; "
+            "CREATE INDEX IF NOT EXISTS ones_id_idx ON ones USING btree (id);"
+        ])
+
+    def test_post_load_bulk_load_recreated(self):
+        context = FakeContext([('CREATE TABLE', {'rows': []})])
+        with BulkLoad(context):
+            dataset = Dataset.create_from_query(context, 'SELECT 1 AS id', 'ones')
+            dataset._post_load(indexes=['id'])
+            # the indexes of the dropped table are not created
+            dataset = Dataset.create_from_query(context, 'SELECT 1 AS one', 'ones')
+            dataset._post_load(analyze=True)
+        self.assertEqual(context.batch_sql_client.jobs[2:], [
+            "BEGIN; SELECT CDB_CartodbfyTable('public', 'ones'); COMMIT; ANALYZE ones;"
+        ])
@@ -0,0 +1,158 @@
+"""Unit tests for cartoframes.display"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+from cartoframes import Layer, QueryLayer
+from cartoframes.cache import StaticMapCache
+from cartoframes.display import (NotebookRenderer, RawRenderer, StreamRenderer, get_renderer)
+from cartoframes.mock_server import MockCartoServer
+
+try:
+    from IPython.display import HTML, Image
+except ImportError:
+    HTML = Image = None
+
+try:
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+class TestRenderers(unittest.TestCase):
+    """Tests for the renderers"""
+    def test_get_renderer(self):
+        self.assertIsInstance(get_renderer('raw'), RawRenderer)
+        self.assertIsInstance(get_renderer('notebook'), NotebookRenderer)
+        self.assertFalse(get_renderer('notebook', use_matplotlib=False).use_matplotlib)
+        stream = io.BytesIO()
+        self.assertIs(get_renderer(stream).stream, stream)
+        renderer = RawRenderer()
+        self.assertIs(get_renderer(renderer), renderer)
+        with self.assertRaises(ValueError):
+            get_renderer('svg')
+
+    def test_default_renderer(self):
+        self.assertIsInstance(get_renderer(), NotebookRenderer)
+
+    def test_raw(self):
+        self.assertEqual(RawRenderer().html('<p>map</p>'), '<p>map</p>')
+        self.assertEqual(RawRenderer().image(PNG, 'https://a/map.png', (10, 10)), PNG)
+
+    def test_stream(self):
+        stream = io.BytesIO()
+        renderer = StreamRenderer(stream)
+        self.assertEqual(renderer.html(u'<p>m\xe0p</p>'), 11)
+        self.assertEqual(renderer.image(PNG, None, (10, 10)), len(PNG))
+        self.assertEqual(stream.getvalue(), u'<p>m\xe0p</p>'.encode('utf-8') + PNG)
+
+    @unittest.skipIf(HTML is None, 'IPython is not installed')
+    def test_notebook(self):
+        renderer = NotebookRenderer(use_matplotlib=False)
+        self.assertIsInstance(renderer.html('<p>map</p>'), HTML)
+        image = renderer.image(PNG, 'https://a/map.png', (10, 10))
+        self.assertIsInstance(image, Image)
+        self.assertEqual(image.metadata['origin_url'], 'https://a/map.png')
+
+    @unittest.skipIf(plt is None, 'matplotlib is not installed')
+    def test_axes(self):
+        fig = plt.figure(figsize=(1, 1))
+        ax = fig.gca()
+        self.assertIs(NotebookRenderer().axes(ax, (72, 72)), ax)
+        png = RawRenderer().axes(ax, (72, 72))
+        self.assertTrue(png.startswith(PNG))
+        # the image is drawn from its data, not downloaded again
+        self.assertIsInstance(NotebookRenderer().image(png, 'https://a/map.png', (72, 72)), type(ax))
+        plt.close('all')
+
+
+class TestContextRenderers(unittest.TestCase):
+    """Tests for rendering maps against the mock server"""
+    def setUp(self):
+        self.server = MockCartoServer().start()
+        self.cc = self.server.context()
+        self.cc.write(pd.DataFrame({'name': ['a', 'b'], 'lng': [1, 3], 'lat': [2, 4]}), 'places',
+                      lnglat=('lng', 'lat'))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def count_static_maps(self):
+        return len([request for request in self.server.requests if request.path.endswith('.png')])
+
+    def test_interactive(self):
+        html = self.cc.map(Layer('places'), renderer='raw')
+        self.assertTrue(html.startswith('<iframe srcdoc='))
+
+        stream = io.BytesIO()
+        self.assertEqual(self.cc.map(Layer('places'), renderer=stream), len(stream.getvalue()))
+        self.assertTrue(stream.getvalue().startswith(b'<iframe srcdoc='))
+
+    def test_query_without_cartodb_id(self):
+        html = self.cc.map(QueryLayer('SELECT name, the_geom, the_geom_webmercator FROM places'), renderer='raw')
+        self.assertTrue(html.startswith('<iframe srcdoc='))
+
+    def test_static(self):
+        image = self.cc.map(Layer('places'), interactive=False, renderer='raw')
+        self.assertTrue(image.startswith(PNG))
+
+    @unittest.skipIf(plt is None, 'matplotlib is not installed')
+    def test_static_default(self):
+        ax = self.cc.map(Layer('places'), interactive=False)
+        self.assertTrue(hasattr(ax, 'figure'))
+        plt.close('all')
+
+    def test_static_cache_unknown_freshness(self):
+        # the mock server can't tell when the tables were updated
+        cache = StaticMapCache(self.directory)
+        for _ in range(2):
+            image = self.cc.map(Layer('places'), interactive=False, renderer='raw', cache=cache)
+            self.assertTrue(image.startswith(PNG))
+        self.assertEqual(self.count_static_maps(), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+        cache = StaticMapCache(self.directory, check_freshness=False)
+        for _ in range(2):
+            self.cc.map(Layer('places'), interactive=False, renderer='raw', cache=cache)
+        self.assertEqual(self.count_static_maps(), 3)
+
+
+class TestHeadless(unittest.TestCase):
+    """Tests for maps outside of IPython"""
+    def run_maps(self, *statements):
+        """Types of the maps of `statements` in a new interpreter, and
+        whether IPython was imported"""
+        output = subprocess.check_output([sys.executable, '-c', '\n'.join([
+            'import json, sys',
+            'import pandas as pd',
+            'from cartoframes import Layer',
+            'from cartoframes.mock_server import MockCartoServer',
+            'with MockCartoServer() as server:',
+            '    cc = server.context()',
+            '    cc.write(pd.DataFrame({"name": ["a"], "lng": [1], "lat": [2]}), "places", lnglat=("lng", "lat"))',
+            '    maps = [{}]'.format(', '.join(statements)),
+            'print(json.dumps([type(m).__name__ for m in maps] + ["IPython" in sys.modules]))',
+        ])])
+        return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    def test_raw(self):
+        self.assertEqual(self.run_maps('cc.map(Layer("places"), renderer="raw")',
+                                       'cc.map(Layer("places"), interactive=False, renderer="raw")'),
+                         ['str', 'bytes', False])
+
+    @unittest.skipIf(plt is None, 'matplotlib is not installed')
+    def test_default_static(self):
+        self.assertEqual(self.run_maps('cc.map(Layer("places"), interactive=False)'), ['Axes', False])
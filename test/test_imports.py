@@ -0,0 +1,43 @@
+"""Tests that the heavy optional dependencies are imported lazily"""
+import json
+import subprocess
+import sys
+import unittest
+
+# Modules only needed to render maps or handle geometries
+HEAVY_MODULES = ('IPython', 'matplotlib', 'jinja2', 'geopandas', 'shapely')
+
+
+def imported_modules(statement, modules):
+    """Which of `modules` are imported by `statement` in a new interpreter"""
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        '{statement}\nimport json, sys\nprint(json.dumps([m for m in {modules!r} if m in sys.modules]))'.format(
+            statement=statement, modules=list(modules))])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class TestImports(unittest.TestCase):
+    """Tests for lazy imports"""
+    @unittest.skipIf(sys.version_info < (3, 7), 'module __getattr__ requires Python 3.7')
+    def test_import_cartoframes(self):
+        self.assertEqual(imported_modules('import cartoframes', HEAVY_MODULES + ('pandas', 'carto')), [])
+
+    def test_import_context(self):
+        self.assertEqual(imported_modules('from cartoframes import CartoContext', HEAVY_MODULES), [])
+
+    def test_import_instrumentation(self):
+        # hooks can be written without the CARTO SDK, only the clients need it
+        self.assertEqual(imported_modules('import cartoframes.instrumentation, cartoframes.progress',
+                                          HEAVY_MODULES + ('carto', )), [])
+
+    def test_import_vector(self):
+        self.assertEqual(imported_modules('from cartoframes.contrib import vector', HEAVY_MODULES), [])
+
+    def test_lazy_names(self):
+        import cartoframes
+        from cartoframes.context import CartoContext
+        self.assertIs(cartoframes.CartoContext, CartoContext)
+        self.assertIn('Layer', dir(cartoframes))
+        with self.assertRaises(AttributeError):
+            cartoframes.Missing
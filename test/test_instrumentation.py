@@ -0,0 +1,164 @@
+"""Unit tests for cartoframes.instrumentation"""
+import unittest
+import warnings
+
+import pandas as pd
+
+from cartoframes.datasets import recursive_read
+from cartoframes.instrumentation import Hook, Instrumentation, Span, record_retry
+from cartoframes.mock_server import MockCartoServer
+
+try:
+    from shapely.geometry import Point
+except ImportError:
+    Point = None
+
+
+class RecordingHook(Hook):
+    """Hook keeping the started and ended spans"""
+    def __init__(self):
+        self.started = []
+        self.ended = []
+
+    def on_start(self, span):
+        self.started.append(span.name)
+
+    def on_end(self, span):
+        self.ended.append(span)
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for spans and hooks"""
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+        self.hook = self.instrumentation.add_hook(RecordingHook())
+
+    def test_span(self):
+        span = Span('sql', {'query': 'SELECT 1'})
+        span.add('rows', 2)
+        span.add('rows', 3)
+        span.end = span.start + 1.5
+        self.assertEqual(span.duration, 1.5)
+        self.assertEqual(span.to_dict()['rows'], 5)
+        self.assertEqual(span.to_dict()['query'], 'SELECT 1')
+
+    def test_nesting(self):
+        with self.instrumentation.span('write') as outer:
+            with self.instrumentation.span('copyfrom', rows=3) as inner:
+                self.assertIs(self.instrumentation.current_span(), inner)
+            self.assertIs(self.instrumentation.current_span(), outer)
+        self.assertIsNone(self.instrumentation.current_span())
+
+        self.assertEqual(self.hook.started, ['write', 'copyfrom'])
+        self.assertEqual([span.name for span in self.hook.ended], ['copyfrom', 'write'])
+        self.assertIs(inner.parent, outer)
+        self.assertEqual(inner.attributes['rows'], 3)
+        self.assertGreaterEqual(outer.duration, inner.duration)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with self.instrumentation.span('read'):
+                raise ValueError('boom')
+        self.assertIn('boom', self.hook.ended[0].error)
+
+    def test_failing_hook(self):
+        class FailingHook(Hook):
+            def on_start(self, span):
+                raise RuntimeError('start')
+
+            def on_end(self, span):
+                raise RuntimeError('end')
+
+            def on_progress(self, span, data):
+                raise RuntimeError('progress')
+
+        # the other hooks still get the spans
+        self.instrumentation.hooks.insert(0, FailingHook())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            with self.instrumentation.span('copyto') as span:
+                self.instrumentation.progress(span, b'data')
+                result = 'rows'
+            with self.assertRaises(ValueError):
+                with self.instrumentation.span('read'):
+                    raise ValueError('boom')
+        self.assertEqual(result, 'rows')
+        self.assertEqual(self.hook.started, ['copyto', 'read'])
+        self.assertIn('boom', self.hook.ended[1].error)
+        self.assertEqual(len(caught), 5)
+        self.assertIn('progress', str(caught[1].message))
+
+    def test_function_hook(self):
+        names = []
+        self.instrumentation.add_hook(lambda span: names.append(span.name))
+        with self.instrumentation.span('fetch'):
+            pass
+        self.instrumentation.remove_hook(self.hook)
+        self.instrumentation.remove_hook(names.append)
+        with self.instrumentation.span('query'):
+            pass
+        self.assertEqual(names, ['fetch', 'query'])
+        self.assertEqual(len(self.hook.ended), 1)
+
+    def test_record_retry(self):
+        context = type('Context', (object, ), {'instrumentation': self.instrumentation})()
+        record_retry(context, 2)
+        with self.instrumentation.span('copyto') as span:
+            record_retry(context, 2)
+            record_retry(context, 1)
+        self.assertEqual(span.attributes['retries'], 2)
+        self.assertEqual(span.attributes['rate_limit_wait'], 3)
+
+
+class TestContextInstrumentation(unittest.TestCase):
+    """Tests for the spans of CartoContext operations against the mock server"""
+    def setUp(self):
+        self.server = MockCartoServer().start()
+        self.spans = []
+        self.cc = self.server.context(hooks=[self.spans.append])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def find(self, name):
+        return [span for span in self.spans if span.name == name]
+
+    @unittest.skipIf(Point is None, 'shapely is not installed')
+    def test_write_read(self):
+        df = pd.DataFrame({'name': ['a', 'b'], 'geometry': [Point(1, 2), Point(3, 4)]})
+        self.cc.write(df, 'places')
+        write = self.find('write')[0]
+        copyfrom = self.find('copyfrom')[0]
+        self.assertIs(copyfrom.parent, write)
+        self.assertEqual(copyfrom.attributes['rows'], 2)
+        self.assertGreater(copyfrom.attributes['bytes_sent'], 0)
+        self.assertIn('server_time', copyfrom.attributes)
+        self.assertEqual(self.find('batch_job')[0].attributes['status'], 'done')
+        self.assertEqual(self.find('encode')[0].attributes['rows'], 2)
+
+        del self.spans[:]
+        self.cc.read('places', decode_geom=True)
+        read = self.find('read')[0]
+        copyto = self.find('copyto')[0]
+        self.assertIs(copyto.parent, read)
+        self.assertEqual(copyto.attributes['rows'], 2)
+        self.assertGreater(copyto.attributes['bytes_received'], 0)
+        apis = set(span.attributes['api'] for span in self.find('http'))
+        self.assertEqual(apis, set(['sql', 'copyto']))
+        self.assertTrue(all(span.attributes['status'] == 200 for span in self.find('http')))
+
+    def test_rate_limit(self):
+        self.server.rate_limit_every = 2
+        self.server.retry_after = 0
+        self.server.reset_stats()
+        self.cc.sql_client.send('SELECT 1 AS a')
+        with self.cc.instrumentation.span('copyto') as span:
+            recursive_read(self.cc, 'COPY (SELECT 1 AS a) TO stdout WITH (FORMAT csv, HEADER true)').read()
+        self.assertEqual(span.attributes['retries'], 1)
+        self.assertIn(429, [http.attributes['status'] for http in self.find('http')])
+
+    def test_remove_hook(self):
+        self.cc.remove_hook(self.spans.append)
+        del self.spans[:]
+        self.cc.sql_client.send('SELECT 1 AS a')
+        self.assertEqual(self.spans, [])
@@ -358,6 +358,48 @@ class TestQueryLayer(unittest.TestCase):
         }
         self.assertDictEqual(qlayer.size, ans)
 
+    def test_querylayer_pruned_query(self):
+        """layer.QueryLayer._setup only selects styled columns"""
+        qlayer = QueryLayer(self.query, color='seeds', size='weight',
+                            tooltip=['origin', 'seeds'])
+        qlayer.style_cols['seeds'] = 'number'
+        qlayer.style_cols['weight'] = 'number'
+        qlayer.query_columns = ['cartodb_id', 'the_geom', 'the_geom_webmercator', 'seeds', 'weight', 'origin',
+                                'notes']
+        qlayer.geom_type = 'point'
+        qlayer._setup([BaseMap(), qlayer], 1)  # pylint: disable=protected-access
+        self.assertEqual(
+            qlayer.query,
+            'SELECT cartodb_id, the_geom, the_geom_webmercator, seeds, '
+            'weight, origin FROM (select * from watermelon) AS _cf_pruned')
+        self.assertEqual(qlayer.orig_query, self.query)
+
+        # no styled columns
+        qlayer = QueryLayer(self.query, color='red')
+        qlayer.query_columns = ['cartodb_id', 'the_geom', 'the_geom_webmercator', 'notes']
+        qlayer.geom_type = 'polygon'
+        qlayer._setup([BaseMap(), qlayer], 1)  # pylint: disable=protected-access
+        self.assertEqual(
+            qlayer.query,
+            'SELECT cartodb_id, the_geom, the_geom_webmercator '
+            'FROM (select * from watermelon) AS _cf_pruned')
+
+        # only the columns of the query are selected
+        query = 'SELECT ST_Union(the_geom) AS the_geom, ST_Union(the_geom_webmercator) AS the_geom_webmercator FROM a'
+        qlayer = QueryLayer(query)
+        qlayer.query_columns = ['the_geom', 'the_geom_webmercator']
+        qlayer.geom_type = 'polygon'
+        qlayer._setup([BaseMap(), qlayer], 1)  # pylint: disable=protected-access
+        self.assertEqual(qlayer.query, 'SELECT the_geom, the_geom_webmercator FROM ({}) AS _cf_pruned'.format(query))
+
+        # queries with unknown columns or an order are left as they are
+        for query, columns in ((self.query, None), ('SELECT * FROM a ORDER BY area DESC', ['cartodb_id', 'area'])):
+            qlayer = QueryLayer(query)
+            qlayer.query_columns = columns
+            qlayer.geom_type = 'polygon'
+            qlayer._setup([BaseMap(), qlayer], 1)  # pylint: disable=protected-access
+            self.assertEqual(qlayer.query, query)
+
     def test_querylayer_get_cartocss(self):
         """layer.QueryLayer._get_cartocss"""
         qlayer = QueryLayer(self.query, size=dict(column='cold_brew', min=10,
@@ -0,0 +1,161 @@
+"""Unit tests for cartoframes.mock_server"""
+import json
+import shutil
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from carto.exceptions import CartoException, CartoRateLimitException
+
+from cartoframes.datasets import recursive_read
+from cartoframes.mock_server import MockCartoServer, MockDatabase, MockSQLError, split_statements
+
+try:
+    from shapely.geometry import Point
+except ImportError:
+    Point = None
+
+
+class TestMockDatabase(unittest.TestCase):
+    """Tests for the SQLite database of the mock server"""
+    def setUp(self):
+        self.database = MockDatabase()
+
+    def test_split_statements(self):
+        self.assertEqual(split_statements("BEGIN; SELECT ';' AS a; COMMIT;"),
+                         ['BEGIN', "SELECT ';' AS a", 'COMMIT'])
+
+    def test_cartodbfy_and_copy(self):
+        self.database.execute('BEGIN; DROP TABLE IF EXISTS t; CREATE TABLE t (name text, ok boolean); '
+                              "SELECT CDB_CartodbfyTable('public', 't'); COMMIT;")
+        self.assertEqual([name for name, _ in self.database.table_columns('t')],
+                         ['cartodb_id', 'the_geom', 'the_geom_webmercator', 'name', 'ok'])
+
+        count = self.database.copy_from("COPY t(name,ok) FROM stdin WITH (FORMAT csv, DELIMITER '|');",
+                                        iter(['a|True\n', '|False\n']))
+        self.assertEqual(count, 2)
+        self.assertEqual(self.database.copy_to('COPY (SELECT * FROM "public"."t") TO stdout WITH (FORMAT csv, '
+                                               'HEADER true)'),
+                         b'cartodb_id,the_geom,the_geom_webmercator,name,ok\n1,,,a,t\n2,,,,f\n')
+
+        fields, rows = self.database.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 't'")
+        self.assertIn({'column_name': 'ok', 'data_type': 'boolean'}, rows)
+        fields, rows = self.database.execute('SELECT * FROM t LIMIT 0')
+        self.assertEqual(fields['ok'], {'type': 'boolean', 'pgtype': 'bool'})
+        self.assertEqual(fields['the_geom'], {'type': 'geometry', 'pgtype': 'geometry'})
+
+    def test_errors(self):
+        with self.assertRaises(MockSQLError):
+            self.database.execute('SELECT * FROM missing')
+        with self.assertRaises(MockSQLError):
+            self.database.copy_to('COPY (SELECT * FROM missing) TO stdout')
+
+
+class TestMockCartoServer(unittest.TestCase):
+    """Tests for the mock CARTO server"""
+    def setUp(self):
+        self.server = MockCartoServer().start()
+        self.cc = self.server.context()
+
+    def tearDown(self):
+        self.server.stop()
+
+    @unittest.skipIf(Point is None, 'shapely is not installed')
+    def test_write_read(self):
+        df = pd.DataFrame({'name': ['a', 'b'], 'visits': [1, 2], 'ok': [True, False],
+                           'geometry': [Point(1, 2), Point(3, 4)]})
+        self.cc.write(df, 'places')
+
+        result = self.cc.read('places', decode_geom=True)
+        self.assertEqual(list(result['name']), ['a', 'b'])
+        self.assertEqual(list(result['ok']), [True, False])
+        self.assertEqual(result['geometry'][2].coords[0], (3, 4))
+
+        fetched = self.cc.fetch('SELECT name, ST_AsText(the_geom) AS wkt FROM places WHERE visits > 1')
+        self.assertEqual(fetched['wkt'][0], 'POINT (3 4)')
+        self.assertEqual([table.name for table in self.cc.tables()], ['places'])
+
+        self.cc._update_privacy('places', 'public')
+        self.assertEqual(self.cc._get_privacy('places'), 'public')
+        self.assertTrue(self.cc.delete('places'))
+        self.assertEqual(self.cc.tables(), [])
+
+    def test_batch_jobs(self):
+        self.cc.execute('CREATE TABLE t (a integer)')
+        self.assertEqual(self.server.database.tables(), ['t'])
+        with self.assertRaises(CartoException):
+            self.cc.execute('DROP TABLE missing')
+
+    def test_maps(self):
+        template = {'version': '0.0.1', 'name': 'my_map', 'layergroup': {'layers': []}}
+        resp = self.cc._auth_send('api/v1/map/named', 'POST', headers={'Content-Type': 'application/json'},
+                                  data=json.dumps(template))
+        self.assertEqual(resp, {'template_id': 'my_map'})
+        image = self.cc.auth_client.session.get(self.server.base_url + 'api/v1/map/static/named/my_map/40/20.png')
+        self.assertEqual(image.headers['Content-Type'], 'image/png')
+        self.assertTrue(image.content.startswith(b'\x89PNG'))
+
+    def wait_for_requests(self, count):
+        """Requests are logged once their response is sent"""
+        for _ in range(100):
+            if len(self.server.requests) >= count:
+                return
+            time.sleep(0.01)
+
+    def test_rate_limit(self):
+        self.server.rate_limit_every = 1
+        self.server.retry_after = 0
+        with self.assertRaises(CartoRateLimitException):
+            self.cc.sql_client.send('SELECT 1 AS a')
+
+        # the first request passes, the second one is rate limited and retried
+        self.server.rate_limit_every = 2
+        self.server.reset_stats()
+        self.cc.sql_client.send('SELECT 1 AS a')
+        stream = recursive_read(self.cc, 'COPY (SELECT 1 AS a) TO stdout WITH (FORMAT csv, HEADER true)')
+        self.assertEqual(stream.read(), b'a\n1\n')
+        self.wait_for_requests(3)
+        self.assertEqual(self.server.stats()['copyto']['requests'], 2)
+        self.assertEqual(self.server.stats()['copyto']['rate_limited'], 1)
+
+    def test_latency_and_bandwidth(self):
+        self.server.latency = {'sql': 0.2}
+        start = time.time()
+        self.cc.sql_client.send('SELECT 1 AS a')
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        self.server.bandwidth = 100000
+        count = len(self.server.requests)
+        start = time.time()
+        self.cc.copy_client.copyto_stream(
+            "COPY (SELECT zeroblob(25000) AS a) TO stdout WITH (FORMAT csv)").read()
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        self.wait_for_requests(count + 1)
+        self.assertGreater(self.server.stats()['copyto']['bytes_sent'], 50000)
+
+
+class TestMockCartoServerCache(unittest.TestCase):
+    """Tests for the static map cache against the mock server"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @unittest.skipIf(Point is None, 'shapely is not installed')
+    def test_static_map_cache(self):
+        from cartoframes import Layer
+        from cartoframes.cache import StaticMapCache
+
+        with MockCartoServer() as server:
+            cc = server.context()
+            cc.write(pd.DataFrame({'name': ['a', 'b'], 'geometry': [Point(1, 2), Point(3, 4)]}), 'places')
+            cache = StaticMapCache(self.directory, check_freshness=False)
+            for _ in range(3):
+                cc.map(Layer('places'), interactive=False, cache=cache)
+
+            maps_requests = [request.path for request in server.requests if request.api == 'maps']
+            self.assertEqual(len([path for path in maps_requests if path.endswith('.png')]), 1)
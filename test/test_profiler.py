@@ -0,0 +1,95 @@
+"""Unit tests for cartoframes.profiler"""
+import unittest
+
+import pandas as pd
+
+from cartoframes.instrumentation import Instrumentation, Span
+from cartoframes.mock_server import MockCartoServer
+from cartoframes.profiler import Profiler
+
+try:
+    from shapely.geometry import Point
+except ImportError:
+    Point = None
+
+
+class TestProfiler(unittest.TestCase):
+    """Tests for the breakdown of spans into stages"""
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+        self.profiler = self.instrumentation.add_hook(Profiler())
+
+    def test_write_breakdown(self):
+        write = Span('write')
+        schema = Span('schema', {'rows': 10}, parent=write)
+        copyfrom = Span('copyfrom', {'encode_time': 4, 'bytes_sent': 100, 'rows': 10, 'server_time': 5},
+                        parent=write)
+        http = Span('http', parent=copyfrom)
+        for span, start, end in ((schema, 0, 1), (copyfrom, 1, 11), (http, 1, 11), (write, 0, 20)):
+            span.start, span.end = start, end
+            self.profiler.on_end(span)
+
+        call = self.profiler.calls[0]
+        self.assertEqual(call.operation, 'write')
+        self.assertEqual(list(call.stages),
+                         ['schema_inference', 'row_encoding', 'network_send', 'server_copy', 'other'])
+        self.assertEqual(call.stages['row_encoding']['seconds'], 4)
+        self.assertEqual(call.stages['network_send']['seconds'], 6)
+        self.assertEqual(call.stages['network_send']['bytes'], 100)
+        self.assertEqual(call.stages['server_copy']['seconds'], 5)
+        # the server copy overlaps with the sending
+        self.assertEqual(call.stages['other']['seconds'], 9)
+
+        df = self.profiler.to_dataframe()
+        self.assertEqual(list(df.columns), ['call', 'operation', 'stage', 'seconds', 'percent', 'count', 'bytes',
+                                            'rows'])
+        self.assertEqual(df.set_index('stage')['percent']['network_send'], 30)
+        self.assertIn('network_send', self.profiler.report())
+
+    def test_read_breakdown(self):
+        with self.instrumentation.span('read'):
+            with self.instrumentation.span('copyto') as copyto:
+                copyto.attributes.update(network_time=0, rate_limit_wait=0, retries=0)
+        call = self.profiler.calls[0]
+        self.assertEqual(list(call.stages)[:2], ['network_receive', 'parsing'])
+        self.assertNotIn('rate_limit_wait', call.stages)
+
+    def test_empty(self):
+        self.assertEqual(len(self.profiler.to_dataframe()), 0)
+        self.assertEqual(self.profiler.report(), '')
+
+
+class TestContextProfile(unittest.TestCase):
+    """Tests for profiling CartoContext operations against the mock server"""
+    def setUp(self):
+        self.server = MockCartoServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    @unittest.skipIf(Point is None, 'shapely is not installed')
+    def test_profile(self):
+        cc = self.server.context()
+        df = pd.DataFrame({'name': ['a', 'b'], 'geometry': [Point(1, 2), Point(3, 4)]})
+        with cc.profile() as profiler:
+            cc.write(df, 'places')
+            cc.read('places', as_geodataframe=True)
+        cc.fetch('SELECT * FROM places')
+
+        self.assertEqual([call.operation for call in profiler.calls], ['write', 'read'])
+        write, read = profiler.calls
+        for stage in ('normalize_column_names', 'schema_inference', 'batch_jobs', 'row_encoding', 'network_send',
+                      'server_copy'):
+            self.assertIn(stage, write.stages)
+        self.assertEqual(write.stages['row_encoding']['rows'], 2)
+        # the column types and the geometry type
+        self.assertEqual(write.stages['schema_inference']['count'], 2)
+        for stage in ('sql_queries', 'network_receive', 'parsing', 'geometry_decoding'):
+            self.assertIn(stage, read.stages)
+        self.assertGreater(read.stages['network_receive']['bytes'], 0)
+
+    def test_profile_argument(self):
+        cc = self.server.context(profile=True)
+        cc.execute('CREATE TABLE t (a integer)')
+        self.assertEqual([call.operation for call in cc.profiler.calls], ['execute'])
+        self.assertIn('batch_jobs', cc.profiler.calls[0].stages)
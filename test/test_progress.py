@@ -0,0 +1,61 @@
+"""Unit tests for cartoframes.progress"""
+import unittest
+
+import pandas as pd
+
+from cartoframes.instrumentation import Instrumentation
+from cartoframes.mock_server import MockCartoServer
+from cartoframes.progress import Progress, ProgressHook
+
+
+class TestProgress(unittest.TestCase):
+    """Tests for the progress of transfers"""
+    def test_rates(self):
+        progress = Progress('copyfrom', 250, 2000000, 2.0, total_rows=1000)
+        self.assertEqual(progress.rows_per_second, 125)
+        self.assertEqual(progress.megabytes_per_second, 1)
+        self.assertEqual(progress.eta, 6)
+        self.assertIsNone(Progress('copyto', 250, 2000000, 2.0).eta)
+        self.assertEqual(Progress('copyto', 250, 2000000, 2.0, finished=True).eta, 0)
+        self.assertEqual(Progress('copyto', 0, 0, 0).rows_per_second, 0)
+
+    def test_hook(self):
+        reports = []
+        instrumentation = Instrumentation()
+        instrumentation.add_hook(ProgressHook(reports.append, interval=3600))
+        with instrumentation.span('copyfrom', total_rows=3) as span:
+            for row in (b'a|1\n', b'b|2\n', b'c|3\n'):
+                instrumentation.progress(span, row)
+            span.set('rows', 3)
+        with instrumentation.span('sql') as span:
+            instrumentation.progress(span, b'a\n')
+
+        # the first report, and the last one when the transfer ends
+        self.assertEqual([(report.rows, report.bytes, report.finished) for report in reports],
+                         [(1, 4, False), (3, 12, True)])
+        self.assertEqual(reports[0].total_rows, 3)
+
+    def test_download_rows(self):
+        reports = []
+        instrumentation = Instrumentation()
+        instrumentation.add_hook(ProgressHook(reports.append, interval=0))
+        with instrumentation.span('copyto') as span:
+            instrumentation.progress(span, b'a,b\n1,2\n')
+            instrumentation.progress(span, b'3,4\n')
+        self.assertEqual([report.rows for report in reports], [1, 2, 2])
+
+
+class TestContextProgress(unittest.TestCase):
+    """Tests for the progress of CartoContext transfers against the mock server"""
+    def test_callback(self):
+        reports = []
+        with MockCartoServer() as server:
+            cc = server.context(progress=reports.append)
+            cc.write(pd.DataFrame({'name': ['a', 'b', 'c']}), 'names')
+            cc.read('names')
+
+        finished = [report for report in reports if report.finished]
+        self.assertEqual([(report.operation, report.rows) for report in finished],
+                         [('copyfrom', 3), ('copyto', 3)])
+        self.assertEqual(finished[0].total_rows, 3)
+        self.assertGreater(finished[1].bytes, 0)
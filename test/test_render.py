@@ -0,0 +1,138 @@
+"""Unit tests for cartoframes.render"""
+import unittest
+
+import pandas as pd
+
+from cartoframes import render, styling
+from cartoframes.layer import BaseMap, QueryLayer
+
+try:
+    import matplotlib  # noqa
+    HAS_MATPLOTLIB = True
+except ImportError:
+    HAS_MATPLOTLIB = False
+
+try:
+    from shapely.geometry import Point, Polygon
+    HAS_SHAPELY = True
+except ImportError:
+    HAS_SHAPELY = False
+
+
+class FakeContext(object):
+    """Context returning canned data instead of querying CARTO"""
+    def __init__(self, data):
+        self.data = data
+        self.queries = []
+
+    def fetch(self, query, decode_geom=False):
+        self.queries.append(query)
+        return self.data
+
+
+class TestRender(unittest.TestCase):
+    """Tests for the local static map renderer"""
+    def test_get_extent(self):
+        """render.get_extent"""
+        # zoom 0 on a 256px image covers the whole world
+        west, south, east, north = render.get_extent((256, 256), zoom=0,
+                                                     lat=0, lng=0)
+        self.assertAlmostEqual(west, -render.MERCATOR_MAX)
+        self.assertAlmostEqual(north, render.MERCATOR_MAX)
+
+        # bounds are fitted keeping the image aspect ratio
+        west, south, east, north = render.get_extent(
+            (800, 400), bounds={'west': -10, 'south': -1,
+                                'east': 10, 'north': 1})
+        self.assertAlmostEqual((east - west) / (north - south), 2)
+        self.assertAlmostEqual(east, render.lnglat_to_mercator(10, 0)[0])
+
+        # a single point gets a minimum resolution
+        west, _, east, _ = render.get_extent(
+            (100, 100), bounds={'west': 1, 'south': 1, 'east': 1, 'north': 1})
+        self.assertAlmostEqual(east - west, 100 * render.MIN_RESOLUTION)
+
+    def test_get_breaks(self):
+        """render.get_breaks"""
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, None]
+        self.assertEqual(render.get_breaks(values, 2, styling.BinMethod.equal),
+                         [5.5, 10])
+        self.assertEqual(
+            render.get_breaks(values, 2, styling.BinMethod.quantiles),
+            [5.5, 10])
+        self.assertEqual(
+            render.get_breaks(values, 3, styling.BinMethod.headtails),
+            [5.5, 8, 10])
+        self.assertEqual(
+            render.get_breaks([1, 1, 2, 10, 11, 12, 30], 3,
+                              styling.BinMethod.jenks),
+            [2, 12, 30])
+        self.assertEqual(render.get_breaks(values, [8, 2], ''), [2, 8])
+
+    def test_classify(self):
+        """render.classify"""
+        classes, nclasses = render.classify(
+            pd.Series(['a', 'b', 'a', None, 'c', 'a', 'b']),
+            styling.vivid(3))
+        self.assertEqual(nclasses, 3)
+        self.assertEqual(list(classes), [0, 1, 0, -1, 2, 0, 1])
+
+        classes, nclasses = render.classify(pd.Series([1, 5, None, 10]),
+                                            styling.mint([2, 6, 10]))
+        self.assertEqual(nclasses, 3)
+        self.assertEqual(list(classes), [0, 1, -1, 2])
+
+    def test_get_render_query(self):
+        """render.get_render_query"""
+        layer = QueryLayer('select * from watermelon', color='seeds')
+        layer.style_cols['seeds'] = 'number'
+        layer.geom_type = 'point'
+        layer._setup([BaseMap(), layer], 1)
+        query = render.get_render_query(layer, (0, 1, 2, 3), 0.5)
+        self.assertIn('ST_SimplifyPreserveTopology(the_geom_webmercator, 0.5)',
+                      query)
+        self.assertIn('AS the_geom,\nseeds\nFROM', query)
+        self.assertIn('ST_MakeEnvelope(0, 1, 2, 3, 3857)', query)
+        self.assertIn(layer.query, query)
+
+    @unittest.skipIf(not (HAS_MATPLOTLIB and HAS_SHAPELY),
+                     'matplotlib and shapely are required')
+    def test_render_static(self):
+        """render.render_static"""
+        points = pd.DataFrame({
+            'seeds': [1, 5, None],
+            'geometry': [Point(0, 0), Point(10, 10), Point(20, 20)],
+        })
+        layer = QueryLayer('select * from watermelon',
+                           color={'column': 'seeds',
+                                  'scheme': styling.sunset(2)})
+        layer.style_cols['seeds'] = 'number'
+        layer.geom_type = 'point'
+        basemap = BaseMap('dark')
+        layer._setup([basemap, layer], 1)
+        context = FakeContext(points)
+
+        extent = (-50, -50, 50, 50)
+        ax = render.render_static(context, [basemap, layer], (100, 100),
+                                  extent)
+        self.assertEqual(len(context.queries), 1)
+        self.assertEqual(ax.get_xlim(), (-50, 50))
+        png = render.to_png(ax)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        markers = ax.collections[0]
+        colors = [tuple(c) for c in markers.get_facecolors()]
+        self.assertEqual(len(colors), 3)
+        # nulls get the null color
+        self.assertEqual(
+            colors[2],
+            matplotlib.colors.to_rgba(render.NULL_COLOR, layer.opacity))
+
+        polygons = pd.DataFrame({
+            'geometry': [Polygon([(0, 0), (0, 10), (10, 10), (0, 0)])],
+        })
+        layer = QueryLayer('select * from watermelon')
+        layer.geom_type = 'polygon'
+        layer._setup([basemap, layer], 1)
+        ax = render.render_static(FakeContext(polygons), [basemap, layer],
+                                  (100, 100), extent)
+        self.assertEqual(len(ax.collections[0].get_paths()), 1)
@@ -123,3 +123,23 @@ class TestColorScheme(unittest.TestCase):
         """styling.scheme"""
         self.assertEqual(styling.scheme('acadia', 27, 'jenks'),
                          dict(name='acadia', bins=27, bin_method='jenks'))
+
+    def test_get_scheme_colors(self):
+        """styling.get_scheme_colors"""
+        # quantitative schemes keep the extremes of the ramp
+        self.assertEqual(styling.get_scheme_colors(styling.sunset(7)),
+                         list(styling.SCHEME_COLORS['Sunset']))
+        self.assertEqual(styling.get_scheme_colors(styling.sunset(3)),
+                         ['#f3e79b', '#eb7f86', '#5c53a5'])
+        # qualitative schemes end with the "others" color
+        self.assertEqual(styling.get_scheme_colors(self.vivid),
+                         ['#E58606', '#5D69B1', '#52BCA3', '#A5AA99'])
+        # custom colors
+        self.assertEqual(
+            styling.get_scheme_colors(styling.custom(('#FFF', '#000'))),
+            ['#FFF', '#000'])
+        # explicit bins
+        self.assertEqual(
+            len(styling.get_scheme_colors(styling.mint([1, 2, 3, 4]))), 4)
+        with self.assertRaises(ValueError):
+            styling.get_scheme_colors(styling.scheme('acadia', 3))
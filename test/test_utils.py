@@ -127,9 +127,9 @@ class TestUtils(unittest.TestCase):
         from cartoframes.utils import dtypes2pg
         results = {
             'float64': 'numeric',
-            'int64': 'numeric',
+            'int64': 'bigint',
             'float32': 'numeric',
-            'int32': 'numeric',
+            'int32': 'integer',
             'object': 'text',
             'bool': 'boolean',
             'datetime64[ns]': 'timestamp',